@@ -0,0 +1,207 @@
+"""
+Batch generation for campaigns of many prompts (POST /batch).
+Identical prompts are generated once, intent and copy are requested for
+several prompts per LLM completion, image generation runs with bounded
+concurrency, and results stream back as NDJSON lines as items finish.
+"""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from typing import AsyncIterator, Awaitable, Callable, Dict, List, Tuple
+
+from cache import normalize_prompt
+
+BATCH_MAX_PROMPTS = int(os.getenv("BATCH_MAX_PROMPTS", "500"))
+BATCH_LLM_CHUNK = int(os.getenv("BATCH_LLM_CHUNK", "8"))
+# Completion budget per batched call and the share of it each prompt needs; chunks
+# are shrunk so a full JSON array always fits (a truncated one doesn't parse)
+BATCH_LLM_MAX_TOKENS = int(os.getenv("BATCH_LLM_MAX_TOKENS", "2000"))
+BATCH_INTENT_TOKENS = int(os.getenv("BATCH_INTENT_TOKENS", "160"))  # {"i", "intent", "prompt"} per item
+BATCH_COPY_TOKENS = int(os.getenv("BATCH_COPY_TOKENS", "40"))  # {"i", "tagline"} per item
+_ARRAY_OVERHEAD_TOKENS = 50
+BATCH_CONCURRENCY = int(os.getenv("BATCH_CONCURRENCY", "8"))
+
+
+def _extract_json_array(text: str) -> list:
+    start = text.find("[")
+    end = text.rfind("]") + 1
+    if start == -1 or end <= start:
+        raise ValueError("No JSON array in completion")
+    parsed = json.loads(text[start:end])
+    if not isinstance(parsed, list):
+        raise ValueError("Completion JSON is not an array")
+    return parsed
+
+
+def _by_index(items: list, n: int) -> Dict[int, dict]:
+    """Map 1-based `i` (or list position) -> object, ignoring junk entries."""
+    out = {}
+    for pos, item in enumerate(items):
+        if not isinstance(item, dict):
+            continue
+        try:
+            i = int(item.get("i", pos + 1))
+        except (TypeError, ValueError):
+            i = pos + 1
+        if 1 <= i <= n:
+            out[i] = item
+    return out
+
+
+def chunk_size(limit: int = BATCH_LLM_CHUNK, max_tokens: int = BATCH_LLM_MAX_TOKENS) -> int:
+    """Prompts per batched completion: BATCH_LLM_CHUNK, or fewer if their answers wouldn't fit max_tokens."""
+    per_item = max(BATCH_INTENT_TOKENS, BATCH_COPY_TOKENS)
+    return max(1, min(limit, (max_tokens - _ARRAY_OVERHEAD_TOKENS) // per_item))
+
+
+def _token_budget(per_item: int, n: int) -> int:
+    return min(_ARRAY_OVERHEAD_TOKENS + per_item * n, BATCH_LLM_MAX_TOKENS)
+
+
+class BatchRunner:
+    def __init__(
+        self,
+        generate_text: Callable[..., Awaitable[str]],
+        generate_images: Callable[[str, int], Awaitable[Tuple[List[str], str]]],
+        llm_available: Callable[[], bool],
+        default_copy: str,
+    ):
+        self.generate_text = generate_text
+        self.generate_images = generate_images
+        self.llm_available = llm_available
+        self.default_copy = default_copy
+
+    async def interpret_intents(self, messages: List[str]) -> Tuple[List[Tuple[str, str]], bool]:
+        """
+        One completion for several prompts; anything unparsed falls back to
+        ("creative", message). Returns (intents, whether the completion succeeded).
+        """
+        defaults = [("creative", m) for m in messages]
+        if not self.llm_available():
+            return defaults, False
+        listing = "\n".join(f"{i}. {json.dumps(m)}" for i, m in enumerate(messages, 1))
+        prompt = f"""
+You are an AI art director. For each numbered user request below, return a JSON array
+with one object per request, in order, with keys `i` (the number), `intent` and `prompt`.
+Requests:
+{listing}
+
+Respond with the JSON array only.
+"""
+        try:
+            text = await self.generate_text(
+                prompt, max_tokens=_token_budget(BATCH_INTENT_TOKENS, len(messages)), temperature=0.7
+            )
+            found = _by_index(_extract_json_array(text), len(messages))
+        except Exception as e:
+            logging.error(f"Batch intent completion failed: {e}")
+            return defaults, False
+        return [
+            (str(found[i].get("intent") or "creative"), str(found[i].get("prompt") or m)) if i in found else defaults[i - 1]
+            for i, m in enumerate(messages, 1)
+        ], True
+
+    async def generate_copies(self, items: List[Tuple[str, str]]) -> Tuple[List[str], bool]:
+        """Taglines for several (message, intent) pairs in one completion, and whether it succeeded."""
+        if not self.llm_available():
+            return [self.default_copy] * len(items), False
+        listing = "\n".join(f"{i}. Request: {json.dumps(m)} | Intent: {intent}" for i, (m, intent) in enumerate(items, 1))
+        prompt = (
+            "Create a short, poetic one-liner (max 15 words) for each numbered artwork below.\n"
+            f"{listing}\n"
+            "Respond with only a JSON array of objects with keys `i` and `tagline`."
+        )
+        try:
+            text = await self.generate_text(
+                prompt, max_tokens=_token_budget(BATCH_COPY_TOKENS, len(items)), temperature=0.8
+            )
+            found = _by_index(_extract_json_array(text), len(items))
+            ok = True
+        except Exception as e:
+            logging.error(f"Batch copy completion failed: {e}")
+            found, ok = {}, False
+        return [str(found.get(i, {}).get("tagline") or self.default_copy).strip() for i in range(1, len(items) + 1)], ok
+
+    async def run(self, prompts: List[str], num_images: int) -> AsyncIterator[dict]:
+        """
+        Yield one {"type": "item", ...} per input prompt as it finishes (duplicates
+        share a result), then a {"type": "summary", ...} with throughput.
+        """
+        started = time.perf_counter()
+        unique: List[str] = []
+        indices: Dict[str, List[int]] = {}
+        for index, prompt in enumerate(prompts):
+            key = normalize_prompt(prompt)
+            if key not in indices:
+                indices[key] = []
+                unique.append(prompt)
+            indices[key].append(index)
+
+        size = chunk_size()
+        chunks = [unique[i:i + size] for i in range(0, len(unique), size)]
+        completions = 0
+
+        async def intent_chunk(c: int) -> List[Tuple[str, str]]:
+            nonlocal completions
+            intents, ok = await self.interpret_intents(chunks[c])
+            completions += ok
+            return intents
+
+        intent_tasks = [asyncio.create_task(intent_chunk(c)) for c in range(len(chunks))]
+
+        async def copy_chunk(c: int) -> List[str]:
+            nonlocal completions
+            intents = await intent_tasks[c]
+            copies, ok = await self.generate_copies([(m, intent) for m, (intent, _) in zip(chunks[c], intents)])
+            completions += ok
+            return copies
+
+        copy_tasks = [asyncio.create_task(copy_chunk(c)) for c in range(len(chunks))]
+        semaphore = asyncio.Semaphore(max(1, BATCH_CONCURRENCY))
+
+        async def item(u: int) -> dict:
+            c, offset = divmod(u, size)
+            message = unique[u]
+            t0 = time.perf_counter()
+            try:
+                intent, enhanced = (await intent_tasks[c])[offset]
+                async with semaphore:
+                    images, model = await self.generate_images(enhanced, num_images)
+                copy_text = (await copy_tasks[c])[offset]
+                status = "placeholder" if "Placeholder" in model else "ok"
+                return {
+                    "message": message, "status": status, "intent_category": intent, "prompt": enhanced,
+                    "images": images, "copy": copy_text, "image_model": model,
+                    "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1),
+                }
+            except Exception as e:
+                logging.error(f"Batch item failed: {e}")
+                return {"message": message, "status": "error", "error": str(e)[:300],
+                        "elapsed_ms": round((time.perf_counter() - t0) * 1000, 1)}
+
+        counts = {"ok": 0, "placeholder": 0, "error": 0}
+        item_tasks = [asyncio.create_task(item(u)) for u in range(len(unique))]
+        try:
+            for next_done in asyncio.as_completed(item_tasks):
+                result = await next_done
+                dupes = indices[normalize_prompt(result["message"])]
+                for index in dupes:
+                    counts[result["status"]] += 1
+                    yield {"type": "item", "index": index, "deduplicated": index != dupes[0], **result, "message": prompts[index]}
+        finally:
+            for task in item_tasks + intent_tasks + copy_tasks:
+                task.cancel()
+
+        elapsed = time.perf_counter() - started
+        yield {
+            "type": "summary",
+            "total": len(prompts),
+            "unique": len(unique),
+            "llm_completions": completions,
+            **counts,
+            "elapsed_s": round(elapsed, 3),
+            "prompts_per_minute": round(len(prompts) / elapsed * 60, 1) if elapsed > 0 else None,
+        }
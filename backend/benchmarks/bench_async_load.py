@@ -0,0 +1,93 @@
+"""
+Load benchmark: concurrent /chat throughput against a slow local OpenRouter stub.
+
+Usage (from backend/):
+    python benchmarks/bench_async_load.py --concurrency 50 --delay 0.5
+
+With a blocking provider layer, N concurrent requests take ~N x the per-request
+upstream time; with the async layer they overlap and total time stays close to
+a single request's. A GET / probe runs alongside to show the loop stays responsive.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+from stub_upstream import free_port, serve_in_thread, stub_app
+
+
+async def run_load(base_url: str, concurrency: int, num_images: int) -> dict:
+    latencies = []
+    probe_latencies = []
+    done = asyncio.Event()
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        async def one(i: int):
+            t0 = time.perf_counter()
+            r = await client.post("/chat", json={"message": f"a red fox #{i}", "num_images": num_images})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+        async def probe():
+            while not done.is_set():
+                t0 = time.perf_counter()
+                await client.get("/")
+                probe_latencies.append(time.perf_counter() - t0)
+                await asyncio.sleep(0.05)
+
+        probe_task = asyncio.create_task(probe())
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(concurrency)))
+        wall = time.perf_counter() - t0
+        done.set()
+        await probe_task
+
+    return {
+        "wall_s": wall,
+        "throughput_rps": concurrency / wall,
+        "p50_s": statistics.median(latencies),
+        "max_s": max(latencies),
+        "probe_max_s": max(probe_latencies) if probe_latencies else 0.0,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--delay", type=float, default=0.5, help="stub upstream latency per call (s)")
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_app.state.delay = args.delay
+    serve_in_thread(stub_app, stub_port)
+
+    os.environ["OPENROUTER_API_KEY"] = "stub"
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    os.environ["HUGGINGFACE_API_KEY"] = ""
+    os.environ["REPLICATE_API_KEY"] = ""
+    import main as backend
+
+    app_port = free_port()
+    serve_in_thread(backend.app, app_port)
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    # chat mode = 1 upstream call; image mode = intent + images + copy = 3 calls
+    for label, num_images, calls in (("chat mode", 0, 1), ("image mode", 2, 3)):
+        res = asyncio.run(run_load(base_url, args.concurrency, num_images))
+        serial_s = args.concurrency * calls * args.delay
+        print(
+            f"{label:<11} n={args.concurrency:<4} wall={res['wall_s']:.2f}s "
+            f"rps={res['throughput_rps']:.1f} p50={res['p50_s']:.2f}s max={res['max_s']:.2f}s "
+            f"probe_max={res['probe_max_s'] * 1000:.0f}ms (blocking estimate {serial_s:.1f}s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
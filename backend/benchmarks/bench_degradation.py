@@ -0,0 +1,142 @@
+"""
+Load test for the degradation controller: p99 latency under saturation with and without it.
+
+Usage (from backend/):
+    python benchmarks/bench_degradation.py --requests 200 --concurrency 24 --target-p99 6
+
+The real app runs against fake providers with limited capacity (HF serves
+--hf-capacity calls at once, Replicate --replicate-capacity; the rest queue),
+so latency grows with load the way a saturated upstream does, and cheaper
+requests (fewer, smaller images, schnell models) really are cheaper. The
+same burst of /chat requests is sent with the controller off and on; each run
+reports p50/p95/p99, images per response and the tiers used (from the
+" [tier]" suffix on image_model). A calm phase afterwards checks that the
+controller climbs back to the full tier. Exits non-zero if the controlled
+p99 misses --target-p99.
+"""
+
+import argparse
+import asyncio
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+
+from bench_harness import percentile
+from fake_providers import FakeProviders
+from stub_upstream import free_port, serve_in_thread
+
+
+async def burst(base_url: str, requests: int, concurrency: int, num_images: int) -> dict:
+    latencies, tiers, images, errors = [], {}, 0, 0
+    semaphore = asyncio.Semaphore(concurrency)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+
+        async def one(i: int):
+            nonlocal images, errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/chat", json={"message": f"a lighthouse in a storm #{i}", "num_images": num_images})
+                    r.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - t0)
+                body = r.json()
+                model = body["image_model"]
+                tier = model[model.rindex("[") + 1:-1] if model.endswith("]") else "full"
+                tiers[tier] = tiers.get(tier, 0) + 1
+                images += len(body["images"])
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+    return {
+        "rps": round(len(latencies) / wall, 2),
+        "p50_s": round(percentile(latencies, 50), 2),
+        "p95_s": round(percentile(latencies, 95), 2),
+        "p99_s": round(percentile(latencies, 99), 2),
+        "images_per_response": round(images / len(latencies), 2) if latencies else 0,
+        "tiers": tiers,
+        "errors": errors,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=24)
+    parser.add_argument("--num-images", type=int, default=2)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier for all fake latencies")
+    parser.add_argument("--hf-capacity", type=int, default=4)
+    parser.add_argument("--replicate-capacity", type=int, default=2)
+    parser.add_argument("--target-p99", type=float, default=6.0, help="seconds")
+    parser.add_argument("--max-inflight", type=int, default=6, help="DEGRADE_MAX_INFLIGHT for the run")
+    parser.add_argument("--cooldown", type=float, default=2.0, help="DEGRADE_COOLDOWN for the run")
+    args = parser.parse_args()
+
+    fakes = FakeProviders({"hf_text_to_image": {"capacity": args.hf_capacity},
+                           "replicate_run": {"capacity": args.replicate_capacity}}, scale=args.time_scale)
+    fake_port = free_port()
+    serve_in_thread(fakes.openrouter_app, fake_port)
+    os.environ.update({
+        "OPENROUTER_API_KEY": "fake",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{fake_port}",
+        "HUGGINGFACE_API_KEY": "fake",
+        "REPLICATE_API_KEY": "fake",
+        "UPSTREAM_TIMEOUT": str(fakes.profiles["openrouter_chat"].timeout_s * 0.8),
+        "IMAGE_STORE_DIR": tempfile.mkdtemp(prefix="vizzy-degrade-"),
+        "LLM_CACHE_ENABLED": "false",
+        "IMAGE_CACHE_ENABLED": "false",
+        "SIMILARITY_REUSE_ENABLED": "false",
+        "DEGRADE_MAX_INFLIGHT": str(args.max_inflight),
+        "DEGRADE_LATENCY_TARGET": str(args.target_p99 * 0.5),
+        "DEGRADE_WINDOW": "10",
+        "DEGRADE_COOLDOWN": str(args.cooldown),
+    })
+    import logging
+    import main as backend
+    from degradation import LoadController
+    logging.getLogger().setLevel(logging.ERROR)
+
+    backend.HAS_REPLICATE = True
+    backend.provider_clients.set("huggingface", fakes.hf_client)
+    backend.provider_clients.set("replicate", fakes.replicate)
+    app_port = free_port()
+    serve_in_thread(backend.app, app_port)
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    print(f"{args.requests} requests at concurrency {args.concurrency}; HF capacity {args.hf_capacity}, "
+          f"Replicate capacity {args.replicate_capacity}; target p99 {args.target_p99}s")
+    print(f"{'controller':<11} {'rps':>6} {'p50 s':>7} {'p95 s':>7} {'p99 s':>7} {'img/resp':>9} {'err':>4}  tiers")
+    results = {}
+    for label, enabled in (("off", False), ("on", True)):
+        backend.degrader = LoadController(queue_depth=lambda: backend.job_queue.depth, enabled=enabled)
+        backend.provider_health = type(backend.provider_health)()
+        res = results[label] = asyncio.run(burst(base_url, args.requests, args.concurrency, args.num_images))
+        print(f"{label:<11} {res['rps']:>6} {res['p50_s']:>7} {res['p95_s']:>7} {res['p99_s']:>7} "
+              f"{res['images_per_response']:>9} {res['errors']:>4}  {res['tiers']}")
+
+    # Calm phase: one request at a time until the controller is back at full quality
+    deadline = time.monotonic() + args.cooldown * 10 + 30
+    calm = 0
+    while backend.degrader.level > 0 and time.monotonic() < deadline:
+        asyncio.run(burst(base_url, 1, 1, args.num_images))
+        calm += 1
+        time.sleep(args.cooldown / 4)
+    stats = backend.degrader.stats()
+    print(f"\nafter {calm} calm requests: tier {stats['tier']}, {stats['transitions']} transitions, "
+          f"selected {stats['selected']}")
+    ok = results["on"]["p99_s"] <= args.target_p99 and stats["tier"] == "full"
+    print("PASS" if ok else "FAIL", f"(controlled p99 {results['on']['p99_s']}s vs target {args.target_p99}s)")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
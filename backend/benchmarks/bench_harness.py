@@ -0,0 +1,205 @@
+"""
+Offline end-to-end benchmark: the real app against fake OpenRouter / HF / Replicate.
+
+Usage (from backend/):
+    python benchmarks/bench_harness.py --scenarios chat,refine,chat_mode \\
+        --concurrency 16 --requests 200 --time-scale 0.1 --out bench.json
+    python benchmarks/bench_harness.py --out new.json --compare bench.json
+
+Provider latency / error rates / payload sizes come from fake_providers.DEFAULT_PROFILES,
+overridden per provider by --profile profile.json. --time-scale multiplies every
+fake latency so a run can be quick while keeping the distribution's shape.
+Reports p50/p95/p99 latency, throughput, error count and RSS per scenario and
+writes everything (plus the git commit) to JSON for comparing between commits.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+from fake_providers import FakeProviders
+from stub_upstream import free_port, serve_in_thread
+
+SCENARIOS = ("chat", "refine", "chat_mode")
+
+
+def percentile(values: list, q: float) -> float:
+    ordered = sorted(values)
+    if not ordered:
+        return 0.0
+    index = min(len(ordered) - 1, max(0, round(q / 100 * len(ordered) + 0.5) - 1))
+    return ordered[index]
+
+
+async def run_scenario(base_url: str, scenario: str, requests: int, concurrency: int, num_images: int) -> dict:
+    import metrics
+
+    latencies = []
+    errors = 0
+    placeholders = 0
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=httpx.Limits(max_connections=concurrency * 2)) as client:
+        session_ids = []
+        if scenario == "refine":
+            # One seed conversation per worker slot, refined repeatedly
+            for i in range(concurrency):
+                r = await client.post("/chat", json={"message": f"a seed scene #{i}", "num_images": num_images})
+                session_ids.append(r.json()["session_id"])
+
+        async def one(i: int):
+            nonlocal errors, placeholders
+            if scenario == "chat":
+                path, body = "/chat", {"message": f"a lighthouse in a storm #{i}", "num_images": num_images}
+            elif scenario == "chat_mode":
+                path, body = "/chat", {"message": f"what colours suit a storm #{i}?", "num_images": 0}
+            else:
+                path, body = "/refine", {
+                    "session_id": session_ids[i % len(session_ids)], "message": f"the seed scene #{i}",
+                    "refinement": "more dramatic lighting", "num_images": num_images,
+                }
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post(path, json=body)
+                    r.raise_for_status()
+                    if "Placeholder" in r.json().get("image_model", ""):
+                        placeholders += 1
+                except Exception:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - t0)
+
+        rss_before = metrics.rss_bytes()
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+
+    return {
+        "requests": requests,
+        "concurrency": concurrency,
+        "errors": errors,
+        "placeholders": placeholders,
+        "wall_s": round(wall, 3),
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "p99_ms": round(percentile(latencies, 99) * 1000, 1),
+        "max_ms": round(max(latencies, default=0) * 1000, 1),
+        "rss_before_mb": round(rss_before / 2**20, 1),
+        "rss_after_mb": round(metrics.rss_bytes() / 2**20, 1),
+    }
+
+
+def git_commit() -> str:
+    try:
+        out = subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True)
+        return out.stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def compare(current: dict, baseline: dict) -> None:
+    print(f"\nvs {baseline.get('commit', '?')}:")
+    for name, now in current["scenarios"].items():
+        before = baseline.get("scenarios", {}).get(name)
+        if not before:
+            continue
+        deltas = []
+        for key in ("p50_ms", "p95_ms", "p99_ms", "throughput_rps"):
+            if before.get(key):
+                deltas.append(f"{key} {(now[key] - before[key]) / before[key] * 100:+.1f}%")
+        print(f"  {name:<10} " + "  ".join(deltas))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--scenarios", default=",".join(SCENARIOS))
+    parser.add_argument("--requests", type=int, default=100)
+    parser.add_argument("--concurrency", type=int, default=16)
+    parser.add_argument("--num-images", type=int, default=2)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier for all fake latencies")
+    parser.add_argument("--profile", help="JSON file overriding fake_providers.DEFAULT_PROFILES")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--cache", action="store_true", help="keep the LLM/image caches and similarity reuse enabled")
+    parser.add_argument("--out", help="write results JSON here")
+    parser.add_argument("--compare", help="baseline results JSON to diff against")
+    args = parser.parse_args()
+
+    scenarios = [s.strip() for s in args.scenarios.split(",") if s.strip()]
+    unknown = set(scenarios) - set(SCENARIOS)
+    if unknown:
+        parser.error(f"unknown scenarios: {', '.join(sorted(unknown))}")
+    overrides = {}
+    if args.profile:
+        with open(args.profile) as f:
+            overrides = json.load(f)
+
+    fakes = FakeProviders(overrides, scale=args.time_scale, seed=args.seed)
+    fake_port = free_port()
+    serve_in_thread(fakes.openrouter_app, fake_port)
+
+    os.environ["OPENROUTER_API_KEY"] = "fake"
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{fake_port}"
+    os.environ["HUGGINGFACE_API_KEY"] = "fake"
+    os.environ["REPLICATE_API_KEY"] = "fake"
+    # Fake "timeout" faults sleep timeout_s; give up on them a bit earlier like a real client would
+    os.environ["UPSTREAM_TIMEOUT"] = str(fakes.profiles["openrouter_chat"].timeout_s * 0.8)
+    os.environ.setdefault("IMAGE_STORE_DIR", tempfile.mkdtemp(prefix="vizzy-bench-"))
+    # Fake latencies don't grow with load, so degrading would only cut output (see bench_degradation.py)
+    os.environ.setdefault("DEGRADE_ENABLED", "false")
+    if not args.cache:
+        os.environ["LLM_CACHE_ENABLED"] = "false"
+        os.environ["IMAGE_CACHE_ENABLED"] = "false"
+        # The fake LLM answers every intent with the same prompt, which would all be reuse hits
+        os.environ["SIMILARITY_REUSE_ENABLED"] = "false"
+    import logging
+    import main as backend
+    logging.getLogger().setLevel(logging.ERROR)
+
+    backend.HAS_REPLICATE = True
+    backend.provider_clients.set("huggingface", fakes.hf_client)
+    backend.provider_clients.set("replicate", fakes.replicate)
+
+    app_port = free_port()
+    serve_in_thread(backend.app, app_port)
+    base_url = f"http://127.0.0.1:{app_port}"
+
+    results = {
+        "commit": git_commit(),
+        "timestamp": time.time(),
+        "config": {k: v for k, v in vars(args).items() if k not in ("out", "compare")},
+        "profiles": {name: {"latency": f"{p.latency.kind}:{':'.join(map(str, p.latency.params))}", "errors": p.errors,
+                            "timeout_s": p.timeout_s, "payload": p.payload} for name, p in fakes.profiles.items()},
+        "scenarios": {},
+    }
+    print(f"{'scenario':<10} {'rps':>7} {'p50':>8} {'p95':>8} {'p99':>8} {'err':>4} {'ph':>4} {'rss MB':>7}")
+    for scenario in scenarios:
+        res = asyncio.run(run_scenario(base_url, scenario, args.requests, args.concurrency, args.num_images))
+        results["scenarios"][scenario] = res
+        print(
+            f"{scenario:<10} {res['throughput_rps']:>7} {res['p50_ms']:>8} {res['p95_ms']:>8} {res['p99_ms']:>8} "
+            f"{res['errors']:>4} {res['placeholders']:>4} {res['rss_after_mb']:>7}"
+        )
+    results["fake_providers"] = fakes.stats()
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.out}")
+    if args.compare:
+        with open(args.compare) as f:
+            compare(results, json.load(f))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Per-turn /chat latency as a session grows (10/100/1000 turns).
+
+Usage (from backend/):
+    python benchmarks/bench_history.py --turns 10 100 1000
+
+Runs chat mode with no provider keys, so each turn is dominated by session
+bookkeeping and response serialization. For comparison it also times the old
+approach of rebuilding and serializing the full history at the same depth.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+
+def legacy_replay_cost(main, turns: int, repeats: int = 20) -> float:
+    """Seconds per turn to rebuild + serialize `2 * turns` messages the old way."""
+    dumped = [
+        main.ChatMessage(role=role, content=f"message {i}", images=["/images/x.png"] if role == "assistant" else None).model_dump()
+        for i in range(turns)
+        for role in ("user", "assistant")
+    ]
+    t0 = time.perf_counter()
+    for _ in range(repeats):
+        history = [main.ChatMessage(**m) for m in dumped]
+        [m.model_dump() for m in history]
+    return (time.perf_counter() - t0) / repeats
+
+
+async def run_session(main, turns: int, window: int = 10) -> float:
+    """Mean latency of the last `window` turns of a `turns`-long session."""
+    transport = httpx.ASGITransport(app=main.app)
+    latencies = []
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        session_id = f"bench-{turns}"
+        for i in range(turns):
+            t0 = time.perf_counter()
+            r = await client.post("/chat", json={"session_id": session_id, "message": f"turn {i}", "num_images": 0})
+            r.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+    return statistics.mean(latencies[-window:])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--turns", type=int, nargs="+", default=[10, 100, 1000])
+    args = parser.parse_args()
+
+    os.environ["OPENROUTER_API_KEY"] = ""
+    os.environ["HUGGINGFACE_API_KEY"] = ""
+    os.environ["REPLICATE_API_KEY"] = ""
+    import main as backend
+    logging.getLogger().setLevel(logging.ERROR)
+
+    print(f"{'turns':>6} {'per-turn (ms)':>14} {'legacy replay (ms)':>19}")
+    for turns in args.turns:
+        per_turn = asyncio.run(run_session(backend, turns))
+        legacy = legacy_replay_cost(backend, turns)
+        print(f"{turns:>6} {per_turn * 1000:>14.2f} {(per_turn + legacy) * 1000:>19.2f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,80 @@
+"""
+Encode-throughput benchmark for image_variants.render_variant.
+
+Usage (from backend/):
+    python benchmarks/bench_image_encode.py --images 24 --source-size 1024 --workers 1,2,4
+
+Writes --images synthetic PNG sources (noise over a gradient, roughly as hard
+to compress as generated art) to a temp dir, then encodes every source at each
+configured thumbnail width in each supported format, first in-process and then
+through a ProcessPoolExecutor per worker count. Reports images/s, images/s per
+core used and the average output size, so format / quality / pool settings can
+be compared on the deployment's hardware.
+"""
+
+import argparse
+import concurrent.futures
+import os
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from PIL import Image
+
+import image_variants
+
+
+def make_sources(directory: str, count: int, size: int) -> list:
+    paths = []
+    for i in range(count):
+        gradient = Image.linear_gradient("L").resize((size, size)).convert("RGB")
+        noise = Image.frombytes("RGB", (size, size), os.urandom(size * size * 3))
+        path = os.path.join(directory, f"source{i}.png")
+        Image.blend(gradient, noise, 0.3).save(path)
+        paths.append(path)
+    return paths
+
+
+def run(paths: list, width: int, fmt: str, quality: int, workers: int) -> tuple:
+    args = [(p, width, fmt, quality) for p in paths]
+    t0 = time.perf_counter()
+    if workers == 0:
+        sizes = [len(image_variants.render_variant(*a)) for a in args]
+    else:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+            # Warm the workers so pool start-up isn't counted
+            list(pool.map(image_variants.render_variant, *zip(*args[:workers])))
+            t0 = time.perf_counter()
+            sizes = [len(b) for b in pool.map(image_variants.render_variant, *zip(*args))]
+    return time.perf_counter() - t0, sum(sizes) / len(sizes)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--images", type=int, default=24)
+    parser.add_argument("--source-size", type=int, default=1024)
+    parser.add_argument("--quality", type=int, default=image_variants.IMAGE_VARIANT_QUALITY)
+    parser.add_argument("--workers", default="1,2,4", help="pool sizes to try (0 = in-process only)")
+    args = parser.parse_args()
+
+    workers = [0] + sorted({int(w) for w in args.workers.split(",") if w.strip() and int(w) > 0})
+    formats = image_variants.supported_formats()
+    print(f"{os.cpu_count()} CPU(s), formats {', '.join(formats)}, {args.images} sources of {args.source_size}px")
+    print(f"{'format':<6} {'width':>6} {'workers':>8} {'img/s':>8} {'img/s/core':>11} {'avg KB':>8}")
+
+    with tempfile.TemporaryDirectory(prefix="vizzy-encode-") as directory:
+        paths = make_sources(directory, args.images, args.source_size)
+        for fmt in formats:
+            for width in image_variants.IMAGE_THUMBNAIL_SIZES:
+                for n in workers:
+                    elapsed, avg_size = run(paths, width, fmt, args.quality, n)
+                    rate = len(paths) / elapsed
+                    cores = min(max(n, 1), os.cpu_count() or 1)
+                    label = "inproc" if n == 0 else str(n)
+                    print(f"{fmt:<6} {width:>6} {label:>8} {rate:>8.1f} {rate / cores:>11.1f} {avg_size / 1024:>8.1f}")
+
+
+if __name__ == "__main__":
+    main()
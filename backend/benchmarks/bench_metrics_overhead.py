@@ -0,0 +1,102 @@
+"""
+Cost of tracing/metrics: span() microbenchmark plus /chat per-request latency
+with METRICS_ENABLED on vs off, against the zero-latency OpenRouter stub.
+
+Usage (from backend/):
+    python benchmarks/bench_metrics_overhead.py --requests 300
+
+Each mode runs in its own subprocess, since METRICS_ENABLED is read at import.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+
+def bench_spans(n: int) -> float:
+    """Mean microseconds per span() with a trace active."""
+    import metrics
+    metrics.start_trace("bench")
+    t0 = time.perf_counter()
+    for i in range(n):
+        if i % 1000 == 0:
+            metrics.start_trace("bench")  # keep the trace's span list bounded
+        with metrics.span("bench", provider="stub", model="m"):
+            pass
+    return (time.perf_counter() - t0) / n * 1e6
+
+
+def bench_requests(n: int) -> dict:
+    """Run in a child process: /chat latency through the full app + middleware."""
+    from stub_upstream import free_port, serve_in_thread, stub_app
+
+    stub_port = free_port()
+    stub_app.state.delay = 0
+    serve_in_thread(stub_app, stub_port)
+    os.environ["OPENROUTER_API_KEY"] = "stub"
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    os.environ["HUGGINGFACE_API_KEY"] = ""
+    os.environ["REPLICATE_API_KEY"] = ""
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["IMAGE_CACHE_ENABLED"] = "false"
+    import logging
+    import main as backend
+    logging.getLogger().setLevel(logging.ERROR)
+    from fastapi.testclient import TestClient
+
+    with TestClient(backend.app) as client:
+        for i in range(20):  # warm-up
+            client.post("/chat", json={"message": f"warm {i}", "num_images": 1})
+        latencies = []
+        for i in range(n):
+            t0 = time.perf_counter()
+            client.post("/chat", json={"message": f"a quiet harbour #{i}", "num_images": 1}).raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+        scrape_t0 = time.perf_counter()
+        body = client.get("/metrics").text
+        scrape_ms = (time.perf_counter() - scrape_t0) * 1000
+    return {
+        "median_ms": statistics.median(latencies) * 1000,
+        "mean_ms": statistics.fmean(latencies) * 1000,
+        "scrape_ms": scrape_ms,
+        "metric_lines": body.count("\n"),
+    }
+
+
+def run_child(enabled: bool, n: int) -> dict:
+    env = {**os.environ, "METRICS_ENABLED": "true" if enabled else "false"}
+    out = subprocess.run(
+        [sys.executable, __file__, "--child", "--requests", str(n)],
+        env=env, capture_output=True, text=True, check=True,
+    )
+    return json.loads(out.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--requests", type=int, default=300)
+    parser.add_argument("--spans", type=int, default=200_000)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        print(json.dumps(bench_requests(args.requests)))
+        return
+
+    print(f"span() with active trace: {bench_spans(args.spans):6.2f} us/span")
+    off = run_child(False, args.requests)
+    on = run_child(True, args.requests)
+    print(f"/chat median  metrics off: {off['median_ms']:7.2f} ms   on: {on['median_ms']:7.2f} ms")
+    print(f"/chat mean    metrics off: {off['mean_ms']:7.2f} ms   on: {on['mean_ms']:7.2f} ms")
+    print(f"overhead per request (median): {on['median_ms'] - off['median_ms']:+.3f} ms")
+    print(f"GET /metrics scrape: {on['scrape_ms']:.2f} ms for {on['metric_lines']} lines")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,91 @@
+"""
+Placeholder generation microbenchmark.
+
+Usage (from backend/):
+    python benchmarks/bench_placeholders.py --prompts 2000 --num-images 4
+
+Times placeholders.generate for single calls and generate_many for a batch,
+cold (memo cleared, distinct prompts) and warm (same prompts again), for SVG
+and PNG output, next to the previous implementation (global random.seed plus
+per-call SVG build) as a baseline. Also checks output is deterministic when
+generated from several threads at once.
+"""
+
+import argparse
+import hashlib
+import os
+import random
+import sys
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import placeholders
+
+
+def legacy(num_images: int, seed_prompt: str) -> list:
+    """The pre-placeholders.py implementation, kept here only for comparison."""
+    hash_val = hashlib.md5(seed_prompt.encode()).hexdigest()
+    random.seed(hash_val)
+    images = []
+    for i in range(num_images):
+        hue = (int(hash_val, 16) + i * 120) % 360
+        color = f"hsl({hue}, {random.randint(60, 100)}%, {random.randint(50, 80)}%)"
+        svg = (
+            f"<svg xmlns='http://www.w3.org/2000/svg' width='512' height='512' viewBox='0 0 512 512'>"
+            f"<rect width='100%' height='100%' fill='{color}'/>"
+            f"<text x='50%' y='50%' font-size='24' fill='white' text-anchor='middle' dominant-baseline='middle'>"
+            f"Placeholder {i+1}</text></svg>"
+        )
+        images.append("data:image/svg+xml;charset=utf-8," + urllib.parse.quote(svg))
+    return images
+
+
+def clear() -> None:
+    placeholders._render.cache_clear()
+    placeholders.palette.cache_clear()
+
+
+def timed(fn, prompts: list) -> float:
+    t0 = time.perf_counter()
+    fn(prompts)
+    return (time.perf_counter() - t0) / len(prompts) * 1e6
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--prompts", type=int, default=2000)
+    parser.add_argument("--num-images", type=int, default=4)
+    args = parser.parse_args()
+
+    n = args.num_images
+    # Batch sizes are bounded by the memo so the warm pass measures hits
+    prompts = [f"a lighthouse in a storm, variation {i}" for i in range(min(args.prompts, placeholders.PLACEHOLDER_CACHE_ENTRIES))]
+    print(f"{len(prompts)} prompts x {n} images, us per prompt")
+    print(f"{'case':<22} {'cold':>9} {'warm':>9}")
+
+    def row(label: str, fn) -> None:
+        clear()
+        cold = timed(fn, prompts)
+        warm = timed(fn, prompts)
+        print(f"{label:<22} {cold:>9.1f} {warm:>9.1f}")
+
+    row("legacy svg", lambda ps: [legacy(n, p) for p in ps])
+    for fmt in ("svg", "png"):
+        row(f"single {fmt}", lambda ps, fmt=fmt: [placeholders.generate(p, n, fmt) for p in ps])
+        row(f"batch {fmt}", lambda ps, fmt=fmt: placeholders.generate_many(ps, n, fmt))
+
+    clear()
+    expected = {p: placeholders.generate(p, n) for p in prompts[:200]}
+    clear()
+    with ThreadPoolExecutor(max_workers=8) as pool:
+        results = list(pool.map(lambda p: (p, placeholders.generate(p, n)), prompts[:200] * 4))
+    mismatches = sum(1 for p, images in results if images != expected[p])
+    print(f"threaded determinism: {len(results)} calls, {mismatches} mismatches")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
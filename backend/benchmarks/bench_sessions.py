@@ -0,0 +1,93 @@
+"""
+Session store load test: many concurrent sessions through /chat.
+
+Usage (from backend/):
+    python benchmarks/bench_sessions.py --sessions 2000 --turns 3 --concurrency 200
+    python benchmarks/bench_sessions.py --backend sqlite --max-sessions 500
+
+Runs chat mode with no provider keys so the store is the only real work, then
+reports throughput, latency percentiles and the store's own accounting.
+"""
+
+import argparse
+import asyncio
+import logging
+import os
+import statistics
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+
+def percentile(values, q):
+    values = sorted(values)
+    return values[min(len(values) - 1, int(q * len(values)))]
+
+
+async def run(main, sessions: int, turns: int, concurrency: int) -> dict:
+    transport = httpx.ASGITransport(app=main.app)
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def session(n: int):
+            for turn in range(turns):
+                async with semaphore:
+                    t0 = time.perf_counter()
+                    r = await client.post(
+                        "/chat", json={"session_id": f"s{n}", "message": f"turn {turn} " + "x" * 200, "num_images": 0}
+                    )
+                    r.raise_for_status()
+                    latencies.append(time.perf_counter() - t0)
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(session(n) for n in range(sessions)))
+        wall = time.perf_counter() - t0
+
+    return {
+        "requests": len(latencies),
+        "wall_s": wall,
+        "rps": len(latencies) / wall,
+        "p50_ms": statistics.median(latencies) * 1000,
+        "p95_ms": percentile(latencies, 0.95) * 1000,
+        "p99_ms": percentile(latencies, 0.99) * 1000,
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--backend", choices=["memory", "sqlite"], default="memory")
+    parser.add_argument("--sessions", type=int, default=2000)
+    parser.add_argument("--turns", type=int, default=3)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--max-sessions", type=int, default=0)
+    parser.add_argument("--max-bytes", type=int, default=0)
+    args = parser.parse_args()
+
+    tmpdir = tempfile.mkdtemp(prefix="vizzy-bench-")
+    os.environ.update({
+        "OPENROUTER_API_KEY": "",
+        "HUGGINGFACE_API_KEY": "",
+        "REPLICATE_API_KEY": "",
+        "SESSION_BACKEND": args.backend,
+        "SESSION_DB_PATH": os.path.join(tmpdir, "sessions.db"),
+        "SESSION_MAX_SESSIONS": str(args.max_sessions),
+        "SESSION_MAX_BYTES": str(args.max_bytes),
+    })
+    import main as backend
+    logging.getLogger().setLevel(logging.ERROR)
+
+    res = asyncio.run(run(backend, args.sessions, args.turns, args.concurrency))
+    print(
+        f"{args.backend}: {res['requests']} requests in {res['wall_s']:.2f}s "
+        f"({res['rps']:.0f} req/s) p50={res['p50_ms']:.2f}ms p95={res['p95_ms']:.2f}ms p99={res['p99_ms']:.2f}ms"
+    )
+    print("store:", backend.sessions.stats())
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,104 @@
+"""
+Near-duplicate prompt index benchmark: lookup cost, memory and reuse rate.
+
+Usage (from backend/):
+    python benchmarks/bench_similarity.py --entries 2000 --lookups 2000
+
+Fills a SimilarityIndex with distinct synthetic prompts, then looks up
+refine-style variants of them (extra spaces, case changes, trailing ". ",
+doubled separators) and unrelated prompts. Reports add / lookup cost, how
+many variants an exact canonical key alone would have caught vs the
+similarity index, false matches among the unrelated prompts, and the bytes
+held by the shingle arrays.
+"""
+
+import argparse
+import os
+import random
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import similarity
+
+SUBJECTS = ["castle", "lighthouse", "fox", "owl", "city street", "forest cabin", "robot", "sailing ship", "teapot",
+            "mountain lake", "dragon", "bicycle", "cathedral", "koi pond", "desert caravan", "space station"]
+STYLES = ["watercolor", "oil painting", "pixel art", "photorealistic", "anime", "low poly", "pencil sketch",
+          "art nouveau", "cyberpunk", "studio ghibli style"]
+DETAILS = ["at sunset", "in the rain", "under a full moon", "in spring", "covered in snow", "at dawn", "in fog",
+           "with neon lights", "in autumn", "at golden hour"]
+REFINEMENTS = ["make it misty", "add more contrast", "warmer colors", "zoom out", "add a small boat",
+               "make it night", "more detail", "softer light", "add birds", "make it blue"]
+
+
+def prompt(rng: random.Random) -> str:
+    return f"A {rng.choice(SUBJECTS)} {rng.choice(DETAILS)}, {rng.choice(STYLES)}. {rng.choice(REFINEMENTS)}"
+
+
+def variant(text: str, rng: random.Random) -> str:
+    edits = [
+        lambda t: t.replace(" ", "  ", 1),
+        lambda t: t.lower(),
+        lambda t: t + ". ",
+        lambda t: t.replace(". ", " . . ", 1),
+        lambda t: t.replace(", ", " ,", 1),
+        lambda t: t.upper(),
+        lambda t: t.replace("colors", "colours").replace("color", "colour"),
+        lambda t: t.replace("A ", "a ", 1) + "!",
+    ]
+    for edit in rng.sample(edits, 2):
+        text = edit(text)
+    return text
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--entries", type=int, default=2000)
+    parser.add_argument("--lookups", type=int, default=2000)
+    parser.add_argument("--seed", type=int, default=7)
+    parser.add_argument("--threshold", type=float, default=0.9, help="near-match threshold (the server default is 0)")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    index = similarity.SimilarityIndex(threshold=args.threshold, max_entries=args.entries, enabled=True)
+    originals = []
+    seen = set()
+    while len(originals) < args.entries:
+        text = prompt(rng) + f" #{len(originals)}" * (len(seen) >= len(SUBJECTS) * len(DETAILS) * len(STYLES) * len(REFINEMENTS))
+        if similarity.canonicalize(text) not in seen:
+            seen.add(similarity.canonicalize(text))
+            originals.append(text)
+
+    t0 = time.perf_counter()
+    for i, text in enumerate(originals):
+        index.add([text], i)
+    add_us = (time.perf_counter() - t0) / len(originals) * 1e6
+
+    picks = [rng.randrange(len(originals)) for _ in range(args.lookups)]
+    variants = [variant(originals[i], rng) for i in picks]
+    t0 = time.perf_counter()
+    results = [index.lookup(v) for v in variants]
+    lookup_us = (time.perf_counter() - t0) / len(variants) * 1e6
+    exact = sum(1 for i, v in zip(picks, variants) if similarity.canonicalize(v) == similarity.canonicalize(originals[i]))
+    correct = sum(1 for i, r in zip(picks, results) if r is not None and r[0] == i)
+    wrong = sum(1 for i, r in zip(picks, results) if r is not None and r[0] != i)
+
+    unrelated = [f"{rng.choice(SUBJECTS)} portrait of {rng.choice(SUBJECTS)} #{n}" for n in range(args.lookups)]
+    t0 = time.perf_counter()
+    false_hits = sum(1 for u in unrelated if index.lookup(u) is not None)
+    miss_us = (time.perf_counter() - t0) / len(unrelated) * 1e6
+
+    stats = index.stats()
+    print(f"{args.entries} entries, {args.lookups} variant lookups")
+    print(f"add              {add_us:8.1f} us")
+    print(f"lookup (variant) {lookup_us:8.1f} us   avg candidates {stats['avg_candidates']}")
+    print(f"lookup (miss)    {miss_us:8.1f} us")
+    print(f"variants matched: exact canonical key {exact}/{len(variants)}, index {correct}/{len(variants)} "
+          f"(wrong entry {wrong})")
+    print(f"unrelated prompts matched: {false_hits}/{len(unrelated)}")
+    print(f"shingle arrays: {stats['shingle_bytes'] / 1024:.0f} KiB")
+
+
+if __name__ == "__main__":
+    main()
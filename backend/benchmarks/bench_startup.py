@@ -0,0 +1,89 @@
+"""
+Cold-start benchmark: import the Vercel entry point and serve the first request.
+
+Usage (from backend/):
+    python benchmarks/bench_startup.py --runs 5 --budget-ms 2000
+
+Each run is a fresh interpreter that imports api/index.py and sends a chat-mode
+POST /chat (no provider keys, so no network). It reports import time, time to
+first response and the whole process wall time, and checks that no provider
+SDK (huggingface_hub.inference, replicate, dotenv) was imported on the way.
+Exits non-zero if the median import-to-first-response exceeds --budget-ms or
+a provider SDK was loaded. tests/test_startup.py runs the same check under
+pytest (STARTUP_BUDGET_MS / STARTUP_RUNS).
+"""
+
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import time
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+ENTRY_POINT = os.path.join(BACKEND_DIR, "api", "index.py")
+
+# Modules a chat-only cold start must not pay for
+HEAVY_MODULES = ("huggingface_hub.inference._client", "replicate", "dotenv")
+
+CHILD = r"""
+import importlib.util, json, sys, time
+t0 = time.perf_counter()
+spec = importlib.util.spec_from_file_location("vercel_entry", sys.argv[1])
+entry = importlib.util.module_from_spec(spec)
+spec.loader.exec_module(entry)
+t_import = time.perf_counter()
+from fastapi.testclient import TestClient
+client = TestClient(entry.app)
+r = client.post("/chat", json={"message": "hello", "num_images": 0})
+r.raise_for_status()
+t_first = time.perf_counter()
+print(json.dumps({
+    "import_ms": (t_import - t0) * 1000,
+    "first_response_ms": (t_first - t0) * 1000,
+    "loaded": [m for m in sys.argv[2:] if m in sys.modules],
+}))
+"""
+
+
+def run_once() -> dict:
+    env = {**os.environ, "HUGGINGFACE_API_KEY": "", "REPLICATE_API_KEY": "", "OPENROUTER_API_KEY": "",
+           "PYTHONDONTWRITEBYTECODE": "1"}
+    t0 = time.perf_counter()
+    out = subprocess.run(
+        [sys.executable, "-c", CHILD, ENTRY_POINT, *HEAVY_MODULES],
+        env=env, capture_output=True, text=True, check=True, cwd=BACKEND_DIR,
+    )
+    result = json.loads(out.stdout.strip().splitlines()[-1])
+    result["process_ms"] = (time.perf_counter() - t0) * 1000
+    return result
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--runs", type=int, default=5)
+    parser.add_argument("--budget-ms", type=float, default=2000, help="max median import-to-first-response")
+    args = parser.parse_args()
+
+    runs = [run_once() for _ in range(args.runs)]
+    for key in ("import_ms", "first_response_ms", "process_ms"):
+        values = [r[key] for r in runs]
+        print(f"{key:<18} median {statistics.median(values):7.0f} ms   min {min(values):7.0f} ms   max {max(values):7.0f} ms")
+
+    loaded = sorted({m for r in runs for m in r["loaded"]})
+    median_first = statistics.median(r["first_response_ms"] for r in runs)
+    failures = []
+    if loaded:
+        failures.append(f"provider SDKs imported on a chat-only cold start: {', '.join(loaded)}")
+    if median_first > args.budget_ms:
+        failures.append(f"median first response {median_first:.0f} ms exceeds budget {args.budget_ms:.0f} ms")
+    for failure in failures:
+        print(f"FAIL: {failure}")
+    if not failures:
+        print(f"OK: within {args.budget_ms:.0f} ms budget, no provider SDKs loaded")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
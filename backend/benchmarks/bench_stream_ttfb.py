@@ -0,0 +1,86 @@
+"""
+Time-to-first-byte benchmark: /chat vs /chat/stream against the slow OpenRouter stub.
+
+Usage (from backend/):
+    python benchmarks/bench_stream_ttfb.py --delay 1.0 --runs 5
+
+For the streamed endpoint it reports when the first byte, the intent event,
+the first image, the first copy token and the final done event arrived.
+"""
+
+import argparse
+import asyncio
+import os
+import statistics
+import sys
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+import httpx
+
+from stub_upstream import free_port, serve_in_thread, stub_app
+
+
+async def time_blocking(client: httpx.AsyncClient, message: str) -> float:
+    t0 = time.perf_counter()
+    r = await client.post("/chat", json={"message": message, "num_images": 2})
+    r.raise_for_status()
+    return time.perf_counter() - t0
+
+
+async def time_stream(client: httpx.AsyncClient, message: str) -> dict:
+    marks = {}
+    t0 = time.perf_counter()
+    async with client.stream("POST", "/chat/stream", json={"message": message, "num_images": 2}) as r:
+        r.raise_for_status()
+        async for line in r.aiter_lines():
+            now = time.perf_counter() - t0
+            marks.setdefault("first_byte", now)
+            if line.startswith("event: "):
+                event = line[7:]
+                key = {"intent": "intent", "image": "first_image", "copy_token": "first_token", "done": "done"}.get(event)
+                if key:
+                    marks.setdefault(key, now)
+    return marks
+
+
+async def run(base_url: str, runs: int) -> None:
+    async with httpx.AsyncClient(base_url=base_url, timeout=120) as client:
+        blocking = [await time_blocking(client, f"a lighthouse at dusk #{i}") for i in range(runs)]
+        streamed = [await time_stream(client, f"a lighthouse at dawn #{i}") for i in range(runs)]
+
+    print(f"/chat          total (= TTFB): {statistics.median(blocking) * 1000:8.0f} ms")
+    for key in ("first_byte", "intent", "first_image", "first_token", "done"):
+        values = [m[key] for m in streamed if key in m]
+        if values:
+            print(f"/chat/stream   {key:<15} {statistics.median(values) * 1000:8.0f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--delay", type=float, default=1.0, help="stub upstream latency per call (s)")
+    parser.add_argument("--runs", type=int, default=5)
+    args = parser.parse_args()
+
+    stub_port = free_port()
+    stub_app.state.delay = args.delay
+    serve_in_thread(stub_app, stub_port)
+
+    os.environ["OPENROUTER_API_KEY"] = "stub"
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{stub_port}"
+    os.environ["HUGGINGFACE_API_KEY"] = ""
+    os.environ["REPLICATE_API_KEY"] = ""
+    os.environ["LLM_CACHE_ENABLED"] = "false"
+    os.environ["IMAGE_CACHE_ENABLED"] = "false"
+    import main as backend
+    import logging
+    logging.getLogger().setLevel(logging.ERROR)
+
+    app_port = free_port()
+    serve_in_thread(backend.app, app_port)
+    asyncio.run(run(f"http://127.0.0.1:{app_port}", args.runs))
+
+
+if __name__ == "__main__":
+    main()
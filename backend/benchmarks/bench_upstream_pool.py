@@ -0,0 +1,122 @@
+"""
+Upstream connection reuse benchmark: a new client per call vs the pooled per-host clients.
+
+Usage (from backend/):
+    python benchmarks/bench_upstream_pool.py --calls 200 --concurrency 8 --tls
+
+"per-call" builds a fresh httpx.AsyncClient (and SSL context) for every
+request, like the old module-level requests.post did, so each call pays DNS,
+TCP and TLS again. "pooled" goes through upstream.post_json. The stub
+OpenRouter runs locally with no delay, so the numbers are pure connection
+overhead. httpx loads the system CA bundle for every new client even over
+plain HTTP, so per-call pays that too (as requests does). With --tls the stub serves HTTPS with a throwaway self-signed
+certificate (needs the openssl CLI). The pooled run also prints the
+connect / TLS / header-wait phases from upstream.pool.stats().
+"""
+
+import argparse
+import asyncio
+import os
+import ssl
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+
+import upstream
+from bench_harness import percentile
+from stub_upstream import free_port, serve_in_thread, stub_app
+
+PAYLOAD = {"model": "stub", "messages": [{"role": "user", "content": "hello"}]}
+
+
+def self_signed_cert(directory: str) -> tuple:
+    cert, key = os.path.join(directory, "cert.pem"), os.path.join(directory, "key.pem")
+    subprocess.run(
+        ["openssl", "req", "-x509", "-newkey", "rsa:2048", "-nodes", "-keyout", key, "-out", cert,
+         "-days", "1", "-subj", "/CN=127.0.0.1", "-addext", "subjectAltName=IP:127.0.0.1"],
+        check=True, capture_output=True,
+    )
+    return cert, key
+
+
+async def run(call, calls: int, concurrency: int) -> dict:
+    semaphore = asyncio.Semaphore(concurrency)
+    latencies = []
+
+    async def one():
+        async with semaphore:
+            t0 = time.perf_counter()
+            response = await call()
+            response.raise_for_status()
+            latencies.append(time.perf_counter() - t0)
+
+    t0 = time.perf_counter()
+    await asyncio.gather(*(one() for _ in range(calls)))
+    wall = time.perf_counter() - t0
+    return {
+        "rps": round(calls / wall, 1),
+        "p50_ms": round(percentile(latencies, 50) * 1000, 2),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--calls", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=8)
+    parser.add_argument("--tls", action="store_true", help="serve the stub over HTTPS")
+    args = parser.parse_args()
+
+    stub_app.state.delay = 0
+    port = free_port()
+    with tempfile.TemporaryDirectory(prefix="vizzy-tls-") as tmp:
+        config, scheme, cafile = {}, "http", None
+        if args.tls:
+            cafile, key = self_signed_cert(tmp)
+            config = {"ssl_certfile": cafile, "ssl_keyfile": key}
+            scheme = "https"
+        serve_in_thread(stub_app, port, **config)
+        url = f"{scheme}://127.0.0.1:{port}/chat/completions"
+
+        def verify():
+            return ssl.create_default_context(cafile=cafile) if cafile else True
+
+        # The pool would load the system CA bundle; point it at the throwaway cert instead
+        upstream.pool._ssl = verify() if cafile else None
+        upstream.pool.add_origin(url)
+
+        async def per_call():
+            async with httpx.AsyncClient(verify=verify(), timeout=30) as client:
+                return await client.post(url, json=PAYLOAD)
+
+        async def pooled():
+            return await upstream.post_json(url, PAYLOAD, max_retries=1)
+
+        async def bench():
+            results = {"per-call": await run(per_call, args.calls, args.concurrency)}
+            await upstream.post_json(url, PAYLOAD, max_retries=1)  # open the pool outside the timing
+            results["pooled"] = await run(pooled, args.calls, args.concurrency)
+            await upstream.close_client()
+            return results
+
+        results = asyncio.run(bench())
+
+    print(f"{args.calls} calls at concurrency {args.concurrency} over {scheme}")
+    print(f"{'mode':<10} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9}")
+    for mode, res in results.items():
+        print(f"{mode:<10} {res['rps']:>8} {res['p50_ms']:>9} {res['p95_ms']:>9}")
+    for host, stats in upstream.pool.stats()["hosts"].items():
+        print(f"\npooled {host}: {stats['requests']} requests, {stats['new_connections']} new connections, "
+              f"versions {stats['http_versions']}")
+        for phase, timing in stats["phases"].items():
+            print(f"  {phase:<18} p50 {timing['p50_ms']:>7} ms  max {timing['max_ms']:>7} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,187 @@
+"""
+Multi-worker scaling benchmark: throughput at 1/2/4/8 uvicorn workers against fake providers.
+
+Usage (from backend/):
+    python benchmarks/bench_workers.py --workers 1,2,4,8 --requests 200 --concurrency 32
+    python benchmarks/bench_workers.py --workers 2 --drain-check
+
+For each worker count a fresh `uvicorn fake_worker_app:app --workers N` is
+started with WEB_CONCURRENCY=N (so sessions, caches, job records and rate
+limits go through the shared SQLite state) and a fake OpenRouter served from
+this process. The chat scenario is sent at fixed concurrency and reported as
+rps, p50/p95 and the number of distinct worker pids that answered. With
+--drain-check, background jobs are submitted and SIGTERM is sent while they
+run; the check passes if every job finishes and can still be read back.
+Scaling is bounded by the host's cores (printed first).
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import signal
+import subprocess
+import sys
+import tempfile
+import time
+
+sys.path.insert(0, os.path.dirname(__file__))
+
+import httpx
+
+from bench_harness import percentile
+from fake_providers import FakeProviders
+from stub_upstream import free_port, serve_in_thread
+
+BACKEND_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "..")
+
+
+def start_server(workers: int, port: int, openrouter_port: int, state_dir: str, time_scale: float) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "WEB_CONCURRENCY": str(workers),
+        "SHARED_STATE_DB": os.path.join(state_dir, "shared_state.db"),
+        "SESSION_DB_PATH": os.path.join(state_dir, "sessions.db"),
+        "IMAGE_STORE_DIR": os.path.join(state_dir, "images"),
+        "OPENROUTER_API_KEY": "fake",
+        "OPENROUTER_BASE_URL": f"http://127.0.0.1:{openrouter_port}",
+        "HUGGINGFACE_API_KEY": "fake",
+        "REPLICATE_API_KEY": "fake",
+        "LLM_CACHE_ENABLED": "false",
+        "IMAGE_CACHE_ENABLED": "false",
+        "TASTE_REUSE_THRESHOLD": "0",
+        "SIMILARITY_REUSE_ENABLED": "false",
+        "DEGRADE_ENABLED": "false",
+        "BENCH_TIME_SCALE": str(time_scale),
+        "SHUTDOWN_DRAIN_TIMEOUT": "60",
+    }
+    return subprocess.Popen(
+        [sys.executable, "-m", "uvicorn", "fake_worker_app:app", "--app-dir", "benchmarks", "--host", "127.0.0.1",
+         "--port", str(port), "--workers", str(workers), "--log-level", "warning",
+         "--timeout-graceful-shutdown", "60"],
+        cwd=BACKEND_DIR, env=env,
+    )
+
+
+async def wait_ready(base_url: str, timeout: float = 60) -> None:
+    deadline = time.monotonic() + timeout
+    async with httpx.AsyncClient(base_url=base_url, timeout=2) as client:
+        while time.monotonic() < deadline:
+            try:
+                if (await client.get("/health/worker")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"server at {base_url} did not start")
+
+
+async def load(base_url: str, requests: int, concurrency: int, num_images: int) -> dict:
+    latencies, errors, pids = [], 0, set()
+    semaphore = asyncio.Semaphore(concurrency)
+    # One connection per request slot, so the kernel spreads them over the workers
+    limits = httpx.Limits(max_connections=concurrency, max_keepalive_connections=0)
+    async with httpx.AsyncClient(base_url=base_url, timeout=300, limits=limits) as client:
+
+        async def one(i: int):
+            nonlocal errors
+            async with semaphore:
+                t0 = time.perf_counter()
+                try:
+                    r = await client.post("/chat", json={"message": f"a lighthouse in a storm #{i}", "num_images": num_images})
+                    r.raise_for_status()
+                except httpx.HTTPError:
+                    errors += 1
+                    return
+                latencies.append(time.perf_counter() - t0)
+                if i % 10 == 0:
+                    pids.add((await client.get("/health/worker")).json()["pid"])
+
+        t0 = time.perf_counter()
+        await asyncio.gather(*(one(i) for i in range(requests)))
+        wall = time.perf_counter() - t0
+    return {
+        "throughput_rps": round(len(latencies) / wall, 2) if wall else None,
+        "p50_ms": round(percentile(latencies, 50) * 1000, 1),
+        "p95_ms": round(percentile(latencies, 95) * 1000, 1),
+        "errors": errors,
+        "pids_seen": len(pids),
+    }
+
+
+async def drain_check(base_url: str, proc: subprocess.Popen, jobs: int) -> dict:
+    async with httpx.AsyncClient(base_url=base_url, timeout=30) as client:
+        ids = []
+        for i in range(jobs):
+            r = await client.post("/jobs", json={"message": f"drain test #{i}", "num_images": 2})
+            ids.append(r.json()["job_id"])
+        await asyncio.sleep(0.2)
+        t0 = time.perf_counter()
+        proc.send_signal(signal.SIGTERM)
+    proc.wait(timeout=120)
+    return {"jobs": jobs, "shutdown_s": round(time.perf_counter() - t0, 2), "ids": ids}
+
+
+def read_jobs(state_dir: str, ids: list) -> dict:
+    """After shutdown, read job records straight from the shared state file."""
+    sys.path.insert(0, BACKEND_DIR)
+    from shared_state import SharedState
+
+    state = SharedState(os.path.join(state_dir, "shared_state.db"))
+    statuses = {}
+    for job_id in ids:
+        record = state.get(f"jobs:{job_id}")
+        status = record["status"] if record else "missing"
+        statuses[status] = statuses.get(status, 0) + 1
+    return statuses
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--workers", default="1,2,4,8")
+    parser.add_argument("--requests", type=int, default=200)
+    parser.add_argument("--concurrency", type=int, default=32)
+    parser.add_argument("--num-images", type=int, default=2)
+    parser.add_argument("--time-scale", type=float, default=0.1, help="multiplier for all fake latencies")
+    parser.add_argument("--drain-check", action="store_true", help="also SIGTERM during background jobs")
+    parser.add_argument("--drain-jobs", type=int, default=8)
+    parser.add_argument("--out", help="write results JSON here")
+    args = parser.parse_args()
+
+    fakes = FakeProviders(scale=args.time_scale)
+    openrouter_port = free_port()
+    serve_in_thread(fakes.openrouter_app, openrouter_port)
+
+    print(f"{os.cpu_count()} CPU(s); {args.requests} chat requests at concurrency {args.concurrency}")
+    print(f"{'workers':>7} {'rps':>8} {'p50 ms':>9} {'p95 ms':>9} {'err':>4} {'pids':>5}")
+    results = {"cpus": os.cpu_count(), "runs": {}}
+    for workers in [int(w) for w in args.workers.split(",") if w.strip()]:
+        port = free_port()
+        with tempfile.TemporaryDirectory(prefix="vizzy-workers-") as state_dir:
+            proc = start_server(workers, port, openrouter_port, state_dir, args.time_scale)
+            base_url = f"http://127.0.0.1:{port}"
+            try:
+                asyncio.run(wait_ready(base_url))
+                res = asyncio.run(load(base_url, args.requests, args.concurrency, args.num_images))
+                if args.drain_check:
+                    drain = asyncio.run(drain_check(base_url, proc, args.drain_jobs))
+                    drain["statuses"] = read_jobs(state_dir, drain.pop("ids"))
+                    res["drain"] = drain
+            finally:
+                if proc.poll() is None:
+                    proc.send_signal(signal.SIGTERM)
+                    proc.wait(timeout=120)
+        results["runs"][workers] = res
+        print(f"{workers:>7} {res['throughput_rps']:>8} {res['p50_ms']:>9} {res['p95_ms']:>9} {res['errors']:>4} {res['pids_seen']:>5}")
+        if "drain" in res:
+            d = res["drain"]
+            print(f"        drain: {d['jobs']} jobs, shutdown took {d['shutdown_s']}s, final statuses {d['statuses']}")
+
+    if args.out:
+        with open(args.out, "w") as f:
+            json.dump(results, f, indent=2)
+        print(f"\nwrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
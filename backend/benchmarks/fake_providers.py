@@ -0,0 +1,213 @@
+"""
+Offline stand-ins for every upstream the backend talks to, for benchmarks:
+  - an OpenRouter ASGI app (/chat/completions incl. streaming, /images/generations)
+  - FakeInferenceClient, replacing huggingface_hub.InferenceClient.text_to_image
+  - FakeReplicate, replacing the replicate client's run()
+
+Each endpoint follows a Profile: a latency distribution, error rates for
+402 / 410 / timeouts, and a payload size. Profiles are plain dicts so they can
+be loaded from JSON:
+
+    {"hf_text_to_image": {"latency": "lognormal:2.5:0.4",
+                          "errors": {"402": 0.05, "410": 0.02, "timeout": 0.02},
+                          "timeout_s": 6, "payload": 512}}
+
+Latency specs: "fixed:S", "uniform:LO:HI", "lognormal:MEDIAN:SIGMA", "exp:MEAN".
+
+An optional "capacity" makes the upstream saturate: at most that many calls
+are served at once and the rest wait their turn (HF / Replicate only). Calls
+are also scaled by their cost: image area and "schnell" models for HF,
+num_outputs and megapixels for Replicate.
+"""
+
+import asyncio
+import json
+import math
+import random
+import threading
+import time
+from typing import Dict, Optional
+
+from fastapi import FastAPI
+from fastapi.responses import JSONResponse, StreamingResponse
+
+# payload: completion size in bytes (chat), image side in px (HF), outputs ignored (replicate)
+DEFAULT_PROFILES = {
+    "openrouter_chat": {"latency": "lognormal:0.4:0.5", "errors": {"timeout": 0.01}, "timeout_s": 10, "payload": 120},
+    "openrouter_images": {"latency": "lognormal:2.0:0.3", "errors": {"402": 0.02}, "timeout_s": 10},
+    "hf_text_to_image": {"latency": "lognormal:2.5:0.4", "errors": {"402": 0.05, "410": 0.02, "timeout": 0.02}, "timeout_s": 10, "payload": 512},
+    "replicate_run": {"latency": "lognormal:1.5:0.3", "errors": {"timeout": 0.01}, "timeout_s": 10},
+}
+
+
+class LatencyModel:
+    def __init__(self, spec: str, scale: float = 1.0):
+        kind, *params = spec.split(":")
+        self.kind = kind
+        self.params = [float(p) for p in params]
+        self.scale = scale
+        if kind not in ("fixed", "uniform", "lognormal", "exp"):
+            raise ValueError(f"Unknown latency distribution '{kind}'")
+
+    def sample(self, rng: random.Random) -> float:
+        p = self.params
+        if self.kind == "fixed":
+            value = p[0]
+        elif self.kind == "uniform":
+            value = rng.uniform(p[0], p[1])
+        elif self.kind == "lognormal":
+            value = rng.lognormvariate(math.log(p[0]), p[1])
+        else:
+            value = rng.expovariate(1 / p[0])
+        return value * self.scale
+
+
+class Profile:
+    def __init__(self, spec: dict, scale: float = 1.0):
+        self.latency = LatencyModel(spec.get("latency", "fixed:0"), scale)
+        self.errors = {str(k): float(v) for k, v in spec.get("errors", {}).items()}
+        self.timeout_s = float(spec.get("timeout_s", 10)) * scale
+        self.payload = int(spec.get("payload", 0))
+        self.capacity = int(spec.get("capacity", 0))
+        self._slots = threading.BoundedSemaphore(self.capacity) if self.capacity else None
+        self.calls = 0
+        self.faults: Dict[str, int] = {}
+        self._lock = threading.Lock()
+
+    def serve(self, rng: random.Random, cost: float = 1.0) -> Optional[str]:
+        """Block like one upstream call costing `cost` (waiting for capacity first); returns the fault if any."""
+        delay, fault = self.draw(rng)
+        if fault != "timeout":
+            delay *= cost
+        if self._slots is None:
+            time.sleep(delay)
+            return fault
+        with self._slots:
+            time.sleep(delay)
+        return fault
+
+    def draw(self, rng: random.Random) -> tuple[float, Optional[str]]:
+        """Return (latency seconds, fault or None) for one call and count it."""
+        roll = rng.random()
+        fault = None
+        for name, rate in self.errors.items():
+            if roll < rate:
+                fault = name
+                break
+            roll -= rate
+        with self._lock:
+            self.calls += 1
+            if fault:
+                self.faults[fault] = self.faults.get(fault, 0) + 1
+        return (self.timeout_s if fault == "timeout" else self.latency.sample(rng)), fault
+
+    def stats(self) -> dict:
+        return {"calls": self.calls, "faults": dict(self.faults)}
+
+
+class FakeProviders:
+    """All fake upstreams sharing one seeded RNG so runs are repeatable."""
+
+    def __init__(self, profiles: Optional[dict] = None, scale: float = 1.0, seed: int = 1):
+        merged = {name: {**spec, **(profiles or {}).get(name, {})} for name, spec in DEFAULT_PROFILES.items()}
+        self.profiles = {name: Profile(spec, scale) for name, spec in merged.items()}
+        self.rng = random.Random(seed)
+        self.openrouter_app = self._build_openrouter_app()
+        self.hf_client = FakeInferenceClient(self.profiles["hf_text_to_image"], self.rng)
+        self.replicate = FakeReplicate(self.profiles["replicate_run"], self.rng)
+
+    def stats(self) -> dict:
+        return {name: p.stats() for name, p in self.profiles.items()}
+
+    def _build_openrouter_app(self) -> FastAPI:
+        app = FastAPI(title="Fake OpenRouter")
+        chat, images, rng = self.profiles["openrouter_chat"], self.profiles["openrouter_images"], self.rng
+
+        def completion_text(prompt: str) -> str:
+            filler = " ".join(["vivid"] * max(0, chat.payload // 6))
+            if "JSON" in prompt:
+                return json.dumps({"intent": "creative", "prompt": f"a fake prompt {filler}".strip()})
+            return f"A fake tagline {filler}".strip()
+
+        @app.post("/chat/completions")
+        async def chat_completions(payload: dict):
+            delay, fault = chat.draw(rng)
+            await asyncio.sleep(delay)
+            if fault in ("402", "410"):
+                return JSONResponse({"error": {"code": int(fault)}}, status_code=int(fault))
+            content = completion_text(payload.get("messages", [{}])[-1].get("content", ""))
+            if payload.get("stream"):
+                return StreamingResponse(_stream(content), media_type="text/event-stream")
+            return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+        @app.post("/images/generations")
+        async def images_generations(payload: dict):
+            delay, fault = images.draw(rng)
+            await asyncio.sleep(delay)
+            if fault in ("402", "410"):
+                return JSONResponse({"error": {"code": int(fault)}}, status_code=int(fault))
+            n = payload.get("num_images", 1)
+            return {"images": [f"https://fake.local/openrouter/{rng.getrandbits(48):x}.png" for _ in range(n)]}
+
+        return app
+
+
+async def _stream(content: str):
+    for i, token in enumerate(content.split(" ")):
+        delta = token if i == 0 else " " + token
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}) + "\n\n"
+    yield "data: [DONE]\n\n"
+
+
+class FakeHTTPError(Exception):
+    """Shaped like huggingface_hub's HfHubHTTPError: carries .response.status_code."""
+
+    class _Response:
+        def __init__(self, status_code: int):
+            self.status_code = status_code
+
+    def __init__(self, status_code: int):
+        super().__init__(f"{status_code} Client Error (fake provider)")
+        self.response = self._Response(status_code)
+
+
+class FakeInferenceClient:
+    """Blocking text_to_image like the real client; returns a noisy RGB PIL image."""
+
+    def __init__(self, profile: Profile, rng: random.Random):
+        self.profile = profile
+        self.rng = rng
+
+    def text_to_image(self, prompt: str, model: Optional[str] = None, width: Optional[int] = None,
+                      height: Optional[int] = None):
+        from PIL import Image
+
+        default = self.profile.payload or 512
+        width, height = width or default, height or default
+        cost = width * height / (default * default) * (0.5 if model and "schnell" in model.lower() else 1.0)
+        fault = self.profile.serve(self.rng, cost)
+        if fault == "timeout":
+            raise TimeoutError("fake HF read timed out")
+        if fault:
+            raise FakeHTTPError(int(fault))
+        # Random pixels don't compress, so encoding cost is a realistic upper bound
+        return Image.frombytes("RGB", (width, height), self.rng.randbytes(width * height * 3))
+
+
+class FakeReplicate:
+    """Stand-in for a `replicate.Client` (only run() is used)."""
+
+    def __init__(self, profile: Profile, rng: random.Random):
+        self.profile = profile
+        self.rng = rng
+
+    def run(self, model: str, input: Optional[dict] = None):
+        input = input or {}
+        cost = input.get("num_outputs", 1) / 2 * (0.5 if input.get("megapixels") == "0.25" else 1.0)
+        fault = self.profile.serve(self.rng, cost)
+        if fault == "timeout":
+            raise TimeoutError("fake Replicate prediction timed out")
+        if fault:
+            raise FakeHTTPError(int(fault))
+        n = input.get("num_outputs", 1)
+        return [f"https://fake.local/replicate/{self.rng.getrandbits(48):x}.webp" for _ in range(n)]
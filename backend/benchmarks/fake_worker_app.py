@@ -0,0 +1,24 @@
+"""
+App module for uvicorn worker processes in bench_workers.py: the real backend
+with fake HF / Replicate clients installed (OpenRouter is pointed at the
+benchmark's fake server through OPENROUTER_BASE_URL). Each worker imports this
+module, so every process gets its own fakes.
+
+    python -m uvicorn fake_worker_app:app --app-dir benchmarks --workers 4
+"""
+
+import os
+import sys
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), ".."))
+
+from fake_providers import FakeProviders
+
+import main
+
+fakes = FakeProviders(scale=float(os.getenv("BENCH_TIME_SCALE", "0.1")), seed=os.getpid())
+main.HAS_REPLICATE = True
+main.provider_clients.set("huggingface", fakes.hf_client)
+main.provider_clients.set("replicate", fakes.replicate)
+
+app = main.app
@@ -0,0 +1,71 @@
+"""
+Local stub of the OpenRouter endpoints used by the backend, for benchmarks.
+Every call sleeps STUB_DELAY seconds (async) to simulate a slow upstream;
+streamed completions spread the same delay across their tokens.
+"""
+
+import asyncio
+import json
+import os
+import socket
+import threading
+import time
+
+import uvicorn
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+STUB_DELAY = float(os.getenv("STUB_DELAY", "0.5"))
+
+stub_app = FastAPI(title="Stub OpenRouter")
+stub_app.state.delay = STUB_DELAY
+stub_app.state.calls = 0
+
+
+@stub_app.post("/chat/completions")
+async def chat_completions(payload: dict):
+    stub_app.state.calls += 1
+    prompt = payload.get("messages", [{}])[-1].get("content", "")
+    if "JSON" in prompt:
+        content = '{"intent": "creative", "prompt": "a stub prompt"}'
+    else:
+        content = "A stub tagline for a stub artwork."
+    if payload.get("stream"):
+        return StreamingResponse(_stream_tokens(content), media_type="text/event-stream")
+    await asyncio.sleep(stub_app.state.delay)
+    return {"choices": [{"message": {"role": "assistant", "content": content}}]}
+
+
+async def _stream_tokens(content: str):
+    tokens = content.split(" ")
+    # Time-to-first-token is a fifth of the delay; the rest is spread over tokens
+    await asyncio.sleep(stub_app.state.delay / 5)
+    for i, token in enumerate(tokens):
+        delta = token if i == 0 else " " + token
+        yield "data: " + json.dumps({"choices": [{"delta": {"content": delta}}]}) + "\n\n"
+        await asyncio.sleep(stub_app.state.delay * 0.8 / len(tokens))
+    yield "data: [DONE]\n\n"
+
+
+@stub_app.post("/images/generations")
+async def images_generations(payload: dict):
+    stub_app.state.calls += 1
+    await asyncio.sleep(stub_app.state.delay)
+    n = payload.get("num_images", 1)
+    return {"images": [f"https://stub.local/image/{i}.png" for i in range(n)]}
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def serve_in_thread(app, port: int, **config) -> uvicorn.Server:
+    """Run an ASGI app with uvicorn in a daemon thread and wait until it's up (extra uvicorn.Config kwargs, e.g. ssl_*)."""
+    server = uvicorn.Server(uvicorn.Config(app, host="127.0.0.1", port=port, log_level="warning", **config))
+    thread = threading.Thread(target=server.run, daemon=True)
+    thread.start()
+    while not server.started:
+        time.sleep(0.01)
+    return server
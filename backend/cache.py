@@ -0,0 +1,457 @@
+"""
+Caching primitives for generated content.
+- LRUCache: in-memory, byte-size bounded, per-entry TTL
+- DiskCache: optional on-disk JSON tier with its own byte limit and TTL
+- SingleFlight: coalesces identical in-flight async calls into one
+- ImageCache: content-addressed cache in front of the image providers
+- CompletionCache: LLM completion cache in front of generate_text
+With SHARED_STATE_DB set (multi-worker mode) both caches get a second tier in
+the shared SQLite file, so a result computed by one worker is a hit in all.
+"""
+
+import asyncio
+import contextvars
+import functools
+import hashlib
+import json
+import logging
+import os
+import sys
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+from shared_state import SharedCache, get_shared_state
+from similarity import canonicalize
+
+IMAGE_CACHE_ENABLED = os.getenv("IMAGE_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+IMAGE_CACHE_MAX_BYTES = int(os.getenv("IMAGE_CACHE_MAX_BYTES", str(64 * 1024 * 1024)))
+IMAGE_CACHE_TTL = float(os.getenv("IMAGE_CACHE_TTL", "3600"))
+IMAGE_CACHE_DIR = os.getenv("IMAGE_CACHE_DIR", "")  # empty = no disk tier
+IMAGE_CACHE_DISK_MAX_BYTES = int(os.getenv("IMAGE_CACHE_DISK_MAX_BYTES", str(512 * 1024 * 1024)))
+IMAGE_CACHE_DISK_TTL = float(os.getenv("IMAGE_CACHE_DISK_TTL", str(7 * 24 * 3600)))
+
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "true").lower() in ("1", "true", "yes")
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", str(8 * 1024 * 1024)))
+LLM_CACHE_TTL = float(os.getenv("LLM_CACHE_TTL", "900"))
+# Completions sampled hotter than this are meant to vary, so they're never cached
+LLM_CACHE_MAX_TEMPERATURE = float(os.getenv("LLM_CACHE_MAX_TEMPERATURE", "0.75"))
+
+
+def normalize_prompt(prompt: str) -> str:
+    """Cache-key form of a prompt (see similarity.canonicalize)."""
+    return canonicalize(prompt)
+
+
+def content_key(*parts: Any) -> str:
+    """Stable sha256 over the JSON encoding of the key parts."""
+    raw = json.dumps(parts, sort_keys=True, separators=(",", ":"), default=str)
+    return hashlib.sha256(raw.encode()).hexdigest()
+
+
+class CacheStats:
+    def __init__(self):
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    def to_dict(self) -> dict:
+        return dict(vars(self))
+
+
+class LRUCache:
+    """Thread-safe LRU with a total byte budget and TTL per entry."""
+
+    def __init__(self, max_bytes: int, ttl: float, clock: Callable[[], float] = time.monotonic):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.stats = CacheStats()
+        self.total_bytes = 0
+        self._data: "OrderedDict[str, Tuple[Any, int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._data)
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                self.stats.misses += 1
+                return None
+            value, size, expires = item
+            if self.clock() >= expires:
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            self._data.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: str, value: Any, size: int, ttl: Optional[float] = None) -> bool:
+        """Store `value` accounted as `size` bytes. Entries larger than the budget are refused."""
+        if size > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._data:
+                self._remove(key)
+            self._data[key] = (value, size, self.clock() + (self.ttl if ttl is None else ttl))
+            self.total_bytes += size
+            while self.total_bytes > self.max_bytes:
+                oldest = next(iter(self._data))
+                self._remove(oldest)
+                self.stats.evictions += 1
+        return True
+
+    def clear(self) -> None:
+        with self._lock:
+            self._data.clear()
+            self.total_bytes = 0
+
+    def _remove(self, key: str) -> None:
+        _, size, _ = self._data.pop(key)
+        self.total_bytes -= size
+
+    def to_dict(self) -> dict:
+        return {"entries": len(self._data), "bytes": self.total_bytes, "max_bytes": self.max_bytes, **self.stats.to_dict()}
+
+
+class DiskCache:
+    """
+    JSON-file tier under `directory`, one file per key.
+    The access-order index is kept in memory and rebuilt from mtimes on start.
+    Methods block on file IO; call them via asyncio.to_thread from async code.
+    """
+
+    def __init__(self, directory: str, max_bytes: int, ttl: float):
+        self.directory = directory
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.stats = CacheStats()
+        self.total_bytes = 0
+        self._index: "OrderedDict[str, Tuple[int, float]]" = OrderedDict()
+        self._lock = threading.Lock()
+        os.makedirs(directory, exist_ok=True)
+        self._load_index()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, f"{key}.json")
+
+    def _load_index(self) -> None:
+        entries = []
+        for name in os.listdir(self.directory):
+            if not name.endswith(".json"):
+                continue
+            st = os.stat(os.path.join(self.directory, name))
+            entries.append((st.st_mtime, name[:-5], st.st_size))
+        for mtime, key, size in sorted(entries):
+            self._index[key] = (size, mtime)
+            self.total_bytes += size
+
+    def get(self, key: str) -> Any:
+        with self._lock:
+            item = self._index.get(key)
+            if item is None:
+                self.stats.misses += 1
+                return None
+            if time.time() - item[1] >= self.ttl:
+                self._remove(key)
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return None
+            try:
+                with open(self._path(key), "r", encoding="utf-8") as f:
+                    value = json.load(f)
+            except (OSError, ValueError) as e:
+                logging.warning(f"Disk cache read failed for {key[:12]}: {e}")
+                self._remove(key)
+                self.stats.misses += 1
+                return None
+            self._index.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: str, value: Any) -> bool:
+        data = json.dumps(value).encode("utf-8")
+        if len(data) > self.max_bytes:
+            return False
+        with self._lock:
+            if key in self._index:
+                self._remove(key)
+            tmp = self._path(key) + ".tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, self._path(key))
+            self._index[key] = (len(data), time.time())
+            self.total_bytes += len(data)
+            while self.total_bytes > self.max_bytes:
+                self._remove(next(iter(self._index)))
+                self.stats.evictions += 1
+        return True
+
+    def _remove(self, key: str) -> None:
+        size, _ = self._index.pop(key)
+        self.total_bytes -= size
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def to_dict(self) -> dict:
+        return {"entries": len(self._index), "bytes": self.total_bytes, "max_bytes": self.max_bytes, **self.stats.to_dict()}
+
+
+class _Flight:
+    __slots__ = ("task", "waiters")
+
+    def __init__(self, task: asyncio.Task):
+        self.task = task
+        self.waiters = 0
+
+
+class SingleFlight:
+    """
+    Run at most one `fn()` per key at a time; concurrent callers share its result.
+
+    `fn()` runs in its own task, so cancelling one caller (a hedge loser, a
+    deadline, a client disconnect) doesn't cancel the others; the task is
+    only cancelled once no caller is waiting for it any more.
+    """
+
+    def __init__(self):
+        self._inflight: Dict[str, _Flight] = {}
+        self.coalesced = 0
+
+    async def do(self, key: str, fn: Callable[[], Awaitable[Any]]) -> Any:
+        loop = asyncio.get_running_loop()
+        for _ in range(2):
+            flight = self._inflight.get(key)
+            if flight is not None and flight.task.get_loop() is loop:
+                self.coalesced += 1
+            else:
+                flight = self._start(key, fn)
+            flight.waiters += 1
+            try:
+                # wait() doesn't cancel the task when this caller is cancelled, nor raise if the task was
+                await asyncio.wait((flight.task,))
+            finally:
+                flight.waiters -= 1
+                if not flight.waiters and not flight.task.done():
+                    self._forget(key, flight)
+                    flight.task.cancel()
+            if not flight.task.cancelled():
+                return flight.task.result()
+            # Cancelled from inside fn() itself; run it once more for this caller
+        raise RuntimeError(f"Shared call for {key[:12]} was cancelled")
+
+    def _start(self, key: str, fn: Callable[[], Awaitable[Any]]) -> _Flight:
+        flight = _Flight(asyncio.ensure_future(fn()))
+        self._inflight[key] = flight
+        flight.task.add_done_callback(lambda task: self._forget(key, flight))
+        return flight
+
+    def _forget(self, key: str, flight: _Flight) -> None:
+        if self._inflight.get(key) is flight:
+            del self._inflight[key]
+        # Failures whose callers all went away would otherwise log "exception was never retrieved"
+        if flight.task.done() and not flight.task.cancelled():
+            flight.task.exception()
+
+
+# Whether the provider call just awaited in this context was served from cache
+_served_from_cache: contextvars.ContextVar[bool] = contextvars.ContextVar("served_from_cache", default=False)
+
+
+class ImageCache:
+    """
+    Content-addressed cache for (images, model_label) provider results, keyed on
+    (normalized prompt, provider/model, size, num_images[, variant]).
+    Memory LRU first, then the second tier (the shared worker state if
+    configured, else the optional disk cache); misses are single-flighted.
+    """
+
+    def __init__(self, enabled: bool = IMAGE_CACHE_ENABLED):
+        self.enabled = enabled
+        self.memory = LRUCache(IMAGE_CACHE_MAX_BYTES, IMAGE_CACHE_TTL)
+        self.disk = None
+        shared = get_shared_state()
+        if shared is not None:
+            self.disk = SharedCache(shared, "images", IMAGE_CACHE_DISK_TTL)
+        elif IMAGE_CACHE_DIR:
+            try:
+                self.disk = DiskCache(IMAGE_CACHE_DIR, IMAGE_CACHE_DISK_MAX_BYTES, IMAGE_CACHE_DISK_TTL)
+            except OSError as e:
+                logging.warning(f"Image disk cache disabled ({e})")
+        self.flight = SingleFlight()
+        # Extra key part for the current request, e.g. a degraded quality tier ("" = none)
+        self.variant: Callable[[], str] = lambda: ""
+
+    @staticmethod
+    def key(prompt: str, provider: str, size: str, num_images: int, variant: str = "") -> str:
+        if variant:
+            return content_key(normalize_prompt(prompt), provider, size, num_images, variant)
+        return content_key(normalize_prompt(prompt), provider, size, num_images)
+
+    @staticmethod
+    def _size(images: List[str], model: str) -> int:
+        return sum(len(i) for i in images) + len(model)
+
+    async def get(self, key: str) -> Optional[Tuple[List[str], str]]:
+        value = self.memory.get(key)
+        if value is not None:
+            return value
+        if self.disk is not None:
+            stored = await asyncio.to_thread(self.disk.get, key)
+            if stored is not None:
+                value = (stored["images"], stored["model"])
+                self.memory.put(key, value, self._size(*value))
+                return value
+        return None
+
+    async def put(self, key: str, images: List[str], model: str) -> None:
+        self.memory.put(key, (images, model), self._size(images, model))
+        if self.disk is not None:
+            try:
+                await asyncio.to_thread(self.disk.put, key, {"images": images, "model": model})
+            except OSError as e:
+                logging.warning(f"Image disk cache write failed: {e}")
+
+    def cached(self, provider: str, size: str = "512x512"):
+        """
+        Decorator for `async def provider(prompt, num_images, ...) -> (images, model)`.
+        Only complete real results are stored; placeholder fallbacks and partial
+        results (fewer images than asked for) always pass through.
+        """
+
+        def decorator(fn):
+            @functools.wraps(fn)
+            async def wrapper(prompt: str, num_images: int = 2, *args, **kwargs):
+                if not self.enabled:
+                    _served_from_cache.set(False)
+                    return await fn(prompt, num_images, *args, **kwargs)
+                key = self.key(prompt, provider, size, num_images, self.variant())
+                hit = await self.get(key)
+                if hit is not None:
+                    _served_from_cache.set(True)
+                    return list(hit[0]), hit[1]
+
+                async def generate():
+                    images, model = await fn(prompt, num_images, *args, **kwargs)
+                    if len(images) == num_images and "Placeholder" not in model:
+                        await self.put(key, list(images), model)
+                    return images, model
+
+                _served_from_cache.set(False)
+                images, model = await self.flight.do(key, generate)
+                return list(images), model
+
+            return wrapper
+
+        return decorator
+
+    @staticmethod
+    def served_from_cache() -> bool:
+        return _served_from_cache.get()
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "memory": self.memory.to_dict(),
+            "disk": self.disk.to_dict() if self.disk is not None else None,
+            "coalesced": self.flight.coalesced,
+        }
+
+
+class CompletionCache:
+    """
+    Cache for text completions keyed on (model, prompt, max_tokens, temperature).
+    Memory is capped in bytes (actual string sizes, key included), entries
+    expire after a TTL, calls above max_temperature bypass the cache, and
+    concurrent identical calls share one upstream request either way.
+    """
+
+    def __init__(
+        self,
+        enabled: bool = LLM_CACHE_ENABLED,
+        max_bytes: int = LLM_CACHE_MAX_BYTES,
+        ttl: float = LLM_CACHE_TTL,
+        max_temperature: float = LLM_CACHE_MAX_TEMPERATURE,
+    ):
+        self.enabled = enabled
+        self.max_temperature = max_temperature
+        self.memory = LRUCache(max_bytes, ttl)
+        shared = get_shared_state()
+        self.shared = SharedCache(shared, "completions", ttl) if shared is not None else None
+        self.flight = SingleFlight()
+        self.bypassed = 0
+
+    @staticmethod
+    def key(model: str, prompt: str, max_tokens: int, temperature: float) -> str:
+        return content_key(model, prompt, max_tokens, round(temperature, 3))
+
+    def _cacheable(self, temperature: float) -> bool:
+        return self.enabled and temperature <= self.max_temperature
+
+    async def peek(self, model: str, prompt: str, max_tokens: int, temperature: float) -> Optional[str]:
+        """Cached completion if present (used by the streaming path), else None."""
+        if not self._cacheable(temperature):
+            return None
+        key = self.key(model, prompt, max_tokens, temperature)
+        text = self.memory.get(key)
+        if text is None and self.shared is not None:
+            text = await asyncio.to_thread(self.shared.get, key)
+            if text is not None:
+                self.memory.put(key, text, sys.getsizeof(text) + sys.getsizeof(key))
+        return text
+
+    async def store(self, model: str, prompt: str, max_tokens: int, temperature: float, text: str) -> None:
+        if self._cacheable(temperature):
+            key = self.key(model, prompt, max_tokens, temperature)
+            self.memory.put(key, text, sys.getsizeof(text) + sys.getsizeof(key))
+            if self.shared is not None:
+                await asyncio.to_thread(self.shared.put, key, text)
+
+    async def get_or_complete(
+        self,
+        model: str,
+        prompt: str,
+        max_tokens: int,
+        temperature: float,
+        complete: Callable[[], Awaitable[str]],
+    ) -> str:
+        key = self.key(model, prompt, max_tokens, temperature)
+        cacheable = self._cacheable(temperature)
+        if cacheable:
+            text = self.memory.get(key)
+            if text is None and self.shared is not None:
+                text = await asyncio.to_thread(self.shared.get, key)
+                if text is not None:
+                    self.memory.put(key, text, sys.getsizeof(text) + sys.getsizeof(key))
+            if text is not None:
+                return text
+        else:
+            self.bypassed += 1
+
+        async def run():
+            text = await complete()
+            if cacheable:
+                self.memory.put(key, text, sys.getsizeof(text) + sys.getsizeof(key))
+                if self.shared is not None:
+                    await asyncio.to_thread(self.shared.put, key, text)
+            return text
+
+        return await self.flight.do(key, run)
+
+    def stats(self) -> dict:
+        return {
+            "enabled": self.enabled,
+            "max_temperature": self.max_temperature,
+            "bypassed": self.bypassed,
+            "coalesced": self.flight.coalesced,
+            **self.memory.to_dict(),
+            "shared": self.shared.to_dict() if self.shared is not None else None,
+        }
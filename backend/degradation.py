@@ -0,0 +1,182 @@
+"""
+Load-aware degradation of image generation.
+
+LoadController turns three signals into one pressure figure (1.0 = at
+capacity): in-flight generate_images calls vs DEGRADE_MAX_INFLIGHT, queued
+background jobs vs DEGRADE_MAX_QUEUE, and p95 generation latency over the
+last DEGRADE_WINDOW seconds vs DEGRADE_LATENCY_TARGET. Each request gets a
+Tier for that pressure:
+
+- full: as requested
+- reduced: one image
+- fast: one smaller image, lower quality, fastest models first, no hedging
+- minimal: like fast at the smallest size
+
+Escalation is immediate. Recovery steps down one tier at a time, once
+pressure has stayed under DEGRADE_RECOVER_RATIO of the current tier's
+threshold for DEGRADE_COOLDOWN seconds, so the quicker responses of a
+degraded tier don't flip it straight back. Providers read the request's
+tier through current_tier().
+"""
+
+import contextlib
+import contextvars
+import logging
+import os
+import threading
+import time
+from collections import deque
+from typing import Callable, Dict, Optional
+
+DEGRADE_ENABLED = os.getenv("DEGRADE_ENABLED", "true").lower() in ("1", "true", "yes")
+DEGRADE_MAX_INFLIGHT = int(os.getenv("DEGRADE_MAX_INFLIGHT", "8"))
+DEGRADE_MAX_QUEUE = int(os.getenv("DEGRADE_MAX_QUEUE", "16"))
+DEGRADE_LATENCY_TARGET = float(os.getenv("DEGRADE_LATENCY_TARGET", "30"))
+DEGRADE_WINDOW = float(os.getenv("DEGRADE_WINDOW", "60"))
+DEGRADE_RECOVER_RATIO = float(os.getenv("DEGRADE_RECOVER_RATIO", "0.6"))
+DEGRADE_COOLDOWN = float(os.getenv("DEGRADE_COOLDOWN", "15"))
+# Fewest latency samples in the window before latency counts towards pressure
+DEGRADE_MIN_SAMPLES = int(os.getenv("DEGRADE_MIN_SAMPLES", "5"))
+
+
+class Tier:
+    __slots__ = ("level", "name", "threshold", "max_images", "size", "quality", "fast_models", "hedging")
+
+    def __init__(self, level: int, name: str, threshold: float, max_images: int, size: Optional[int],
+                 quality: Optional[int], fast_models: bool, hedging: bool):
+        self.level = level
+        self.name = name
+        self.threshold = threshold  # pressure at which this tier is entered
+        self.max_images = max_images
+        self.size = size  # square side in px; None = each provider's usual size
+        self.quality = quality  # encode quality; None = each provider's usual quality
+        self.fast_models = fast_models
+        self.hedging = hedging
+
+    @property
+    def degraded(self) -> bool:
+        return self.level > 0
+
+    @property
+    def variant(self) -> str:
+        """Cache-key tag for tiers that change what a provider returns for the same request."""
+        return self.name if self.size or self.quality or self.fast_models else ""
+
+    @property
+    def label(self) -> str:
+        """Suffix for image_model ("" at full quality)."""
+        return f" [{self.name}]" if self.degraded else ""
+
+    def to_dict(self) -> dict:
+        return {slot: getattr(self, slot) for slot in self.__slots__}
+
+
+TIERS = (
+    Tier(0, "full", 0.0, max_images=2, size=None, quality=None, fast_models=False, hedging=True),
+    Tier(1, "reduced", 1.0, max_images=1, size=None, quality=None, fast_models=False, hedging=True),
+    Tier(2, "fast", 1.5, max_images=1, size=384, quality=65, fast_models=True, hedging=False),
+    Tier(3, "minimal", 2.5, max_images=1, size=256, quality=50, fast_models=True, hedging=False),
+)
+
+_current: contextvars.ContextVar[Tier] = contextvars.ContextVar("degradation_tier", default=TIERS[0])
+
+
+def current_tier() -> Tier:
+    """Tier of the generation running in this context (full outside one)."""
+    return _current.get()
+
+
+def degraded_label(image_model: str) -> bool:
+    return any(image_model.endswith(t.label) for t in TIERS if t.degraded)
+
+
+class LoadController:
+    def __init__(self, queue_depth: Callable[[], int] = lambda: 0, enabled: bool = DEGRADE_ENABLED,
+                 clock: Callable[[], float] = time.monotonic):
+        self.queue_depth = queue_depth
+        self.enabled = enabled
+        self.clock = clock
+        self.inflight = 0
+        self.level = 0
+        self._calm_since: Optional[float] = None
+        self._latencies: deque = deque(maxlen=1024)
+        self._lock = threading.Lock()
+        self.selected: Dict[str, int] = {t.name: 0 for t in TIERS}
+        self.transitions = 0
+
+    def _latency_p95(self, now: float) -> float:
+        while self._latencies and self._latencies[0][0] < now - DEGRADE_WINDOW:
+            self._latencies.popleft()
+        if len(self._latencies) < DEGRADE_MIN_SAMPLES:
+            return 0.0
+        ordered = sorted(seconds for _, seconds in self._latencies)
+        return ordered[min(len(ordered) - 1, int(len(ordered) * 0.95))]
+
+    def signals(self) -> dict:
+        with self._lock:
+            p95 = self._latency_p95(self.clock())
+        return {
+            "inflight": self.inflight / DEGRADE_MAX_INFLIGHT if DEGRADE_MAX_INFLIGHT else 0.0,
+            "queue": self.queue_depth() / DEGRADE_MAX_QUEUE if DEGRADE_MAX_QUEUE else 0.0,
+            "latency": p95 / DEGRADE_LATENCY_TARGET if DEGRADE_LATENCY_TARGET else 0.0,
+        }
+
+    def pressure(self) -> float:
+        return max(self.signals().values())
+
+    def select(self) -> Tier:
+        """Tier for a generation starting now; moves the controller's level as load changes."""
+        if not self.enabled:
+            return TIERS[0]
+        pressure = self.pressure()
+        target = max(t.level for t in TIERS if pressure >= t.threshold)
+        now = self.clock()
+        with self._lock:
+            previous = self.level
+            if target > self.level:
+                self.level = target
+                self._calm_since = None
+            elif self.level > 0 and pressure < TIERS[self.level].threshold * DEGRADE_RECOVER_RATIO:
+                if self._calm_since is None:
+                    self._calm_since = now
+                elif now - self._calm_since >= DEGRADE_COOLDOWN:
+                    self.level -= 1
+                    self._calm_since = now
+            else:
+                self._calm_since = None
+            tier = TIERS[self.level]
+            self.selected[tier.name] += 1
+            if tier.level != previous:
+                self.transitions += 1
+        if tier.level != previous:
+            logging.warning(f"Image generation tier {TIERS[previous].name} -> {tier.name} (pressure {pressure:.2f})")
+        return tier
+
+    @contextlib.contextmanager
+    def generation(self, tier: Tier):
+        """Count an in-flight generation at `tier`, expose it via current_tier() and record its latency."""
+        token = _current.set(tier)
+        started = self.clock()
+        with self._lock:
+            self.inflight += 1
+        try:
+            yield tier
+        finally:
+            ended = self.clock()
+            with self._lock:
+                self.inflight -= 1
+                self._latencies.append((ended, ended - started))
+            _current.reset(token)
+
+    def stats(self) -> dict:
+        signals = self.signals()
+        return {
+            "enabled": self.enabled,
+            "tier": TIERS[self.level].name,
+            "pressure": round(max(signals.values()), 3),
+            "signals": {k: round(v, 3) for k, v in signals.items()},
+            "inflight": self.inflight,
+            "selected": dict(self.selected),
+            "transitions": self.transitions,
+            "tiers": [t.to_dict() for t in TIERS],
+        }
@@ -0,0 +1,99 @@
+"""
+Bounded-concurrency fan-out for per-image provider calls.
+Issues N jobs in parallel (at most `concurrency` at a time), stops everything
+as soon as one job hits a hard provider error (402/403/410), and returns
+whatever finished when the deadline expires.
+"""
+
+import asyncio
+import logging
+import re
+import time
+from typing import Any, Awaitable, Callable, List, Optional
+
+# Status codes that mean "this model will never work for us", not "try again"
+HARD_STATUS_CODES = (402, 403, 410)
+
+_STATUS_RE = re.compile(r"\b(402|403|410)\b")
+
+
+def hard_status(error: BaseException) -> Optional[int]:
+    """Return the hard HTTP status carried by a provider error, if any."""
+    response = getattr(error, "response", None)
+    status = getattr(response, "status_code", None)
+    if status in HARD_STATUS_CODES:
+        return status
+    match = _STATUS_RE.search(str(error))
+    return int(match.group(1)) if match else None
+
+
+class FanOutResult:
+    def __init__(self, n: int):
+        self.results: List[Any] = [None] * n
+        self.errors: List[BaseException] = []
+        self.fatal: Optional[BaseException] = None
+        self.fatal_status: Optional[int] = None
+        self.timed_out = False
+        self.cancelled = 0
+
+    @property
+    def completed(self) -> List[Any]:
+        return [r for r in self.results if r is not None]
+
+
+async def fan_out(
+    job: Callable[[int], Awaitable[Any]],
+    n: int,
+    concurrency: int,
+    deadline: Optional[float] = None,
+) -> FanOutResult:
+    """
+    Run job(0..n-1) with at most `concurrency` in flight.
+    `deadline` is a relative timeout in seconds for the whole fan-out.
+    Work run via asyncio.to_thread can't be interrupted; cancelling only stops
+    us waiting on it, and queued jobs never start.
+    """
+    outcome = FanOutResult(n)
+    semaphore = asyncio.Semaphore(max(1, concurrency))
+
+    async def bounded(i: int):
+        async with semaphore:
+            return i, await job(i)
+
+    pending = {asyncio.create_task(bounded(i)) for i in range(n)}
+    end = time.monotonic() + deadline if deadline else None
+    try:
+        while pending:
+            timeout = None
+            if end is not None:
+                timeout = end - time.monotonic()
+                if timeout <= 0:
+                    outcome.timed_out = True
+                    break
+            done, pending = await asyncio.wait(pending, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+            if not done:
+                outcome.timed_out = True
+                break
+            for task in done:
+                error = task.exception()
+                if error is None:
+                    i, value = task.result()
+                    outcome.results[i] = value
+                    continue
+                status = hard_status(error)
+                if status is not None:
+                    outcome.fatal, outcome.fatal_status = error, status
+                else:
+                    outcome.errors.append(error)
+            if outcome.fatal is not None:
+                break
+    finally:
+        outcome.cancelled = len(pending)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.gather(*pending, return_exceptions=True)
+
+    if outcome.timed_out:
+        logging.warning(f"Fan-out deadline reached: {len(outcome.completed)}/{n} done, {outcome.cancelled} cancelled")
+    return outcome
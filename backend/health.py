@@ -0,0 +1,167 @@
+"""
+Provider/model health registry with a circuit breaker for the image fallback chain.
+Tracks success rate, latency EWMA and the last error class per key
+("huggingface", "huggingface:<model>", "replicate", "openrouter"), opens the
+circuit on keys that keep failing or are permanently gone, lets a single probe
+through once the cooldown expires (half-open), and orders fallback candidates
+by expected cost.
+"""
+
+import math
+import os
+import time
+from collections import deque
+from typing import Callable, Dict, Iterable, List, Optional
+
+HEALTH_FAILURE_THRESHOLD = int(os.getenv("HEALTH_FAILURE_THRESHOLD", "3"))
+HEALTH_BASE_COOLDOWN = float(os.getenv("HEALTH_BASE_COOLDOWN", "30"))
+HEALTH_MAX_COOLDOWN = float(os.getenv("HEALTH_MAX_COOLDOWN", "600"))
+HEALTH_PERMANENT_COOLDOWN = float(os.getenv("HEALTH_PERMANENT_COOLDOWN", "3600"))
+HEALTH_PROBE_TIMEOUT = float(os.getenv("HEALTH_PROBE_TIMEOUT", "120"))
+HEALTH_EWMA_ALPHA = float(os.getenv("HEALTH_EWMA_ALPHA", "0.3"))
+# Latency assumed for keys with no samples yet, so untried providers aren't starved
+HEALTH_PRIOR_LATENCY = float(os.getenv("HEALTH_PRIOR_LATENCY", "10"))
+# Recent successful latencies kept per key for percentile estimates (hedging)
+HEALTH_LATENCY_WINDOW = int(os.getenv("HEALTH_LATENCY_WINDOW", "100"))
+
+CLOSED = "closed"
+OPEN = "open"
+HALF_OPEN = "half_open"
+
+# Error classes that mean the key won't recover by retrying soon
+PERMANENT_ERRORS = {"payment_required", "forbidden", "gone"}
+
+
+def classify_status(status: Optional[int]) -> str:
+    return {
+        402: "payment_required",
+        403: "forbidden",
+        410: "gone",
+        429: "rate_limited",
+    }.get(status, "error")
+
+
+class ProviderHealth:
+    def __init__(self, key: str):
+        self.key = key
+        self.successes = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.latency_ewma: Optional[float] = None
+        self.last_error_class: Optional[str] = None
+        self.last_error_at: Optional[float] = None
+        self.state = CLOSED
+        self.open_until = 0.0
+        self.times_opened = 0
+        self.probe_started: Optional[float] = None
+        self.recent_latencies: deque = deque(maxlen=HEALTH_LATENCY_WINDOW)
+
+    @property
+    def success_rate(self) -> float:
+        # Laplace-smoothed so one early failure doesn't zero a provider out
+        return (self.successes + 1) / (self.successes + self.failures + 2)
+
+    @property
+    def expected_cost(self) -> float:
+        latency = self.latency_ewma if self.latency_ewma is not None else HEALTH_PRIOR_LATENCY
+        return latency / self.success_rate
+
+    def observe_latency(self, latency: float) -> None:
+        if self.latency_ewma is None:
+            self.latency_ewma = latency
+        else:
+            self.latency_ewma = HEALTH_EWMA_ALPHA * latency + (1 - HEALTH_EWMA_ALPHA) * self.latency_ewma
+
+    def latency_percentile(self, q: float) -> Optional[float]:
+        """Nearest-rank q-th percentile (0-100) of recent successful latencies; None without samples."""
+        if not self.recent_latencies:
+            return None
+        ordered = sorted(self.recent_latencies)
+        return ordered[max(0, math.ceil(q / 100 * len(ordered)) - 1)]
+
+    def to_dict(self, now: float) -> dict:
+        return {
+            "state": self.state,
+            "successes": self.successes,
+            "failures": self.failures,
+            "consecutive_failures": self.consecutive_failures,
+            "success_rate": round(self.success_rate, 3),
+            "latency_ewma_s": round(self.latency_ewma, 3) if self.latency_ewma is not None else None,
+            "latency_p90_s": round(self.latency_percentile(90), 3) if self.recent_latencies else None,
+            "expected_cost": round(self.expected_cost, 3),
+            "last_error_class": self.last_error_class,
+            "retry_in_s": round(max(0.0, self.open_until - now), 1) if self.state == OPEN else 0.0,
+            "times_opened": self.times_opened,
+        }
+
+
+class HealthRegistry:
+    def __init__(self, clock: Callable[[], float] = time.monotonic):
+        self.clock = clock
+        self.entries: Dict[str, ProviderHealth] = {}
+
+    def get(self, key: str) -> ProviderHealth:
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = self.entries[key] = ProviderHealth(key)
+        return entry
+
+    def allow(self, key: str) -> bool:
+        """
+        Whether a call to `key` should be attempted now.
+        An open circuit turns half-open after its cooldown and admits one probe;
+        a probe that never reports back is abandoned after HEALTH_PROBE_TIMEOUT.
+        """
+        entry = self.get(key)
+        now = self.clock()
+        if entry.state == CLOSED:
+            return True
+        if entry.state == OPEN:
+            if now < entry.open_until:
+                return False
+            entry.state = HALF_OPEN
+            entry.probe_started = None
+        if entry.probe_started is not None and now - entry.probe_started < HEALTH_PROBE_TIMEOUT:
+            return False
+        entry.probe_started = now
+        return True
+
+    def record_success(self, key: str, latency: float) -> None:
+        entry = self.get(key)
+        entry.successes += 1
+        entry.consecutive_failures = 0
+        entry.observe_latency(latency)
+        entry.recent_latencies.append(latency)
+        entry.state = CLOSED
+        entry.times_opened = 0
+        entry.probe_started = None
+
+    def record_failure(self, key: str, error_class: str = "error", latency: Optional[float] = None) -> None:
+        entry = self.get(key)
+        now = self.clock()
+        entry.failures += 1
+        entry.consecutive_failures += 1
+        entry.last_error_class = error_class
+        entry.last_error_at = now
+        entry.probe_started = None
+        if latency is not None:
+            entry.observe_latency(latency)
+
+        if error_class in PERMANENT_ERRORS:
+            self._open(entry, HEALTH_PERMANENT_COOLDOWN)
+        elif entry.state == HALF_OPEN or entry.consecutive_failures >= HEALTH_FAILURE_THRESHOLD:
+            cooldown = min(HEALTH_BASE_COOLDOWN * (2 ** entry.times_opened), HEALTH_MAX_COOLDOWN)
+            self._open(entry, cooldown)
+
+    def _open(self, entry: ProviderHealth, cooldown: float) -> None:
+        entry.state = OPEN
+        entry.open_until = self.clock() + cooldown
+        entry.times_opened += 1
+
+    def order(self, keys: Iterable[str]) -> List[str]:
+        """Sort candidates by expected cost; ties keep the given (static) priority."""
+        return sorted(keys, key=lambda k: self.get(k).expected_cost)
+
+    def snapshot(self) -> dict:
+        now = self.clock()
+        return {key: entry.to_dict(now) for key, entry in sorted(self.entries.items())}
@@ -0,0 +1,154 @@
+"""
+Hedged requests across an ordered list of providers.
+The first candidate starts immediately; if it hasn't answered within its hedge
+delay (a latency percentile supplied by the caller) the next one starts too,
+and a failed attempt starts the next one right away. The first successful
+result wins and the other attempts are cancelled. Extra attempts launched by
+the hedge timer (not failovers) spend from a HedgeBudget, which refills by a
+fixed fraction of each request, so duplicate upstream spend stays bounded;
+a hedge refused for lack of budget is retried every HEDGE_MIN_DELAY.
+
+Cancelling a loser frees the request immediately, but a provider call already
+running in a worker thread (HF, Replicate) still finishes in the background;
+that's the spend the budget accounts for.
+"""
+
+import asyncio
+import logging
+import os
+import threading
+import time
+from typing import Any, Awaitable, Callable, Dict, List, Optional, Tuple
+
+# Off by default: providers are tried strictly one after another
+IMAGE_HEDGING = os.getenv("IMAGE_HEDGING", "false").lower() in ("1", "true", "yes")
+# Start the next provider once the current one is slower than this percentile of its successes
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "90"))
+# Hedge delay for providers with fewer than HEDGE_MIN_SAMPLES successes, and the floor for all
+HEDGE_DEFAULT_DELAY = float(os.getenv("HEDGE_DEFAULT_DELAY", "8"))
+HEDGE_MIN_DELAY = float(os.getenv("HEDGE_MIN_DELAY", "0.5"))
+HEDGE_MIN_SAMPLES = int(os.getenv("HEDGE_MIN_SAMPLES", "5"))
+# At most this many providers in flight for one request
+HEDGE_MAX_PARALLEL = int(os.getenv("HEDGE_MAX_PARALLEL", "2"))
+# Hedges allowed per request on average (0.2 = at most ~20% extra calls), plus a small burst
+HEDGE_BUDGET_RATIO = float(os.getenv("HEDGE_BUDGET_RATIO", "0.2"))
+HEDGE_BUDGET_BURST = float(os.getenv("HEDGE_BUDGET_BURST", "3"))
+
+
+class HedgeBudget:
+    """Each request deposits `ratio` tokens (capped at `burst`); each hedge costs one."""
+
+    def __init__(self, ratio: float = HEDGE_BUDGET_RATIO, burst: float = HEDGE_BUDGET_BURST):
+        self.ratio = ratio
+        self.burst = burst
+        self.tokens = burst
+        self.requests = 0
+        self.hedges = 0
+        self.hedge_wins = 0
+        self.denied = 0
+        self.deadline_misses = 0
+        self._lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self._lock:
+            self.requests += 1
+            self.tokens = min(self.burst, self.tokens + self.ratio)
+
+    def try_spend(self, retry: bool = False) -> bool:
+        """Take a token for a hedge; a `retry` of a refused hedge isn't counted as denied again."""
+        with self._lock:
+            if self.tokens >= 1:
+                self.tokens -= 1
+                self.hedges += 1
+                return True
+            if not retry:
+                self.denied += 1
+            return False
+
+    def stats(self) -> dict:
+        return {
+            "requests": self.requests,
+            "hedges": self.hedges,
+            "hedge_wins": self.hedge_wins,
+            "denied": self.denied,
+            "deadline_misses": self.deadline_misses,
+            "tokens": round(self.tokens, 2),
+            "extra_call_ratio": round(self.hedges / self.requests, 3) if self.requests else 0.0,
+        }
+
+
+async def hedged(
+    candidates: List[Tuple[str, Callable[[], Awaitable[Any]]]],
+    hedge_delay: Callable[[str], float],
+    budget: Optional[HedgeBudget],
+    deadline: Optional[float] = None,
+    max_parallel: int = HEDGE_MAX_PARALLEL,
+) -> Tuple[Optional[str], Any]:
+    """
+    Run (name, start) candidates hedged; `start()` returns a result or None/raises
+    on failure. Returns (winner name, result), or (None, None) if every candidate
+    failed or `deadline` seconds passed first. With budget=None nothing is hedged:
+    candidates run strictly one after another (still bounded by the deadline).
+    """
+    if budget is not None:
+        budget.deposit()
+    queue = list(candidates)
+    running: Dict[asyncio.Task, str] = {}
+    order: List[str] = []
+    stop_at = time.monotonic() + deadline if deadline else None
+    next_hedge_at: Optional[float] = None
+    # Attempts started by the hedge timer; only their wins are hedge wins
+    hedges = set()
+    refused = False
+
+    def launch() -> asyncio.Task:
+        nonlocal next_hedge_at, refused
+        name, start = queue.pop(0)
+        task = asyncio.ensure_future(start())
+        running[task] = name
+        order.append(name)
+        next_hedge_at = time.monotonic() + max(HEDGE_MIN_DELAY, hedge_delay(name))
+        refused = False
+        return task
+
+    try:
+        launch()
+        while running:
+            now = time.monotonic()
+            hedge_at = next_hedge_at if budget is not None and queue else None
+            wake = [t for t in (hedge_at, stop_at) if t is not None]
+            timeout = max(0.0, min(wake) - now) if wake else None
+            done, _ = await asyncio.wait(running, timeout=timeout, return_when=asyncio.FIRST_COMPLETED)
+
+            for task in done:
+                name = running.pop(task)
+                try:
+                    result = task.result()
+                except Exception as e:
+                    logging.warning(f"Hedged attempt {name} failed: {e}")
+                    result = None
+                if result is not None:
+                    if task in hedges:
+                        budget.hedge_wins += 1
+                    return name, result
+                if queue:
+                    launch()  # failover, not a hedge: no budget spent
+
+            now = time.monotonic()
+            if stop_at is not None and now >= stop_at:
+                if budget is not None:
+                    budget.deadline_misses += 1
+                logging.warning(f"Request deadline ({deadline}s) reached with {len(running)} attempt(s) still running")
+                return None, None
+            if budget is not None and not done and queue and next_hedge_at is not None and now >= next_hedge_at:
+                if len(running) < max_parallel and budget.try_spend(retry=refused):
+                    logging.info(f"{order[-1]} slower than its hedge delay, also starting {queue[0][0]}")
+                    hedges.add(launch())
+                else:
+                    # Try again later: the budget may have refilled or an attempt finished by then
+                    next_hedge_at = now + HEDGE_MIN_DELAY
+                    refused = refused or len(running) < max_parallel
+        return None, None
+    finally:
+        for task in running:
+            task.cancel()
@@ -0,0 +1,47 @@
+"""
+Compact append-only message log for chat sessions.
+Messages are stored as plain tuples with a 1-based sequence number, so a turn
+appends O(1) data and readers page through with an `after` cursor instead of
+re-validating the whole conversation on every request.
+"""
+
+from typing import Iterable, List, Optional, Tuple
+
+# (role, content, images) - images is a tuple of URLs, or None for text-only
+Entry = Tuple[str, str, Optional[Tuple[str, ...]]]
+
+HISTORY_PAGE_DEFAULT = 50
+HISTORY_PAGE_MAX = 500
+
+
+class MessageLog:
+    __slots__ = ("_entries",)
+
+    def __init__(self, entries: Iterable[Entry] = ()):
+        self._entries: List[Entry] = list(entries)
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def cursor(self) -> int:
+        """Sequence number of the newest message (0 when empty)."""
+        return len(self._entries)
+
+    def append(self, role: str, content: str, images: Optional[Iterable[str]] = None) -> int:
+        self._entries.append((role, content, tuple(images) if images is not None else None))
+        return len(self._entries)
+
+    @staticmethod
+    def _to_dict(seq: int, entry: Entry) -> dict:
+        role, content, images = entry
+        return {"seq": seq, "role": role, "content": content, "images": list(images) if images is not None else None}
+
+    def page(self, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT) -> List[dict]:
+        """Messages with seq > after, oldest first, at most `limit` of them."""
+        after = max(0, after)
+        limit = max(1, min(limit, HISTORY_PAGE_MAX))
+        return [self._to_dict(after + i + 1, e) for i, e in enumerate(self._entries[after:after + limit])]
+
+    def to_dicts(self) -> List[dict]:
+        return [self._to_dict(i + 1, e) for i, e in enumerate(self._entries)]
@@ -0,0 +1,113 @@
+"""
+Content-addressed image blob store backing GET /images/{id}.
+Images are written once under IMAGE_STORE_DIR as <sha256>.<ext>; the file name
+is the image ID, so the same bytes always map to the same ID and URL.
+"""
+
+import base64
+import hashlib
+import os
+import re
+import tempfile
+from io import BytesIO
+from typing import Optional, Tuple
+
+IMAGE_STORE_DIR = os.getenv("IMAGE_STORE_DIR", os.path.join(tempfile.gettempdir(), "vizzy-images"))
+# png (lossless), webp or jpeg; quality applies to the lossy formats
+IMAGE_STORE_FORMAT = os.getenv("IMAGE_STORE_FORMAT", "png").lower()
+IMAGE_STORE_QUALITY = int(os.getenv("IMAGE_STORE_QUALITY", "85"))
+# url = responses carry /images/{id} URLs; inline = legacy base64 data URLs
+IMAGE_DELIVERY = os.getenv("IMAGE_DELIVERY", "url").lower()
+# Prefix for image URLs, e.g. https://api.example.com; empty = root-relative paths
+PUBLIC_BASE_URL = os.getenv("PUBLIC_BASE_URL", "").rstrip("/")
+
+CONTENT_TYPES = {
+    "png": "image/png",
+    "webp": "image/webp",
+    "jpg": "image/jpeg",
+    "svg": "image/svg+xml",
+    "avif": "image/avif",
+}
+_PIL_FORMATS = {"png": "PNG", "webp": "WEBP", "jpeg": "JPEG", "jpg": "JPEG"}
+
+IMAGE_ID_RE = re.compile(r"^[0-9a-f]{64}\.(png|webp|jpg|svg|avif)$")
+
+
+class ImageStore:
+    def __init__(self, directory: str = IMAGE_STORE_DIR):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+
+    def path(self, image_id: str) -> Optional[str]:
+        """Filesystem path for a valid, existing image ID, else None."""
+        if not IMAGE_ID_RE.match(image_id):
+            return None
+        path = os.path.join(self.directory, image_id)
+        return path if os.path.exists(path) else None
+
+    def put_bytes(self, data: bytes, ext: str) -> str:
+        image_id = f"{hashlib.sha256(data).hexdigest()}.{ext}"
+        self.put_named(image_id, data)
+        return image_id
+
+    def put_named(self, image_id: str, data: bytes) -> None:
+        """Store under a caller-derived ID (e.g. a hash of source + transform, for variants)."""
+        if not IMAGE_ID_RE.match(image_id):
+            raise ValueError(f"Invalid image ID {image_id!r}")
+        path = os.path.join(self.directory, image_id)
+        if not os.path.exists(path):
+            tmp = f"{path}.{os.getpid()}.tmp"
+            with open(tmp, "wb") as f:
+                f.write(data)
+            os.replace(tmp, path)
+
+    def put_pil(self, image, fmt: str = IMAGE_STORE_FORMAT, quality: int = IMAGE_STORE_QUALITY) -> str:
+        """Encode a PIL image (CPU-bound; call via asyncio.to_thread) and store it."""
+        pil_format = _PIL_FORMATS.get(fmt, "PNG")
+        buffered = BytesIO()
+        if pil_format == "JPEG":
+            image = image.convert("RGB")
+        save_kwargs = {} if pil_format == "PNG" else {"quality": quality}
+        image.save(buffered, format=pil_format, **save_kwargs)
+        ext = "jpg" if pil_format == "JPEG" else pil_format.lower()
+        return self.put_bytes(buffered.getvalue(), ext)
+
+
+def image_url(image_id: str) -> str:
+    return f"{PUBLIC_BASE_URL}/images/{image_id}"
+
+
+def etag_for(image_id: str) -> str:
+    # The ID is the content hash, so it is a strong validator as-is
+    return f'"{image_id.split(".")[0]}"'
+
+
+def encode_data_url(image) -> str:
+    """Legacy inline delivery: PIL image -> data:image/png;base64,..."""
+    buffered = BytesIO()
+    image.save(buffered, format="PNG")
+    return f"data:image/png;base64,{base64.b64encode(buffered.getvalue()).decode()}"
+
+
+def parse_range(header: str, size: int) -> Optional[Tuple[int, int]]:
+    """
+    Parse a single `bytes=start-end` range into inclusive (start, end).
+    Returns None for headers we don't handle (serve the full body);
+    raises ValueError when the range can't be satisfied (416).
+    """
+    match = re.fullmatch(r"\s*bytes=(\d*)-(\d*)\s*", header or "")
+    if not match or (not match.group(1) and not match.group(2)):
+        return None
+    start_s, end_s = match.groups()
+    if start_s:
+        start = int(start_s)
+        end = min(int(end_s), size - 1) if end_s else size - 1
+    else:
+        # Suffix range: last N bytes
+        length = int(end_s)
+        if length == 0:
+            raise ValueError("empty suffix range")
+        start, end = max(0, size - length), size - 1
+    if start >= size or start > end:
+        raise ValueError("range not satisfiable")
+    return start, end
@@ -0,0 +1,174 @@
+"""
+Post-processing of stored images for GET /images/{id}?w=...: thumbnails at
+configured widths, re-encoding to AVIF/WebP/JPEG chosen from the Accept header,
+and metadata stripping. Encoding runs in a process pool (CPU-bound work would
+otherwise hold the GIL against the event loop) and every output is written back
+to the content-addressed store, keyed by a hash of source ID + size + format +
+quality, so each variant is encoded once.
+"""
+
+import asyncio
+import concurrent.futures
+import hashlib
+import logging
+import os
+import re
+from io import BytesIO
+from typing import List, Optional, Tuple
+
+from cache import SingleFlight
+
+# Allowed thumbnail widths (px); requests snap up to the nearest one
+IMAGE_THUMBNAIL_SIZES = sorted(int(s) for s in os.getenv("IMAGE_THUMBNAIL_SIZES", "256,512,1024").split(",") if s.strip())
+IMAGE_VARIANT_QUALITY = int(os.getenv("IMAGE_VARIANT_QUALITY", "80"))
+# Preferred output formats, best first; only those Pillow can encode here are offered
+IMAGE_VARIANT_FORMATS = [f.strip() for f in os.getenv("IMAGE_VARIANT_FORMATS", "avif,webp,jpeg").split(",") if f.strip()]
+# Encoder processes (0 = encode in a thread instead, e.g. where fork is unavailable)
+IMAGE_POOL_WORKERS = int(os.getenv("IMAGE_POOL_WORKERS", str(min(4, os.cpu_count() or 1))))
+
+MIME_TYPES = {"avif": "image/avif", "webp": "image/webp", "jpeg": "image/jpeg"}
+EXTENSIONS = {"avif": "avif", "webp": "webp", "jpeg": "jpg"}
+_PIL_FORMATS = {"avif": "AVIF", "webp": "WEBP", "jpeg": "JPEG"}
+
+
+def supported_formats() -> List[str]:
+    from PIL import features
+
+    checks = {"avif": lambda: features.check("avif"), "webp": lambda: features.check("webp"), "jpeg": lambda: True}
+    available = []
+    for fmt in IMAGE_VARIANT_FORMATS:
+        try:
+            if fmt in checks and checks[fmt]():
+                available.append(fmt)
+        except Exception:
+            pass
+    return available or ["jpeg"]
+
+
+def negotiate_format(accept: Optional[str], available: List[str]) -> str:
+    """
+    Pick the first of `available` (server preference order) the client accepts
+    with q > 0. JPEG is the fallback every client can show.
+    """
+    accepted = {}
+    for part in (accept or "").split(","):
+        media, _, params = part.strip().partition(";")
+        match = re.search(r"q=([0-9.]+)", params)
+        accepted[media.strip().lower()] = float(match.group(1)) if match else 1.0
+    for fmt in available:
+        mime = MIME_TYPES[fmt]
+        q = accepted.get(mime, accepted.get("image/*", 0.0) if fmt == "jpeg" else 0.0)
+        if q > 0:
+            return fmt
+    return "jpeg"
+
+
+def snap_width(width: Optional[int]) -> Optional[int]:
+    """Smallest configured size >= width (largest if none); None = keep full size."""
+    if not width:
+        return None
+    for size in IMAGE_THUMBNAIL_SIZES:
+        if size >= width:
+            return size
+    return IMAGE_THUMBNAIL_SIZES[-1] if IMAGE_THUMBNAIL_SIZES else None
+
+
+def variant_id(source_id: str, width: Optional[int], fmt: str, quality: int) -> str:
+    digest = hashlib.sha256(f"{source_id}|{width or 0}|{fmt}|{quality}".encode()).hexdigest()
+    return f"{digest}.{EXTENSIONS[fmt]}"
+
+
+def render_variant(source_path: str, width: Optional[int], fmt: str, quality: int) -> bytes:
+    """
+    Runs in a pool worker: decode, drop metadata, downscale, encode.
+    Takes a path rather than bytes so large sources aren't pickled across processes.
+    """
+    from PIL import Image
+
+    with Image.open(source_path) as image:
+        image.load()
+        if fmt == "jpeg":
+            image = image.convert("RGB")
+        elif image.mode not in ("RGB", "RGBA"):
+            has_alpha = "A" in image.getbands() or "transparency" in image.info
+            image = image.convert("RGBA" if has_alpha else "RGB")
+        # Re-encoding from pixels alone drops EXIF / ICC / text chunks
+        image.info = {}
+        if width and image.width > width:
+            image.thumbnail((width, round(image.height * width / image.width)), Image.LANCZOS)
+        out = BytesIO()
+        image.save(out, format=_PIL_FORMATS[fmt], quality=quality)
+        return out.getvalue()
+
+
+class VariantEncoder:
+    def __init__(self, store, workers: int = IMAGE_POOL_WORKERS, quality: int = IMAGE_VARIANT_QUALITY):
+        self.store = store
+        self.workers = workers
+        self.quality = quality
+        self.formats: Optional[List[str]] = None
+        self.flight = SingleFlight()
+        self._pool: Optional[concurrent.futures.ProcessPoolExecutor] = None
+        self.encoded = 0
+        self.hits = 0
+        self.failures = 0
+
+    def available_formats(self) -> List[str]:
+        if self.formats is None:
+            self.formats = supported_formats()
+        return self.formats
+
+    def _executor(self) -> Optional[concurrent.futures.Executor]:
+        if self.workers <= 0:
+            return None
+        if self._pool is None:
+            self._pool = concurrent.futures.ProcessPoolExecutor(max_workers=self.workers)
+        return self._pool
+
+    async def get(self, source_id: str, width: Optional[int], accept: Optional[str]) -> Optional[Tuple[str, str]]:
+        """Return (variant image ID, path) for a stored source, encoding it on first request."""
+        source_path = self.store.path(source_id)
+        if source_path is None:
+            return None
+        fmt = negotiate_format(accept, self.available_formats())
+        image_id = variant_id(source_id, width, fmt, self.quality)
+        existing = self.store.path(image_id)
+        if existing is not None:
+            self.hits += 1
+            return image_id, existing
+
+        async def encode() -> Tuple[str, str]:
+            loop = asyncio.get_running_loop()
+            try:
+                data = await loop.run_in_executor(self._executor(), render_variant, source_path, width, fmt, self.quality)
+            except concurrent.futures.process.BrokenProcessPool:
+                # A worker died (OOM, killed): rebuild the pool next time, encode in a thread now
+                logging.warning("Image encoder pool broken; recreating")
+                self._pool = None
+                data = await asyncio.to_thread(render_variant, source_path, width, fmt, self.quality)
+            await asyncio.to_thread(self.store.put_named, image_id, data)
+            self.encoded += 1
+            return image_id, self.store.path(image_id)
+
+        try:
+            return await self.flight.do(image_id, encode)
+        except Exception as e:
+            self.failures += 1
+            logging.error(f"Variant {width}/{fmt} of {source_id} failed: {e}")
+            raise
+
+    def shutdown(self) -> None:
+        if self._pool is not None:
+            self._pool.shutdown(wait=False, cancel_futures=True)
+            self._pool = None
+
+    def stats(self) -> dict:
+        return {
+            "workers": self.workers,
+            "formats": self.available_formats(),
+            "sizes": IMAGE_THUMBNAIL_SIZES,
+            "encoded": self.encoded,
+            "hits": self.hits,
+            "failures": self.failures,
+            "coalesced": self.flight.coalesced,
+        }
@@ -0,0 +1,193 @@
+"""
+Intent resolution helpers for interpret_intent.
+
+- classify_intent(): local keyword rules for requests that are clearly one kind of
+  image ("a logo for my bakery", "portrait of an old fisherman"); returns the
+  intent and an enriched prompt with no LLM call, or None when unsure
+  (questions, negations, long or mixed requests go to the LLM)
+- IntentExtractor: tolerant incremental parser for the LLM's answer. Fed
+  streamed deltas, it reports `done` as soon as complete `intent` and
+  `prompt` string values have arrived, so the stream can be closed early.
+  Copes with code fences, prose around the object, single quotes, unquoted
+  keys and a truncated tail.
+- IntentStats: per-path counts and EWMAs of measured LLM latency, used to
+  estimate the time each fast / early-stopped resolution saved
+"""
+
+import json
+import os
+import re
+import threading
+from typing import Dict, Optional, Tuple
+
+INTENT_FAST_PATH = os.getenv("INTENT_FAST_PATH", "true").lower() in ("1", "true", "yes")
+INTENT_FAST_PATH_MAX_WORDS = int(os.getenv("INTENT_FAST_PATH_MAX_WORDS", "20"))
+# Close the intent completion stream once intent + prompt are parsed
+INTENT_EARLY_STOP = os.getenv("INTENT_EARLY_STOP", "true").lower() in ("1", "true", "yes")
+# Assumed full LLM intent latency until a few have been measured (seconds)
+INTENT_LLM_LATENCY_PRIOR = float(os.getenv("INTENT_LLM_LATENCY_PRIOR", "1.5"))
+
+# intent -> (rank, keywords, prompt suffix). Higher rank wins when a request
+# matches several (a logo of a fox is a logo); equal top ranks are ambiguous.
+RULES: Dict[str, Tuple[int, Tuple[str, ...], str]] = {
+    "logo": (3, ("logo", "logos", "icon", "emblem", "branding", "mascot", "monogram"),
+             "clean vector logo, simple shapes, flat colors, centered on a plain background"),
+    "poster": (3, ("poster", "flyer", "banner", "cover", "invitation", "postcard"),
+               "poster design, bold composition, space for a title"),
+    "portrait": (2, ("portrait", "headshot", "selfie", "face", "woman", "man", "girl", "boy", "person", "character"),
+                 "detailed portrait, expressive face, soft studio lighting"),
+    "animal": (2, ("cat", "cats", "dog", "dogs", "puppy", "kitten", "fox", "bird", "owl", "horse", "lion", "tiger",
+                   "wolf", "rabbit", "bear", "deer", "whale", "dolphin", "butterfly", "animal", "animals"),
+               "detailed animal art, natural pose, soft light"),
+    "product": (2, ("product", "packaging", "mockup", "bottle", "sneaker", "sneakers", "watch", "perfume"),
+                "product shot, studio lighting, clean background"),
+    "landscape": (1, ("landscape", "mountain", "mountains", "forest", "beach", "ocean", "sea", "lake", "valley",
+                      "sunset", "sunrise", "desert", "countryside", "waterfall", "meadow", "island", "river"),
+                  "wide landscape, atmospheric lighting, high detail"),
+    "architecture": (1, ("building", "house", "castle", "city", "cityscape", "skyline", "interior", "room",
+                         "cathedral", "tower", "street", "village"),
+                     "architectural scene, dramatic perspective, high detail"),
+    "abstract": (1, ("abstract", "pattern", "texture", "wallpaper", "fractal", "geometric"),
+                 "abstract composition, rich textures, harmonious colors"),
+}
+
+_KEYWORDS: Dict[str, str] = {kw: intent for intent, (_, kws, _) in RULES.items() for kw in kws}
+
+_WORD_RE = re.compile(r"[a-z0-9']+")
+# Anything conditional, negated, conversational or multi-part needs the LLM
+_UNSURE_RE = re.compile(
+    r"\?|\b(but|instead|not|no|without|except|unless|or|why|how|what|which|should|explain|help|change|edit|"
+    r"remove|replace|make it|then)\b"
+)
+_COMMAND_RE = re.compile(
+    r"^\s*(?:please\s+)?(?:(?:can|could|would|will)\s+you\s+)?(?:please\s+)?"
+    r"(?:create|generate|make|draw|paint|design|render|show|give|produce|sketch|illustrate|i want|i'd like|i need)?"
+    r"\s*(?:me\s+)?(?:(?:an?|the|some)\s+)?"
+    r"(?:(?:image|picture|photo|illustration|painting|drawing|render|artwork|art)s?\s+(?:of\s+)?)?",
+    re.IGNORECASE,
+)
+
+
+def classify_intent(message: str) -> Optional[Tuple[str, str]]:
+    """(intent, image prompt) for a clearly categorizable request, else None."""
+    text = message.strip()
+    lowered = text.lower()
+    words = _WORD_RE.findall(lowered)
+    if not words or len(words) > INTENT_FAST_PATH_MAX_WORDS or _UNSURE_RE.search(lowered):
+        return None
+    matched = {_KEYWORDS[w] for w in words if w in _KEYWORDS}
+    if not matched:
+        return None
+    top = max(RULES[i][0] for i in matched)
+    best = [i for i in matched if RULES[i][0] == top]
+    if len(best) != 1:
+        return None
+    intent = best[0]
+    subject = _COMMAND_RE.sub("", text, count=1).strip(" .!,") or text.strip(" .!,")
+    return intent, f"{subject}, {RULES[intent][2]}"
+
+
+_FIELD_RE = re.compile(
+    r"""["']?(intent|prompt)["']?\s*:\s*(?:"((?:[^"\\]|\\.)*)"|'((?:[^'\\]|\\.)*)')""",
+    re.DOTALL,
+)
+
+
+def _unescape(value: str) -> str:
+    try:
+        return json.loads(f'"{value}"')
+    except ValueError:
+        return value.replace('\\"', '"').replace("\\'", "'")
+
+
+class IntentExtractor:
+    """Feed completion text (whole or in deltas); read `intent` / `prompt` once `done`."""
+
+    def __init__(self):
+        self.buffer = ""
+        self.fields: Dict[str, str] = {}
+
+    @property
+    def done(self) -> bool:
+        return "intent" in self.fields and "prompt" in self.fields
+
+    def feed(self, delta: str) -> bool:
+        # Only values whose closing quote has arrived match, so partial strings are never taken
+        self.buffer += delta
+        start = self.buffer.find("{")
+        if start != -1:
+            for match in _FIELD_RE.finditer(self.buffer, start):
+                key = match.group(1)
+                if key not in self.fields:
+                    raw = match.group(2) if match.group(2) is not None else match.group(3)
+                    self.fields[key] = _unescape(raw).strip()
+        return self.done
+
+    def result(self) -> Optional[Tuple[str, Optional[str]]]:
+        """(intent, prompt or None) from whatever has been parsed; None if no intent at all."""
+        if not self.done:
+            # The complete object may still parse strictly (e.g. non-string values)
+            start, end = self.buffer.find("{"), self.buffer.rfind("}")
+            if start != -1 and end > start:
+                try:
+                    parsed = json.loads(self.buffer[start:end + 1])
+                    for key in ("intent", "prompt"):
+                        if isinstance(parsed, dict) and parsed.get(key) and key not in self.fields:
+                            self.fields[key] = str(parsed[key]).strip()
+                except ValueError:
+                    pass
+        if not self.fields.get("intent"):
+            return None
+        return self.fields["intent"], self.fields.get("prompt") or None
+
+
+class IntentStats:
+    """
+    Resolution counts per path and estimated time saved. A fast-path hit saves
+    what an LLM resolution currently costs (EWMA over llm_early + llm_full,
+    INTENT_LLM_LATENCY_PRIOR until measured); an early stop saves the gap to a
+    full completion, counted only once full completions have been measured.
+    """
+
+    MIN_FULL_SAMPLES = 3
+
+    def __init__(self, prior_s: float = INTENT_LLM_LATENCY_PRIOR, alpha: float = 0.2):
+        self.alpha = alpha
+        self.llm_latency_s = prior_s
+        self.full_latency_s = 0.0
+        self.full_samples = 0
+        self.counts: Dict[str, int] = {}
+        self.saved_s: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def record(self, path: str, elapsed_s: float) -> float:
+        """Count a resolution; returns the estimated seconds it saved."""
+        with self._lock:
+            self.counts[path] = self.counts.get(path, 0) + 1
+            saved = 0.0
+            if path == "fast":
+                saved = self.llm_latency_s
+            elif path in ("llm_early", "llm_full"):
+                self.llm_latency_s += self.alpha * (elapsed_s - self.llm_latency_s)
+                if path == "llm_full":
+                    self.full_samples += 1
+                    self.full_latency_s = elapsed_s if self.full_samples == 1 else (
+                        self.full_latency_s + self.alpha * (elapsed_s - self.full_latency_s))
+                elif self.full_samples >= self.MIN_FULL_SAMPLES:
+                    saved = max(0.0, self.full_latency_s - elapsed_s)
+            if saved:
+                self.saved_s[path] = self.saved_s.get(path, 0.0) + saved
+            return saved
+
+    def stats(self) -> dict:
+        with self._lock:
+            total = sum(self.counts.values())
+            return {
+                "fast_path": INTENT_FAST_PATH,
+                "early_stop": INTENT_EARLY_STOP,
+                "counts": dict(self.counts),
+                "fast_path_hit_rate": round(self.counts.get("fast", 0) / total, 3) if total else 0.0,
+                "llm_latency_ewma_s": round(self.llm_latency_s, 3),
+                "full_latency_ewma_s": round(self.full_latency_s, 3) if self.full_samples else None,
+                "saved_s": {k: round(v, 3) for k, v in self.saved_s.items()},
+            }
@@ -0,0 +1,294 @@
+"""
+In-process job queue for image generation (no external broker needed).
+POST /jobs enqueues a request and returns immediately; a fixed pool of asyncio
+workers drains a priority queue, and clients poll GET /jobs/{id} or receive a
+POST to their callback URL. Admission is refused (HTTP 429) per priority class
+before the queue fills, so high-priority work still gets in under load.
+
+Jobs run in the worker that accepted them. With a SharedCache for `records`
+(multi-worker mode) every status change is also written there (from a worker
+thread, since SQLite may wait on another process's lock), so GET /jobs/{id}
+works whichever worker the poll lands on. On shutdown drain()
+refuses new jobs and lets queued and running ones finish (up to a timeout)
+before the workers are cancelled.
+
+Callback URLs must name a host in JOB_CALLBACK_HOSTS (none by default, so
+callbacks are off) that resolves only to public addresses; the address check
+is repeated before delivery, so a host re-pointed at an internal address in
+the meantime isn't POSTed to.
+"""
+
+import asyncio
+import contextvars
+import ipaddress
+import itertools
+import logging
+import os
+import socket
+import time
+import urllib.parse
+import uuid
+from typing import Awaitable, Callable, Dict, Optional
+
+import upstream
+
+JOB_WORKERS = int(os.getenv("JOB_WORKERS", "4"))
+JOB_QUEUE_MAX = int(os.getenv("JOB_QUEUE_MAX", "100"))
+JOB_RESULT_TTL = float(os.getenv("JOB_RESULT_TTL", "3600"))
+# Hosts callback_url may point at, comma-separated; "*.example.com" also allows subdomains
+JOB_CALLBACK_HOSTS = [h.strip().lower() for h in os.getenv("JOB_CALLBACK_HOSTS", "").split(",") if h.strip()]
+
+# Lower number runs first
+PRIORITIES = {"high": 0, "normal": 1, "low": 2}
+# Fraction of JOB_QUEUE_MAX each class may fill before it is rejected
+ADMISSION_LIMITS = {"high": 1.0, "normal": 0.9, "low": 0.5}
+
+QUEUED = "queued"
+RUNNING = "running"
+SUCCEEDED = "succeeded"
+FAILED = "failed"
+
+
+class Draining(Exception):
+    """The queue is shutting down and accepts no new jobs."""
+
+
+class CallbackRejected(ValueError):
+    """A callback_url the server won't POST to."""
+
+
+class QueueFull(Exception):
+    def __init__(self, priority: str, depth: int):
+        super().__init__(f"Job queue full for priority '{priority}' (depth {depth})")
+        self.priority = priority
+        self.depth = depth
+
+
+def _host_allowed(host: str, allowed) -> bool:
+    for pattern in allowed:
+        if pattern.startswith("*."):
+            if host.endswith(pattern[1:]):
+                return True
+        elif host == pattern:
+            return True
+    return False
+
+
+async def check_callback_url(url: str, allowed=None) -> None:
+    """
+    Raise CallbackRejected unless `url` is http(s) to an allowed host whose
+    every resolved address is public (no private, loopback, link-local or
+    reserved ones).
+    """
+    parsed = urllib.parse.urlparse(url)
+    host = (parsed.hostname or "").lower()
+    if parsed.scheme not in ("http", "https") or not host:
+        raise CallbackRejected("callback_url must be an http(s) URL")
+    if not _host_allowed(host, JOB_CALLBACK_HOSTS if allowed is None else allowed):
+        raise CallbackRejected(f"callback_url host '{host}' is not in JOB_CALLBACK_HOSTS")
+    try:
+        port = parsed.port or (443 if parsed.scheme == "https" else 80)
+        infos = await asyncio.get_running_loop().getaddrinfo(host, port, type=socket.SOCK_STREAM)
+    except (OSError, ValueError) as e:
+        raise CallbackRejected(f"callback_url host '{host}' doesn't resolve: {e}")
+    for *_, sockaddr in infos:
+        address = ipaddress.ip_address(sockaddr[0].split("%")[0])
+        if isinstance(address, ipaddress.IPv6Address) and address.ipv4_mapped:
+            address = address.ipv4_mapped
+        if not address.is_global or address.is_multicast:
+            raise CallbackRejected(f"callback_url host '{host}' resolves to non-public address {address}")
+
+
+class Job:
+    def __init__(self, request: dict, priority: str, callback_url: Optional[str]):
+        self.id = uuid.uuid4().hex
+        self.request = request
+        self.priority = priority
+        self.callback_url = callback_url
+        self.status = QUEUED
+        self.created_at = time.time()
+        self.started_at: Optional[float] = None
+        self.finished_at: Optional[float] = None
+        self.result: Optional[dict] = None
+        self.error: Optional[str] = None
+
+    def to_dict(self) -> dict:
+        return {
+            "job_id": self.id,
+            "status": self.status,
+            "priority": self.priority,
+            "created_at": self.created_at,
+            "started_at": self.started_at,
+            "finished_at": self.finished_at,
+            "queue_wait_ms": round((self.started_at - self.created_at) * 1000, 1) if self.started_at else None,
+            "result": self.result,
+            "error": self.error,
+        }
+
+
+class LocalJobQueue:
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable[dict]],
+        workers: int = JOB_WORKERS,
+        max_depth: int = JOB_QUEUE_MAX,
+        result_ttl: float = JOB_RESULT_TTL,
+        records=None,
+    ):
+        self.handler = handler
+        self.records = records
+        self.draining = False
+        self.num_workers = workers
+        self.max_depth = max_depth
+        self.result_ttl = result_ttl
+        self.jobs: Dict[str, Job] = {}
+        self.running = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self._queue: Optional[asyncio.PriorityQueue] = None
+        self._workers: list = []
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._seq = itertools.count()
+
+    @property
+    def depth(self) -> int:
+        return self._queue.qsize() if self._queue is not None else 0
+
+    def _ensure_workers(self) -> None:
+        # Queue and workers belong to the loop that first submits work
+        loop = asyncio.get_running_loop()
+        if self._loop is loop and self._workers:
+            return
+        self._loop = loop
+        self._queue = asyncio.PriorityQueue()
+        # Fresh contexts: created inside the first POST /jobs, the workers would otherwise
+        # inherit that request's contextvars (its trace, session, tier) for good
+        self._workers = [
+            asyncio.create_task(self._worker(i), context=contextvars.Context()) for i in range(self.num_workers)
+        ]
+
+    async def submit(self, request: dict, priority: str = "normal", callback_url: Optional[str] = None) -> Job:
+        """
+        Enqueue a job or raise QueueFull if its priority class is over its
+        admission limit, CallbackRejected if callback_url isn't allowed.
+        """
+        if priority not in PRIORITIES:
+            raise ValueError(f"Unknown priority '{priority}'")
+        if self.draining:
+            raise Draining()
+        if callback_url:
+            await check_callback_url(callback_url)
+        self._ensure_workers()
+        self._prune()
+        if self.depth >= int(self.max_depth * ADMISSION_LIMITS[priority]):
+            self.rejected += 1
+            raise QueueFull(priority, self.depth)
+        job = Job(request, priority, callback_url)
+        self.jobs[job.id] = job
+        self._queue.put_nowait((PRIORITIES[priority], next(self._seq), job))
+        await self._apublish(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Job]:
+        return self.jobs.get(job_id)
+
+    async def lookup(self, job_id: str) -> Optional[dict]:
+        """Job status as a dict, from this worker or (multi-worker mode) whichever worker ran it."""
+        job = self.jobs.get(job_id)
+        if job is not None:
+            return job.to_dict()
+        if self.records is not None:
+            return await asyncio.to_thread(self.records.get, job_id)
+        return None
+
+    def _publish(self, job: Job) -> None:
+        if self.records is not None:
+            self.records.put(job.id, job.to_dict(), ttl=self.result_ttl)
+
+    async def _apublish(self, job: Job) -> None:
+        if self.records is not None:
+            await asyncio.to_thread(self._publish, job)
+
+    def _prune(self) -> None:
+        cutoff = time.time() - self.result_ttl
+        expired = [jid for jid, j in self.jobs.items() if j.finished_at and j.finished_at < cutoff]
+        for jid in expired:
+            del self.jobs[jid]
+
+    async def _worker(self, n: int) -> None:
+        while True:
+            _, _, job = await self._queue.get()
+            try:
+                await self._run(job)
+                if job.callback_url:
+                    await self._deliver_callback(job)
+            finally:
+                # Only now is the job done as far as drain() is concerned
+                self._queue.task_done()
+
+    async def _run(self, job: Job) -> None:
+        job.status = RUNNING
+        job.started_at = time.time()
+        self.running += 1
+        try:
+            await self._apublish(job)
+            job.result = await self.handler(job)
+            job.status = SUCCEEDED
+            self.completed += 1
+        except asyncio.CancelledError:
+            job.status = FAILED
+            job.error = "cancelled"
+            raise
+        except Exception as e:
+            logging.error(f"Job {job.id} failed: {e}")
+            job.status = FAILED
+            job.error = str(e)[:500]
+            self.failed += 1
+        finally:
+            job.finished_at = time.time()
+            self.running -= 1
+            await self._apublish(job)
+
+    async def _deliver_callback(self, job: Job) -> None:
+        try:
+            await check_callback_url(job.callback_url)
+            response = await upstream.post_json(job.callback_url, job.to_dict(), timeout=10, max_retries=3)
+            if response.status_code >= 400:
+                logging.warning(f"Job {job.id} callback returned {response.status_code}")
+        except Exception as e:
+            logging.warning(f"Job {job.id} callback to {job.callback_url} failed: {e}")
+
+    async def drain(self, timeout: float) -> bool:
+        """Refuse new jobs and wait for queued/running ones; False if the timeout hit first."""
+        self.draining = True
+        if self._queue is None or (self.depth == 0 and self.running == 0):
+            return True
+        logging.info(f"Draining job queue: {self.depth} queued, {self.running} running")
+        try:
+            await asyncio.wait_for(self._queue.join(), timeout=timeout)
+            return True
+        except asyncio.TimeoutError:
+            logging.warning(f"Job drain timed out after {timeout}s with {self.depth} queued, {self.running} running")
+            return False
+
+    async def stop(self) -> None:
+        for task in self._workers:
+            task.cancel()
+        if self._workers:
+            await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+
+    def stats(self) -> dict:
+        return {
+            "backend": "local",
+            "workers": self.num_workers,
+            "queue_depth": self.depth,
+            "queue_max": self.max_depth,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "rejected": self.rejected,
+            "draining": self.draining,
+            "admission_limits": {p: int(self.max_depth * f) for p, f in ADMISSION_LIMITS.items()},
+        }
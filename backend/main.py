@@ -4,97 +4,216 @@ Uses OpenRouter API for text generation (free tier via Mistral-7B).
 Images via Replicate (optional).
 """
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pydantic import BaseModel, Field, ConfigDict
-from typing import Optional, List
+from typing import Optional, List, Dict, AsyncIterator, Callable
 import os
 import json
 import uuid
-from datetime import datetime
+import asyncio
+import contextlib
+import contextvars
+import functools
+import time
 import urllib.parse
-from dotenv import load_dotenv
 import logging
-from huggingface_hub import InferenceClient
-
-# Try to import replicate, it's optional
-try:
-    import replicate
-    HAS_REPLICATE = True
-except ImportError:
-    HAS_REPLICATE = False
-    replicate = None
 
 # Configure logging FIRST
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
-# Load environment variables from explicit path
+# Load environment variables from explicit path, before the sibling modules
+# below read their config. Deployments without a .env skip importing dotenv.
 env_path = os.path.join(os.path.dirname(__file__), ".env")
 env_exists = os.path.exists(env_path)
 logging.info(f"Looking for .env at: {env_path}")
 logging.info(f".env file exists: {env_exists}")
 
-load_dotenv(env_path)
+if env_exists:
+    from dotenv import load_dotenv
+    load_dotenv(env_path)
+
+# Multi-worker mode (uvicorn reads WEB_CONCURRENCY as its --workers default):
+# sessions, caches, job records and rate-limit buckets must be visible to every
+# worker, so they move to node-local SQLite files unless configured otherwise.
+WEB_CONCURRENCY = int(os.getenv("WEB_CONCURRENCY", "1"))
+if WEB_CONCURRENCY > 1:
+    os.environ.setdefault("SESSION_BACKEND", "sqlite")
+    os.environ.setdefault("SHARED_STATE_DB", os.path.join(os.path.dirname(__file__), "shared_state.db"))
+# Seconds shutdown waits for in-flight requests (uvicorn) and queued/running jobs
+SHUTDOWN_DRAIN_TIMEOUT = float(os.getenv("SHUTDOWN_DRAIN_TIMEOUT", "30"))
+
+import httpx
+
+import upstream
+from pipeline import TaskGraph
+from fanout import fan_out
+from health import HealthRegistry, classify_status
+from cache import CompletionCache, ImageCache
+from history import HISTORY_PAGE_DEFAULT
+from session_store import create_session_store
+from jobs import LocalJobQueue, QueueFull, Draining, CallbackRejected, JOB_RESULT_TTL
+from batch import BatchRunner, BATCH_MAX_PROMPTS
+from ratelimit import RateLimitRegistry, RateLimited, RATE_LIMIT_MAX_WAIT, current_session
+import image_store
+import image_variants
+import placeholders
+import taste
+import similarity
+import metrics
+from providers import ProviderRegistry, WARMUP_PROVIDERS, module_available
+import hedge
+from degradation import LoadController, current_tier, degraded_label
+from intent import IntentExtractor, IntentStats, classify_intent, INTENT_FAST_PATH, INTENT_EARLY_STOP
+from shared_state import SharedCache, get_shared_state
+
+# replicate is optional; it's only imported when first used
+HAS_REPLICATE = module_available("replicate")
 
 # Clients / keys
 HUGGINGFACE_API_KEY = os.getenv("HUGGINGFACE_API_KEY")
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY")  # Free tier available
 REPLICATE_API_KEY = os.getenv("REPLICATE_API_KEY")
 
+# Image pipeline stage deadlines in seconds (0 disables the deadline)
+PIPELINE_INTENT_DEADLINE = float(os.getenv("PIPELINE_INTENT_DEADLINE", "20"))
+PIPELINE_IMAGES_DEADLINE = float(os.getenv("PIPELINE_IMAGES_DEADLINE", "120"))
+PIPELINE_COPY_DEADLINE = float(os.getenv("PIPELINE_COPY_DEADLINE", "20"))
+# Start generate_copy from the raw message before interpret_intent returns
+SPECULATIVE_COPY = os.getenv("SPECULATIVE_COPY", "true").lower() in ("1", "true", "yes")
+SPECULATIVE_INTENT = "creative"
+
+# HuggingFace per-image fan-out: parallel text_to_image calls per model
+# (HF_MODEL_CONCURRENCY="org/model=4,default=1") and an overall per-request deadline
+def _parse_limits(spec: str) -> Dict[str, int]:
+    """Parse "name=4,other=2" into {"name": 4, "other": 2}."""
+    return {
+        name.strip(): int(limit)
+        for name, _, limit in (item.partition("=") for item in spec.split(","))
+        if name.strip() and limit.strip().isdigit()
+    }
+
+
+HF_DEFAULT_CONCURRENCY = int(os.getenv("HF_DEFAULT_CONCURRENCY", "2"))
+HF_MODEL_CONCURRENCY = _parse_limits(os.getenv("HF_MODEL_CONCURRENCY", ""))
+# Concurrent generate_images calls per provider across all requests
+# (PROVIDER_CONCURRENCY="huggingface=4,replicate=2"); unset = unlimited
+PROVIDER_CONCURRENCY = _parse_limits(os.getenv("PROVIDER_CONCURRENCY", ""))
+HF_REQUEST_DEADLINE = float(os.getenv("HF_REQUEST_DEADLINE", "90"))
+# Tried first when load degradation asks for the fastest models
+HF_FAST_MODELS = [m.strip() for m in os.getenv("HF_FAST_MODELS", "black-forest-labs/FLUX.1-schnell").split(",") if m.strip()]
+# Whole generate_images call, across all providers; placeholders after (0 = no limit)
+IMAGE_REQUEST_DEADLINE = float(os.getenv("IMAGE_REQUEST_DEADLINE", "0"))
+
 # Debug: Log loaded API keys
 logging.info(f"REPLICATE_API_KEY set: {bool(REPLICATE_API_KEY)}")
 logging.info(f"OPENROUTER_API_KEY set: {bool(OPENROUTER_API_KEY)}")
 
-# Initialize HF client (deprecated, kept for compatibility)
-hf_client = None
 
-if HUGGINGFACE_API_KEY:
-    try:
-        hf_client = InferenceClient(token=HUGGINGFACE_API_KEY)
-        logging.info("Hugging Face InferenceClient initialized")
-    except Exception as e:
-        logging.warning("Failed to initialize HF client: %s", e)
+def _build_hf_client():
+    from huggingface_hub import InferenceClient
+    return InferenceClient(token=HUGGINGFACE_API_KEY)
+
+
+def _build_replicate():
+    # One client with the token, reused for every call: its httpx pool keeps connections warm
+    import replicate
+    return replicate.Client(api_token=REPLICATE_API_KEY)
+
+
+# Provider clients are built on first use (or by /warmup), not at import
+provider_clients = ProviderRegistry()
+provider_clients.register("huggingface", _build_hf_client, configured=lambda: bool(HUGGINGFACE_API_KEY))
+provider_clients.register("replicate", _build_replicate, configured=lambda: bool(REPLICATE_API_KEY) and HAS_REPLICATE)
+
+# Completion cache + request coalescing for generate_text
+completion_cache = CompletionCache()
 
-def generate_text(prompt: str, max_tokens: int = 300, temperature: float = 0.7) -> str:
+TEXT_MODEL = "openrouter/auto"  # Auto-selects best available free model
+# Cheaper model used when TEXT_MODEL is over its local rate limit (unset = shed instead)
+TEXT_FALLBACK_MODEL = os.getenv("TEXT_FALLBACK_MODEL", "")
+# Upper bound on max_tokens for any completion (interactive calls ask for 300; batches more)
+LLM_MAX_TOKENS = int(os.getenv("LLM_MAX_TOKENS", "2000"))
+
+# Token-bucket admission per provider / model (RATE_LIMITS, see ratelimit.py)
+rate_limits = RateLimitRegistry(shared=get_shared_state())
+
+
+def _openrouter_headers() -> dict:
+    return {
+        "Authorization": f"Bearer {OPENROUTER_API_KEY}",
+        "Content-Type": "application/json"
+    }
+
+
+async def generate_text(prompt: str, max_tokens: int = 300, temperature: float = 0.7) -> str:
     """
     Generate text using OpenRouter API (free tier available).
-    Falls back to simple keyword-based responses if API unavailable.
+    Identical calls are served from completion_cache (below its temperature
+    threshold) and concurrent duplicates share one upstream request.
     """
     if not OPENROUTER_API_KEY:
         raise RuntimeError("OPENROUTER_API_KEY not set in .env. Get a free key at https://openrouter.ai")
     
+    return await completion_cache.get_or_complete(
+        TEXT_MODEL,
+        prompt,
+        max_tokens,
+        temperature,
+        lambda: _generate_text_uncached(prompt, max_tokens, temperature),
+    )
+
+
+async def _generate_text_uncached(prompt: str, max_tokens: int, temperature: float) -> str:
+    """
+    Admit the call against the OpenRouter rate limits, downgrading to
+    TEXT_FALLBACK_MODEL when TEXT_MODEL can't be admitted in time.
+    Raises RateLimited when neither can (callers fall back to local defaults).
+    """
+    models = [TEXT_MODEL] + ([TEXT_FALLBACK_MODEL] if TEXT_FALLBACK_MODEL else [])
+    for model in models:
+        try:
+            async with rate_limits.limit("openrouter", f"openrouter:{model}"):
+                return await _openrouter_completion(model, prompt, max_tokens, temperature)
+        except RateLimited as e:
+            logging.warning(f"{e}; {'downgrading' if model != models[-1] else 'shedding'}")
+            metrics.fallback("llm_model", model)
+            limited = e
+    raise limited
+
+
+def _retry_after(response: httpx.Response, default: float = 10.0) -> float:
+    try:
+        return float(response.headers.get("Retry-After", default))
+    except ValueError:
+        return default
+
+
+async def _openrouter_completion(model: str, prompt: str, max_tokens: int, temperature: float) -> str:
+    """Single OpenRouter chat completion through the shared pooled client."""
     try:
-        import requests
-        
         # Use a fast, free model from OpenRouter
-        api_url = "https://openrouter.ai/api/v1/chat/completions"
+        api_url = f"{upstream.OPENROUTER_BASE_URL}/chat/completions"
         
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        headers = _openrouter_headers()
         
         payload = {
-            "model": "openrouter/auto",  # Auto-selects best available free model
+            "model": model,
             "messages": [{"role": "user", "content": prompt}],
-            "max_tokens": min(max_tokens, 500),
+            "max_tokens": min(max_tokens, LLM_MAX_TOKENS),
             "temperature": temperature,
         }
         
-        # Increased timeout for slower networks, with retry logic
-        import time
-        max_retries = 2
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(api_url, json=payload, headers=headers, timeout=45)
-                break
-            except requests.Timeout:
-                if attempt < max_retries - 1:
-                    logging.warning(f"OpenRouter timeout, retry {attempt + 1}/{max_retries}")
-                    time.sleep(1)
-                else:
-                    raise
+        # Timeout and retry/backoff handled by the upstream layer
+        with metrics.span("llm", provider="openrouter", model=model) as span:
+            response = await upstream.post_json(api_url, payload, headers=headers, max_retries=2, backoff=1.0)
+            if response.status_code != 200:
+                span.outcome = f"http_{response.status_code}"
         
+        if response.status_code == 429:
+            # Upstream limit is tighter than ours: hold further calls back locally
+            rate_limits.penalize(f"openrouter:{model}", _retry_after(response))
         if response.status_code != 200:
             logging.error(f"OpenRouter API error: {response.status_code} - {response.text[:200]}")
             raise RuntimeError(f"OpenRouter API returned status {response.status_code}")
@@ -116,6 +235,52 @@ def generate_text(prompt: str, max_tokens: int = 300, temperature: float = 0.7)
         raise
 
 
+async def generate_text_stream(prompt: str, max_tokens: int = 300, temperature: float = 0.7) -> AsyncIterator[str]:
+    """
+    Stream a completion from OpenRouter, yielding content deltas as they arrive.
+    A cached completion is yielded in one piece; a finished stream is cached.
+    """
+    if not OPENROUTER_API_KEY:
+        raise RuntimeError("OPENROUTER_API_KEY not set in .env. Get a free key at https://openrouter.ai")
+
+    cached = await completion_cache.peek(TEXT_MODEL, prompt, max_tokens, temperature)
+    if cached is not None:
+        yield cached
+        return
+
+    parts = []
+    async with contextlib.aclosing(_openrouter_stream(prompt, max_tokens, temperature)) as deltas:
+        async for delta in deltas:
+            parts.append(delta)
+            yield delta
+
+    text = "".join(parts).strip()
+    if not text:
+        raise ValueError("No generated text in OpenRouter stream")
+    await completion_cache.store(TEXT_MODEL, prompt, max_tokens, temperature, text)
+
+
+async def _openrouter_stream(prompt: str, max_tokens: int, temperature: float) -> AsyncIterator[str]:
+    """Uncached streaming OpenRouter completion of TEXT_MODEL: the content deltas."""
+    payload = {
+        "model": TEXT_MODEL,
+        "messages": [{"role": "user", "content": prompt}],
+        "max_tokens": min(max_tokens, LLM_MAX_TOKENS),
+        "temperature": temperature,
+        "stream": True,
+    }
+    # The lease is held for the whole stream so concurrency limits count open streams;
+    # aclosing() drops the upstream connection as soon as a consumer stops early
+    async with rate_limits.limit("openrouter", f"openrouter:{TEXT_MODEL}"):
+        url = f"{upstream.OPENROUTER_BASE_URL}/chat/completions"
+        async with contextlib.aclosing(upstream.stream_sse(url, payload, _openrouter_headers())) as chunks:
+            async for chunk in chunks:
+                choices = chunk.get("choices") or []
+                delta = choices[0].get("delta", {}).get("content") if choices else None
+                if delta:
+                    yield delta
+
+
 app = FastAPI(title="Vizzy Chat Backend", version="0.1.0")
 
 # Configure CORS origins via ALLOWED_ORIGINS env var (comma-separated).
@@ -133,15 +298,31 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+# Per-request traces + latency histograms (GET /metrics)
+app.add_middleware(metrics.MetricsMiddleware)
+
+# Sessions (in-memory by default; SESSION_BACKEND=sqlite shares them across workers)
+sessions = create_session_store()
+
+# Success rate / latency / circuit state per image provider and HF model
+provider_health = HealthRegistry()
 
-# In-memory sessions
-sessions = {}
+# Generated image blobs, served by GET /images/{image_id}
+image_blobs = image_store.ImageStore()
+
+# Content-addressed cache in front of each image provider
+image_cache = ImageCache()
+# Picks a quality tier per generation from in-flight work, job queue depth and latency
+degrader = LoadController(queue_depth=lambda: job_queue.depth)
+# Degraded tiers that change provider output get cache entries of their own
+image_cache.variant = lambda: current_tier().variant
 
 
 class ChatMessage(BaseModel):
     role: str
     content: str
     images: Optional[List[str]] = None
+    seq: Optional[int] = None  # Position in the session's message log
 
 
 class ChatRequest(BaseModel):
@@ -151,6 +332,12 @@ class ChatRequest(BaseModel):
     refinement: Optional[str] = None
 
 
+class StageTiming(BaseModel):
+    start_ms: float
+    duration_ms: float
+    status: str
+
+
 class ChatResponse(BaseModel):
     model_config = ConfigDict(protected_namespaces=())
     session_id: str
@@ -158,69 +345,203 @@ class ChatResponse(BaseModel):
     images: List[str]
     copy: str
     intent_category: str
-    conversation_history: List[ChatMessage]
+    conversation_history: List[ChatMessage]  # Only the messages added by this turn
+    cursor: int = 0  # seq of the newest message; page older ones via GET /session/{id}/messages
     llm_model: str = "openrouter/auto"  # Text generation model
     image_model: str = "none"  # Image generation model
+    stage_timings: Dict[str, StageTiming] = {}  # Per-stage pipeline timings (image mode)
+
+
+class JobRequest(ChatRequest):
+    priority: str = "normal"  # high | normal | low
+    callback_url: Optional[str] = None  # POSTed the finished job (http/https, JOB_CALLBACK_HOSTS only)
+
+
+class BatchRequest(BaseModel):
+    prompts: List[str] = Field(..., min_length=1)
+    num_images: int = 1
 
 
 class UserTaste(BaseModel):
-    styles: List[str] = []
-    colors: List[str] = []
-    moods: List[str] = []
-    themes: List[str] = []
+    """Term -> times seen, per category (see taste.py)."""
+    styles: Dict[str, int] = {}
+    colors: Dict[str, int] = {}
+    moods: Dict[str, int] = {}
+    themes: Dict[str, int] = {}
+
+
+# Earlier generations per session, for serving near-duplicate requests without regenerating
+prompt_index = taste.PromptIndex()
+# Recent generations across all sessions, keyed by canonical request and enhanced prompt
+generation_index = similarity.SimilarityIndex()
+# Appended to image_model when a response reuses an earlier generation's images
+REUSED_SUFFIX = " (reused)"
+
+
+# Fast-path hit rate and LLM time saved by interpret_intent (GET /health/intent, /metrics)
+intent_stats = IntentStats()
+
 
+def _intent_resolved(path: str, started: float) -> None:
+    saved = intent_stats.record(path, time.perf_counter() - started)
+    metrics.intent_resolved(path, saved)
 
-def interpret_intent(user_message: str) -> tuple[str, str]:
+
+async def interpret_intent(user_message: str, taste_hint: str = "") -> tuple[str, str]:
+    """
+    (intent, image prompt) for a request. Clearly categorizable requests are
+    answered by local rules (intent.py) without an LLM call; otherwise the
+    completion is streamed and closed as soon as `intent` and `prompt` parse,
+    one stream per set of identical concurrent requests.
+    `taste_hint` lists the user's recurring preferences (taste.hint); it is
+    folded into the prompt by the LLM, or simply appended otherwise.
+    """
+    default_prompt = f"{user_message}, {taste_hint}" if taste_hint else user_message
+    started = time.perf_counter()
+    if INTENT_FAST_PATH:
+        local = classify_intent(user_message)
+        if local is not None:
+            _intent_resolved("fast", started)
+            category, prompt = local
+            return category, f"{prompt}, {taste_hint}" if taste_hint else prompt
+
+    preferences = f"Known preferences of this user (apply unless the request says otherwise): {taste_hint}\n" if taste_hint else ""
     intent_prompt = f"""
 You are an AI art director. Analyze the user's request and:
 1) return a JSON object with keys `intent` and `prompt` only.
 User request: "{user_message}"
-
+{preferences}
 Respond with JSON only.
 """
     try:
         if not OPENROUTER_API_KEY:
             logging.warning("OpenRouter API not available; returning default intent")
-            return "creative", user_message
-        text = generate_text(intent_prompt, max_tokens=300, temperature=0.7)
-        start = text.find("{")
-        end = text.rfind("}") + 1
-        if start == -1 or end == -1:
-            logging.warning("Couldn't find JSON in intent response; using defaults")
-            return "creative", user_message
-        parsed = json.loads(text[start:end])
-        return parsed.get("intent", "creative"), parsed.get("prompt", user_message)
+            _intent_resolved("default", started)
+            return "creative", default_prompt
+        extractor = IntentExtractor()
+        stopped_early = False
+
+        async def stream_intent() -> str:
+            # Streams aren't retried; a failure before the first token (or no lease for
+            # TEXT_MODEL) gets the retrying, downgrading call instead
+            nonlocal stopped_early
+            streamed = IntentExtractor()
+            try:
+                async with contextlib.aclosing(_openrouter_stream(intent_prompt, 300, 0.7)) as deltas:
+                    async for delta in deltas:
+                        if streamed.feed(delta):
+                            stopped_early = True
+                            # The truncated stream isn't cacheable; the parsed answer is
+                            category, prompt = streamed.result()
+                            return json.dumps({"intent": category, "prompt": prompt})
+            except (httpx.HTTPError, RuntimeError, RateLimited) as e:
+                if streamed.buffer:
+                    raise
+                logging.warning(f"Intent stream failed ({e!r}); retrying without streaming")
+                return await _generate_text_uncached(intent_prompt, 300, 0.7)
+            if not streamed.buffer.strip():
+                raise ValueError("No generated text in OpenRouter stream")
+            return streamed.buffer.strip()
+
+        with metrics.span("interpret_intent"):
+            if INTENT_EARLY_STOP:
+                # Through the completion cache, so identical concurrent intents share one stream
+                extractor.feed(await completion_cache.get_or_complete(TEXT_MODEL, intent_prompt, 300, 0.7, stream_intent))
+            else:
+                extractor.feed(await generate_text(intent_prompt, max_tokens=300, temperature=0.7))
+        parsed = extractor.result()
+        if parsed is None:
+            logging.warning(f"Couldn't parse intent from response {extractor.buffer[:120]!r}; using defaults")
+            _intent_resolved("default", started)
+            return "creative", default_prompt
+        category, prompt = parsed
+        _intent_resolved("llm_early" if stopped_early else "llm_full", started)
+        return category, prompt or default_prompt
     except Exception as e:
-        logging.error("interpret_intent failed: %s", e)
-        return "creative", user_message
+        logging.error("interpret_intent failed: %r", e)
+        _intent_resolved("default", started)
+        return "creative", default_prompt
 
 
-def generate_copy(prompt: str, intent: str) -> str:
-    copy_prompt = f"Create a short, poetic one-liner (max 15 words) for this artwork.\nRequest: {prompt}\nIntent: {intent}\nRespond with only the tagline."
+DEFAULT_COPY = "A beautiful creation from your imagination."
+
+
+def _copy_prompt(prompt: str, intent: str) -> str:
+    return f"Create a short, poetic one-liner (max 15 words) for this artwork.\nRequest: {prompt}\nIntent: {intent}\nRespond with only the tagline."
+
+
+async def generate_copy(prompt: str, intent: str) -> str:
     try:
         if not OPENROUTER_API_KEY:
-            return "A beautiful creation from your imagination."
-        text = generate_text(copy_prompt, max_tokens=60, temperature=0.8)
-        return text.strip() or "A beautiful creation from your imagination."
+            return DEFAULT_COPY
+        with metrics.span("generate_copy"):
+            text = await generate_text(_copy_prompt(prompt, intent), max_tokens=60, temperature=0.8)
+        return text.strip() or DEFAULT_COPY
     except Exception as e:
         logging.error("generate_copy failed: %s", e)
-        return "A beautiful creation from your imagination."
+        return DEFAULT_COPY
+
+
+async def stream_copy(prompt: str, intent: str) -> AsyncIterator[str]:
+    """Like generate_copy, but yields the tagline token by token."""
+    if not OPENROUTER_API_KEY:
+        yield DEFAULT_COPY
+        return
+    emitted = False
+    try:
+        async for delta in generate_text_stream(_copy_prompt(prompt, intent), max_tokens=60, temperature=0.8):
+            emitted = True
+            yield delta
+    except Exception as e:
+        logging.error("stream_copy failed: %s", e)
+        if not emitted:
+            yield DEFAULT_COPY
+
 
+def _hf_concurrency(model_name: Optional[str]) -> int:
+    """Max parallel text_to_image calls for one request against this model."""
+    return HF_MODEL_CONCURRENCY.get(model_name or "default", HF_DEFAULT_CONCURRENCY)
 
-def generate_images_huggingface(prompt: str, num_images: int = 2) -> tuple[List[str], str]:
+
+# Set by /chat/stream so providers can report each image the moment it's ready
+_image_listener: contextvars.ContextVar[Optional[Callable[[str], None]]] = contextvars.ContextVar("image_listener", default=None)
+
+
+def _notify_image(url: str) -> None:
+    listener = _image_listener.get()
+    if listener is not None:
+        listener(url)
+
+
+def _hf_model_key(model_name: Optional[str]) -> str:
+    return f"huggingface:{model_name or 'default'}"
+
+
+def _store_image(image) -> str:
+    """Persist a PIL image and return its /images URL (or a data URL with IMAGE_DELIVERY=inline)."""
+    with metrics.span("encode_image", model=image_store.IMAGE_STORE_FORMAT):
+        if image_store.IMAGE_DELIVERY == "inline":
+            return image_store.encode_data_url(image)
+        quality = current_tier().quality or image_store.IMAGE_STORE_QUALITY
+        return image_store.image_url(image_blobs.put_pil(image, quality=quality))
+
+
+@image_cache.cached("huggingface")
+async def generate_images_huggingface(prompt: str, num_images: int = 2) -> tuple[List[str], str]:
     """
     Generate images using HuggingFace's free inference API.
-    Tries multiple free-tier models with fallback strategy.
+    Tries multiple free-tier models with fallback strategy; within a model the
+    N images are generated in parallel (bounded per model), a hard 402/403/410
+    abandons the model immediately, and HF_REQUEST_DEADLINE caps the whole call,
+    returning partial results if any images finished.
     Returns tuple of (image_urls, model_used).
     """
+    hf_client = await provider_clients.aget("huggingface")
     if not HUGGINGFACE_API_KEY or not hf_client:
         logging.warning("HUGGINGFACE_API_KEY not set or client not initialized, skipping HF")
         return [], "Placeholder (no HuggingFace key)"
     
     try:
-        import base64
-        from io import BytesIO
-        
         # Models to try in order of preference (free/stable first)
         models_to_try = [
             "stabilityai/stable-diffusion-xl-base-1.0",
@@ -228,53 +549,86 @@ def generate_images_huggingface(prompt: str, num_images: int = 2) -> tuple[List[
             "prithivMLand/Consistent_ID_ComfyUI",
             None  # Default model as last resort
         ]
-        
-        for model_name in models_to_try:
-            try:
-                if model_name:
-                    logging.info(f"Attempting {model_name.split('/')[-1]}...")
-                else:
-                    logging.info(f"Attempting default HuggingFace model...")
-                
-                images = []
-                for i in range(num_images):
-                    try:
-                        if model_name:
-                            image = hf_client.text_to_image(prompt, model=model_name)
-                        else:
-                            image = hf_client.text_to_image(prompt)
-                        
-                        if image:
-                            # Convert PIL image to base64 data URL
-                            buffered = BytesIO()
-                            image.save(buffered, format="PNG")
-                            img_str = base64.b64encode(buffered.getvalue()).decode()
-                            data_url = f"data:image/png;base64,{img_str}"
-                            images.append(data_url)
-                            logging.info(f"Generated image {i+1}/{num_images}")
-                    except Exception as e_inner:
-                        logging.warning(f"Image {i+1} failed: {str(e_inner)[:100]}, continuing...")
-                        continue
-                
-                if images:
-                    model_label = model_name.split('/')[-1] if model_name else "HuggingFace (default)"
-                    logging.info(f"Successfully generated {len(images)} images via {model_label}")
-                    return images[:num_images], f"HuggingFace ({model_label})"
-                else:
-                    logging.warning(f"No images generated with {model_name or 'default'}")
-                    continue
-                    
-            except Exception as e:
-                err_str = str(e)
-                if "402" in err_str:
-                    logging.warning(f"{model_name or 'default'}: requires payment, trying next...")
-                elif "403" in err_str:
-                    logging.warning(f"{model_name or 'default'}: forbidden access, trying next...")
-                elif "410" in err_str:
-                    logging.warning(f"{model_name or 'default'}: discontinued, trying next...")
-                else:
-                    logging.warning(f"{model_name or 'default'} failed: {str(e)[:80]}, trying next...")
+        deadline = time.monotonic() + HF_REQUEST_DEADLINE
+        # Cheapest expected model first; models with open circuits are skipped
+        model_keys = {_hf_model_key(m): m for m in models_to_try}
+        ordered_keys = provider_health.order(model_keys)
+        tier = current_tier()
+        if tier.fast_models:
+            # Under load the fast models go first (health order kept within each group)
+            ordered_keys = sorted(ordered_keys, key=lambda k: model_keys[k] not in HF_FAST_MODELS)
+        size_kwargs = {"width": tier.size, "height": tier.size} if tier.size else {}
+
+        for model_key in ordered_keys:
+            model_name = model_keys[model_key]
+            if not provider_health.allow(model_key):
+                logging.info(f"{model_name or 'default'}: circuit open, skipping")
+                continue
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                logging.warning("HuggingFace request deadline reached, giving up on remaining models")
+                break
+            if rate_limits.predicted_wait(model_key) > RATE_LIMIT_MAX_WAIT:
+                # Over our own budget for this model: downgrade rather than queue into a 429
+                logging.info(f"{model_name or 'default'}: rate limited locally, trying next model")
+                continue
+            if model_name:
+                logging.info(f"Attempting {model_name.split('/')[-1]}...")
+            else:
+                logging.info(f"Attempting default HuggingFace model...")
+
+            async def generate_one(i: int, model_name=model_name, model_key=model_key) -> Optional[str]:
+                # InferenceClient is sync; run it off the event loop
+                async with rate_limits.limit(model_key):
+                    if model_name:
+                        image = await asyncio.to_thread(hf_client.text_to_image, prompt, model=model_name, **size_kwargs)
+                    else:
+                        image = await asyncio.to_thread(hf_client.text_to_image, prompt, **size_kwargs)
+                if not image:
+                    return None
+                # Encode + store the image (CPU-bound, also off the loop)
+                url = await asyncio.to_thread(_store_image, image)
+                logging.info(f"Generated image {i+1}/{num_images}")
+                _notify_image(url)
+                return url
+
+            started = time.monotonic()
+            with metrics.span("provider_attempt", provider="huggingface", model=model_name or "default") as span:
+                outcome = await fan_out(generate_one, num_images, _hf_concurrency(model_name), deadline=remaining)
+                if not outcome.completed:
+                    span.outcome = classify_status(outcome.fatal_status) if outcome.fatal_status else ("timeout" if outcome.timed_out else "no_output")
+            elapsed = time.monotonic() - started
+            for e_inner in outcome.errors:
+                logging.warning(f"Image failed: {str(e_inner)[:100]}, continuing...")
+
+            images = outcome.completed
+            if images:
+                provider_health.record_success(model_key, elapsed)
+                model_label = model_name.split('/')[-1] if model_name else "HuggingFace (default)"
+                logging.info(f"Successfully generated {len(images)} images via {model_label}")
+                return images[:num_images], f"HuggingFace ({model_label})"
+
+            if outcome.errors and all(isinstance(e, RateLimited) for e in outcome.errors):
+                # Refused locally, never reached HF: not the model's fault
+                logging.info(f"{model_name or 'default'}: all images rate limited locally, trying next model")
+                metrics.fallback("model", model_key)
                 continue
+            metrics.fallback("model", model_key)
+            if outcome.fatal_status is not None:
+                provider_health.record_failure(model_key, classify_status(outcome.fatal_status), elapsed)
+            else:
+                provider_health.record_failure(model_key, "timeout" if outcome.timed_out else "no_output", elapsed)
+
+            if outcome.fatal_status == 402:
+                logging.warning(f"{model_name or 'default'}: requires payment, trying next...")
+            elif outcome.fatal_status == 403:
+                logging.warning(f"{model_name or 'default'}: forbidden access, trying next...")
+            elif outcome.fatal_status == 410:
+                logging.warning(f"{model_name or 'default'}: discontinued, trying next...")
+            elif outcome.timed_out:
+                break
+            else:
+                logging.warning(f"No images generated with {model_name or 'default'}")
         
         # All models failed
         logging.error("All HuggingFace models exhausted")
@@ -285,7 +639,8 @@ def generate_images_huggingface(prompt: str, num_images: int = 2) -> tuple[List[
         return [], "Placeholder (HuggingFace error)"
 
 
-def generate_images_openrouter(prompt: str, num_images: int = 2) -> tuple[List[str], str]:
+@image_cache.cached("openrouter:black-forest-labs/flux-pro")
+async def generate_images_openrouter(prompt: str, num_images: int = 2) -> tuple[List[str], str]:
     """
     Generate images using OpenRouter's Flux AI image generation API.
     Flux is free on OpenRouter and produces high-quality images.
@@ -297,42 +652,28 @@ def generate_images_openrouter(prompt: str, num_images: int = 2) -> tuple[List[s
         return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (no API key)"
     
     try:
-        import requests
-        import time
-        
         # OpenRouter image generation endpoint - Flux AI is free
-        api_url = "https://openrouter.ai/api/v1/images/generations"
+        api_url = f"{upstream.OPENROUTER_BASE_URL}/images/generations"
         
         logging.info(f"Generating {num_images} images via OpenRouter Flux for: {prompt[:50]}...")
         
-        headers = {
-            "Authorization": f"Bearer {OPENROUTER_API_KEY}",
-            "Content-Type": "application/json"
-        }
+        headers = _openrouter_headers()
         
+        side = current_tier().size or 512
         payload = {
             "model": "black-forest-labs/flux-pro",  # Flux AI - free, high quality
             "prompt": prompt,
             "num_images": min(num_images, 2),  # Limit to 2 images
-            "size": "512x512",
+            "size": f"{side}x{side}",
             "response_format": "url"  # Return URLs instead of base64
         }
         
-        # Make request with timeout and retry on timeout
-        max_retries = 2
-        response = None
-        
-        for attempt in range(max_retries):
-            try:
-                response = requests.post(api_url, json=payload, headers=headers, timeout=45)
-                break
-            except requests.Timeout:
-                if attempt < max_retries - 1:
-                    logging.warning(f"Timeout occurred, retrying ({attempt + 1}/{max_retries})...")
-                    time.sleep(2)  # Wait before retrying
-                else:
-                    logging.error("Max retries reached, using placeholders")
-                    return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (timeout)"
+        # Timeout and retry/backoff handled by the upstream layer
+        try:
+            response = await upstream.post_json(api_url, payload, headers=headers, max_retries=2, backoff=2.0)
+        except httpx.TimeoutException:
+            logging.error("Max retries reached, using placeholders")
+            return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (timeout)"
 
         if response and response.status_code == 200:
             try:
@@ -353,30 +694,37 @@ def generate_images_openrouter(prompt: str, num_images: int = 2) -> tuple[List[s
         raise
 
 
-def generate_images_replicate(prompt: str, num_images: int = 3) -> tuple[List[str], str]:
+@image_cache.cached("replicate:black-forest-labs/flux-schnell", size="1:1")
+async def generate_images_replicate(prompt: str, num_images: int = 3) -> tuple[List[str], str]:
     """Generate images using Replicate Flux Schnell model if available, else return placeholders."""
-    if not REPLICATE_API_KEY or not HAS_REPLICATE:
+    replicate = await provider_clients.aget("replicate")
+    if not REPLICATE_API_KEY or replicate is None:
         return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (no Replicate key or module)"
 
     try:
-        # Set Replicate API token
-        import os as os_module
-        os_module.environ["REPLICATE_API_TOKEN"] = REPLICATE_API_KEY
-        
-        logging.info(f"Calling Replicate Flux Schnell with token (first 10): {REPLICATE_API_KEY[:10]}...")
-        
+        logging.info("Calling Replicate Flux Schnell...")
+
+        tier = current_tier()
+        replicate_input = {
+            "prompt": prompt,
+            "go_fast": True,
+            "num_outputs": num_images,
+            "aspect_ratio": "1:1",
+            "output_format": "webp",
+            "output_quality": tier.quality or 80,
+        }
+        if tier.size:
+            # flux-schnell renders 1 MP by default; 0.25 MP is its small option
+            replicate_input["megapixels"] = "0.25"
+
+        def run_replicate():
+            # Runs in a worker thread, so admission uses the blocking limiter path
+            with rate_limits.limit_sync("replicate:black-forest-labs/flux-schnell"):
+                return replicate.run("black-forest-labs/flux-schnell", input=replicate_input)
+
         # Use Flux Schnell - a free, fast, open-source image generation model
-        output = replicate.run(
-            "black-forest-labs/flux-schnell",
-            input={
-                "prompt": prompt,
-                "go_fast": True,
-                "num_outputs": num_images,
-                "aspect_ratio": "1:1",
-                "output_format": "webp",
-                "output_quality": 80
-            }
-        )
+        # replicate.run blocks while polling the prediction; keep it off the event loop
+        output = await asyncio.to_thread(run_replicate)
         logging.info(f"Replicate output type: {type(output)}, length: {len(output) if isinstance(output, list) else 'N/A'}")
         
         if output:
@@ -390,96 +738,241 @@ def generate_images_replicate(prompt: str, num_images: int = 3) -> tuple[List[st
             logging.warning("Replicate returned no images")
             return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (Replicate no output)"
             
+    except RateLimited:
+        # Let generate_images move on to the next provider without a health penalty
+        raise
     except Exception as e:
         logging.error(f"Replicate image generation failed: {e}")
         return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (Replicate error)"
 
 
-def generate_images(prompt: str, num_images: int = 2) -> tuple[List[str], str]:
-    """
-    Intelligently generate images with fallback chain:
-    1. HuggingFace (free, no credits needed)
-    2. Replicate (if API key available)
-    3. OpenRouter (if API key available)
-    4. SVG placeholders (final fallback)
-    Returns tuple of (image_urls, model_name).
-    """
-    logging.info(f"generate_images() called: HF={'yes' if hf_client else 'no'}, REP={HAS_REPLICATE}, OR={'yes' if OPENROUTER_API_KEY else 'no'}")
-    
-    # Priority 1: Try HuggingFace FREE inference (no credits needed)
-    logging.info("Priority 1: Attempting HuggingFace free inference...")
-    try:
-        images, model = generate_images_huggingface(prompt, num_images)
+_provider_slots: Dict[str, asyncio.Semaphore] = {}
+
+
+def _provider_slot(name: str):
+    """Shared per-provider concurrency limit (a no-op when not configured)."""
+    limit = PROVIDER_CONCURRENCY.get(name)
+    if not limit:
+        return contextlib.nullcontext()
+    if name not in _provider_slots:
+        _provider_slots[name] = asyncio.Semaphore(limit)
+    return _provider_slots[name]
+
+
+# Caps duplicate upstream calls made by IMAGE_HEDGING
+hedge_budget = hedge.HedgeBudget()
+
+
+def _hedge_delay(name: str) -> float:
+    """How long `name` may run before the next provider is started alongside it."""
+    entry = provider_health.get(name)
+    if len(entry.recent_latencies) < hedge.HEDGE_MIN_SAMPLES:
+        return hedge.HEDGE_DEFAULT_DELAY
+    return entry.latency_percentile(hedge.HEDGE_PERCENTILE)
+
+
+async def _attempt_provider(name: str, generate, prompt: str, num_images: int) -> Optional[tuple[List[str], str]]:
+    """One provider attempt with health, rate limit and metrics bookkeeping; None on failure."""
+    if not provider_health.allow(name):
+        logging.info(f"{name}: circuit open, skipping")
+        return None
+    logging.info(f"Attempting {name}...")
+    started = time.monotonic()
+    with metrics.span("provider", provider=name) as span:
+        try:
+            async with rate_limits.limit(name), _provider_slot(name):
+                images, model = await generate(prompt, num_images)
+        except RateLimited as e:
+            logging.info(f"{e}; trying next provider...")
+            span.outcome = "rate_limited"
+            metrics.fallback("provider", name)
+            return None
+        except Exception as e:
+            provider_health.record_failure(name, "error", time.monotonic() - started)
+            logging.warning(f"{name} failed ({e}), trying next provider...")
+            span.outcome = "error"
+            metrics.fallback("provider", name)
+            return None
         if images and "Placeholder" not in model:
+            # Cache hits say nothing about the provider's live latency
+            if image_cache.served_from_cache():
+                span.outcome = "cached"
+            else:
+                provider_health.record_success(name, time.monotonic() - started)
             logging.info(f"✓ Generated images via {model}")
             return images, model
-        else:
-            logging.info(f"HuggingFace returned: {model}")
-    except Exception as e:
-        logging.warning(f"HuggingFace failed ({e}), trying Replicate...")
-    
-    # Priority 2: Try Replicate if API key available (for when user adds credits)
-    if REPLICATE_API_KEY and HAS_REPLICATE:
-        logging.info("Priority 2: Attempting Replicate...")
-        try:
-            images, model = generate_images_replicate(prompt, num_images)
-            if images and not "Placeholder" in model:
-                logging.info(f"✓ Generated images via {model}")
-                return images, model
-            else:
-                logging.info(f"Replicate returned: {model}")
-        except Exception as e:
-            logging.warning(f"Replicate failed ({e}), trying OpenRouter...")
+        span.outcome = "placeholder"
+    provider_health.record_failure(name, "no_output", time.monotonic() - started)
+    metrics.fallback("provider", name)
+    logging.info(f"{name} returned: {model}")
+    return None
+
+
+async def generate_images(prompt: str, num_images: int = 2, near: bool = True) -> tuple[List[str], str]:
+    """
+    Intelligently generate images with fallback chain over configured providers:
+    HuggingFace (free), Replicate and OpenRouter, then SVG placeholders.
+    The chain is reordered by provider_health (expected latency / success) and
+    providers with an open circuit are skipped until their half-open probe.
+    With IMAGE_HEDGING a slow provider (past its latency percentile) gets the
+    next one started alongside it, first result wins; IMAGE_REQUEST_DEADLINE
+    bounds the whole chain.
+    Under load the degrader picks a lower tier (fewer / smaller / lower
+    quality images, fast models, no hedging), reported as a " [tier]" suffix
+    on the model name. A recent generation for the same canonical prompt
+    (or, with `near`, a near-duplicate one) is served instead.
+    Returns tuple of (image_urls, model_name).
+    """
+    logging.info(f"generate_images() called: HF={'yes' if provider_clients.configured('huggingface') else 'no'}, REP={HAS_REPLICATE}, OR={'yes' if OPENROUTER_API_KEY else 'no'}")
+
+    # An enhanced prompt matching a recent one gets that generation's images
+    match = generation_index.lookup(prompt, near=near)
+    if match is not None and len(match[0][2]) >= num_images:
+        _, _, images, model = match[0]
+        logging.info(f"Reusing images for a prompt {match[1]:.2f} similar to a recent one")
+        return list(images[:num_images]), model + REUSED_SUFFIX
     
-    # Priority 3: Try OpenRouter (if endpoint available)
+    # Static priority order; only providers that are configured take part
+    providers = {}
+    if provider_clients.configured("huggingface"):
+        providers["huggingface"] = generate_images_huggingface
+    if provider_clients.configured("replicate"):
+        providers["replicate"] = generate_images_replicate
     if OPENROUTER_API_KEY:
-        logging.info("Priority 3: Attempting OpenRouter...")
-        try:
-            images, model = generate_images_openrouter(prompt, num_images)
-            if images and not "Placeholder" in model:
-                logging.info(f"✓ Generated images via {model}")
-                return images, model
-        except Exception as e:
-            logging.warning(f"OpenRouter failed ({e}), using SVG fallback...")
+        providers["openrouter"] = generate_images_openrouter
     
-    # Priority 4: Fallback to colored SVG placeholders
-    logging.info("Using SVG placeholder images (all providers exhausted)")
-    return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (SVG - colored by prompt)"
+    tier = degrader.select()
+    num_images = min(num_images, tier.max_images)
+    with degrader.generation(tier):
+        candidates = [
+            (name, functools.partial(_attempt_provider, name, providers[name], prompt, num_images))
+            for name in provider_health.order(providers)
+        ]
+        if candidates:
+            winner, result = await hedge.hedged(
+                candidates,
+                hedge_delay=_hedge_delay,
+                budget=hedge_budget if hedge.IMAGE_HEDGING and tier.hedging else None,
+                deadline=IMAGE_REQUEST_DEADLINE or None,
+            )
+            if result is not None:
+                return result[0], result[1] + tier.label
 
+        # Final fallback: colored SVG placeholders
+        logging.info("Using SVG placeholder images (all providers exhausted)")
+        return _generate_placeholder_images(num_images, seed_prompt=prompt), "Placeholder (SVG - colored by prompt)" + tier.label
 
-def generate_chat_reply(user_message: str) -> str:
-    system_msg = (
-        "You are Vizzy Chat — a helpful, friendly creative assistant. "
-        "Respond conversationally and concisely. If unsure about user intent, ask a clarifying question."
-    )
+
+CHAT_SYSTEM_MSG = (
+    "You are Vizzy Chat — a helpful, friendly creative assistant. "
+    "Respond conversationally and concisely. If unsure about user intent, ask a clarifying question."
+)
+
+
+async def generate_chat_reply(user_message: str) -> str:
     try:
         if not OPENROUTER_API_KEY:
             logging.warning("OpenRouter API not configured; returning local fallback")
             return "I can help with image ideas and copy — what would you like to create?"
-        prompt = system_msg + "\nUser: " + user_message
-        text = generate_text(prompt, max_tokens=300, temperature=0.7)
+        prompt = CHAT_SYSTEM_MSG + "\nUser: " + user_message
+        text = await generate_text(prompt, max_tokens=300, temperature=0.7)
         return text.strip()
     except Exception as e:
         logging.error("generate_chat_reply failed: %s", e)
-        text = user_message.strip().lower()
-        if any(k in text for k in ("summarize", "explain", "what is", "what's")):
-            return (
-                "Vizzy Chat is a conversational AI creative assistant that helps you generate images, "
-                "write content, and explore creative ideas through visual brainstorming. "
-                "Would you like me to help you create something specific?"
-            )
-        elif any(w in text for w in ("how", "why", "when", "where", "who", "what")) or "?" in text:
-            return (
-                f"That's an interesting question about '{user_message}'. "
-                "I'd love to help! Vizzy Chat can generate images, write creative copy, or discuss ideas. "
-                "What would you like to explore today?"
-            )
-        else:
-            return (
-                f"Thanks for sharing '{user_message}' with me. "
-                "I can help you create visuals, write content, or brainstorm ideas. "
-                "What sounds interesting to you?"
-            )
+        return _local_chat_reply(user_message)
+
+
+def _local_chat_reply(user_message: str) -> str:
+    """Keyword-based reply used when the LLM is unavailable."""
+    text = user_message.strip().lower()
+    if any(k in text for k in ("summarize", "explain", "what is", "what's")):
+        return (
+            "Vizzy Chat is a conversational AI creative assistant that helps you generate images, "
+            "write content, and explore creative ideas through visual brainstorming. "
+            "Would you like me to help you create something specific?"
+        )
+    elif any(w in text for w in ("how", "why", "when", "where", "who", "what")) or "?" in text:
+        return (
+            f"That's an interesting question about '{user_message}'. "
+            "I'd love to help! Vizzy Chat can generate images, write creative copy, or discuss ideas. "
+            "What would you like to explore today?"
+        )
+    else:
+        return (
+            f"Thanks for sharing '{user_message}' with me. "
+            "I can help you create visuals, write content, or brainstorm ideas. "
+            "What sounds interesting to you?"
+        )
+
+
+async def stream_chat_reply(user_message: str) -> AsyncIterator[str]:
+    """Like generate_chat_reply, but yields the reply token by token."""
+    if not OPENROUTER_API_KEY:
+        yield "I can help with image ideas and copy — what would you like to create?"
+        return
+    emitted = False
+    try:
+        async for delta in generate_text_stream(CHAT_SYSTEM_MSG + "\nUser: " + user_message, max_tokens=300, temperature=0.7):
+            emitted = True
+            yield delta
+    except Exception as e:
+        logging.error("stream_chat_reply failed: %s", e)
+        if not emitted:
+            yield _local_chat_reply(user_message)
+
+
+async def run_image_pipeline(message: str, num_images: int, taste_hint: str = "", near: bool = True) -> tuple[dict, dict]:
+    """
+    Run intent -> images with copy overlapping image generation.
+    With SPECULATIVE_COPY the copy starts from the raw message alongside the
+    intent call, assuming SPECULATIVE_INTENT; it is redone (still overlapping
+    images) only if the real intent turns out different.
+    Returns (results, stage_timings).
+    """
+    graph = TaskGraph()
+    graph.add(
+        "intent",
+        lambda r: interpret_intent(message, taste_hint),
+        deadline=PIPELINE_INTENT_DEADLINE,
+        fallback=("creative", f"{message}, {taste_hint}" if taste_hint else message),
+    )
+    # A locally classified intent is instant, so there is nothing to speculate past
+    speculate = SPECULATIVE_COPY and not (INTENT_FAST_PATH and classify_intent(message) is not None)
+    if speculate:
+        graph.add(
+            "copy_speculative",
+            lambda r: generate_copy(message, SPECULATIVE_INTENT),
+            deadline=PIPELINE_COPY_DEADLINE,
+        )
+
+    async def copy_stage(r):
+        intent = r["intent"][0]
+        if r.get("copy_speculative") and intent == SPECULATIVE_INTENT:
+            return r["copy_speculative"]
+        return await generate_copy(message, intent)
+
+    graph.add(
+        "images",
+        lambda r: generate_images(r["intent"][1], num_images, near),
+        deps=["intent"],
+        deadline=PIPELINE_IMAGES_DEADLINE,
+        fallback=lambda r: (
+            _generate_placeholder_images(num_images, seed_prompt=r["intent"][1]),
+            "Placeholder (image stage deadline)",
+        ),
+    )
+    graph.add(
+        "copy",
+        copy_stage,
+        deps=["intent", "copy_speculative"] if speculate else ["intent"],
+        deadline=PIPELINE_COPY_DEADLINE,
+        fallback=DEFAULT_COPY,
+    )
+    results, timings = await graph.run()
+    for stage, timing in timings.items():
+        if stage != "total" and timing["status"] != "ok":
+            metrics.fallback("stage", stage)
+    return results, timings
 
 
 @app.on_event("startup")
@@ -487,6 +980,19 @@ async def startup():
     print("[*] Vizzy Chat Backend started")
     print(f"OpenRouter API configured: {bool(OPENROUTER_API_KEY)}")
     print(f"Replicate key available: {bool(REPLICATE_API_KEY)}")
+    if WARMUP_PROVIDERS:
+        # In the background: startup (and the first chat-only request) shouldn't wait on it
+        app.state.warmup = asyncio.create_task(provider_clients.warm(WARMUP_PROVIDERS))
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    # uvicorn has already stopped accepting connections and waited for open
+    # requests; finish background jobs before cancelling their workers
+    await job_queue.drain(SHUTDOWN_DRAIN_TIMEOUT)
+    await job_queue.stop()
+    image_encoder.shutdown()
+    await upstream.close_client()
 
 
 @app.get("/")
@@ -496,42 +1002,120 @@ async def root():
         "version": "0.1.0",
         "endpoints": {
             "POST /chat": "Send a message and get generated images + copy",
+            "POST /chat/stream": "Same as /chat, streamed as Server-Sent Events per stage",
+            "POST /jobs": "Queue a generation; poll GET /jobs/{job_id} or pass callback_url",
+            "POST /batch": "Generate a list of prompts, streamed back as NDJSON",
             "GET /session/{session_id}": "Retrieve session history",
+            "GET /session/{session_id}/messages?after=&limit=": "Page through session messages by cursor",
+            "GET /health/providers": "Image provider health and circuit breaker state",
+            "POST /warmup?providers=": "Initialize provider clients ahead of first use",
+            "GET /health/ratelimits": "Per-provider/model rate limiter state",
+            "GET /health/intent": "Intent fast-path hit rate and LLM time saved",
+            "GET /health/upstream": "Pooled upstream clients: connection reuse, HTTP version, connect/TLS timings",
+            "GET /health/load": "Load pressure and the image quality tier it selects",
+            "GET /health/worker": "Worker pid, multi-worker mode and drain state",
+            "GET /cache/stats": "Cache hit/miss/eviction counters",
+            "GET /metrics": "Prometheus metrics: span latencies, fallbacks, placeholders, sessions, memory",
+            "GET /images/{image_id}?w=&format=auto": "Generated image by content-hash ID, or a thumbnail / re-encode",
         }
     }
 
 
+async def _record_turn(
+    session_id: str,
+    message: str,
+    copy_text: str,
+    images: List[str],
+    intent_category: str,
+    image_prompt: str = "",
+    image_model: str = "none",
+    refinement: bool = False,
+) -> List[ChatMessage]:
+    """
+    Append the user/assistant pair to the session log, update taste and index
+    real (non-placeholder, non-reused) generations; refinements are indexed for
+    exact canonical matches only. Returns the new messages.
+    """
+    # Append-only log; the response carries just this turn plus a cursor
+    user_seq, assistant_seq = await sessions.aappend(
+        session_id, [("user", message, None), ("assistant", copy_text, images)]
+    )
+    new_messages = [
+        ChatMessage(role="user", content=message, seq=user_seq),
+        ChatMessage(role="assistant", content=copy_text, images=images, seq=assistant_seq),
+    ]
+
+    info = await sessions.aget_info(session_id)
+    if info:
+        await sessions.aset_taste(session_id, taste.update(info["taste"], message, intent_category))
+    # Reused and degraded images aren't indexed, so later requests get full-quality originals
+    if images and "Placeholder" not in image_model and not image_model.endswith(REUSED_SUFFIX) and not degraded_label(image_model):
+        prompt_index.add(session_id, message, intent_category, image_prompt, images, image_model)
+        generation_index.add(
+            (message, image_prompt), (intent_category, image_prompt, tuple(images), image_model), near=not refinement
+        )
+    return new_messages
+
+
+def _reuse_candidate(session_id: str, request: ChatRequest, num_images: int) -> Optional[tuple]:
+    """
+    (intent, prompt, images, model) of an earlier generation close enough to
+    answer `request` with: this session's first, then any recent one.
+    Only candidates with at least `num_images` images count.
+    Refinements only reuse an identical canonical refined message; a near
+    match may differ in exactly the refinement text that changed.
+    """
+    if taste.wants_new(request.message):
+        return None
+    if not request.refinement:
+        entry = prompt_index.lookup(session_id, request.message)
+        if entry is not None and len(entry.images) >= num_images:
+            return entry.intent, entry.prompt, entry.images, entry.image_model
+    match = generation_index.lookup(request.message, near=not request.refinement)
+    if match is not None and len(match[0][2]) >= num_images:
+        return match[0]
+    return None
+
+
 @app.post("/chat", response_model=ChatResponse)
 async def chat(request: ChatRequest):
     session_id = request.session_id or str(uuid.uuid4())
-    if session_id not in sessions:
-        sessions[session_id] = {"created_at": datetime.now().isoformat(), "messages": [], "taste": UserTaste()}
-    session = sessions[session_id]
+    await sessions.acreate(session_id)
+    current_session.set(session_id)
 
     image_model_used = "none"
+    enhanced_prompt = ""
+    stage_timings = {}
     
     if request.num_images == 0:
         # Chat mode: only text, no images
-        reply = generate_chat_reply(request.message)
+        reply = await generate_chat_reply(request.message)
         copy_text = reply
         images = []
         intent_category = "chat"
+    elif (reused := _reuse_candidate(session_id, request, min(request.num_images, 2))) is not None:
+        # Near-duplicate of an earlier request: same images, fresh copy
+        intent_category, enhanced_prompt, reused_images, reused_model = reused
+        images = list(reused_images[: min(request.num_images, 2)])
+        image_model_used = reused_model + REUSED_SUFFIX
+        copy_text = await generate_copy(request.message, intent_category)
     else:
-        # Image mode: generate images + copy
-        intent_category, enhanced_prompt = interpret_intent(request.message)
-        
-        # Generate images (tries Replicate first, then OpenRouter, then falls back to colored SVGs)
-        images, image_model_used = generate_images(enhanced_prompt, min(request.num_images, 2))
-        
-        copy_text = generate_copy(request.message, intent_category)
-
-    user_msg = ChatMessage(role="user", content=request.message)
-    assistant_msg = ChatMessage(role="assistant", content=copy_text, images=images)
-    session["messages"].append(user_msg.model_dump())
-    session["messages"].append(assistant_msg.model_dump())
+        # Image mode: intent -> images, with copy generated concurrently
+        info = await sessions.aget_info(session_id)
+        taste_hint = taste.hint(info["taste"], request.message) if info else ""
+        results, stage_timings = await run_image_pipeline(
+            request.message, min(request.num_images, 2), taste_hint, near=not request.refinement
+        )
+        intent_category, enhanced_prompt = results["intent"]
+        images, image_model_used = results["images"]
+        copy_text = results["copy"]
 
-    if intent_category and intent_category not in session["taste"].themes:
-        session["taste"].themes.append(intent_category)
+    new_messages = await _record_turn(
+        session_id, request.message, copy_text, images, intent_category,
+        enhanced_prompt, image_model_used, refinement=bool(request.refinement),
+    )
+    assistant_seq = new_messages[-1].seq
+    metrics.images_served(len(images), placeholder="Placeholder" in image_model_used)
 
     return ChatResponse(
         session_id=session_id,
@@ -539,61 +1123,405 @@ async def chat(request: ChatRequest):
         images=images,
         copy=copy_text,
         intent_category=intent_category,
-        conversation_history=[ChatMessage(**m) for m in session["messages"]],
+        conversation_history=new_messages,
+        cursor=assistant_seq,
         llm_model="openrouter/auto",
-        image_model=image_model_used
+        image_model=image_model_used,
+        stage_timings=stage_timings,
+    )
+
+
+def _sse(event: str, data: dict) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
+
+
+async def _chat_stream_events(request: ChatRequest) -> AsyncIterator[str]:
+    """
+    Event sequence: session, then for image mode intent, image (one per image
+    as providers deliver them), copy_token..., and finally done with the same
+    fields as ChatResponse. Chat mode streams the reply as copy_token events.
+    """
+    session_id = request.session_id or str(uuid.uuid4())
+    await sessions.acreate(session_id)
+    current_session.set(session_id)
+    yield _sse("session", {"session_id": session_id})
+
+    started = time.perf_counter()
+    image_model_used = "none"
+    enhanced_prompt = ""
+    images: List[str] = []
+
+    if request.num_images == 0:
+        intent_category = "chat"
+        parts = []
+        async for delta in stream_chat_reply(request.message):
+            parts.append(delta)
+            yield _sse("copy_token", {"text": delta})
+        copy_text = "".join(parts).strip()
+    else:
+        num_images = min(request.num_images, 2)
+        info = await sessions.aget_info(session_id)
+        taste_hint = taste.hint(info["taste"], request.message) if info else ""
+        try:
+            intent_category, enhanced_prompt = await asyncio.wait_for(
+                interpret_intent(request.message, taste_hint), timeout=PIPELINE_INTENT_DEADLINE or None
+            )
+        except asyncio.TimeoutError:
+            intent_category, enhanced_prompt = "creative", request.message
+            metrics.fallback("stage", "intent")
+        yield _sse("intent", {"intent_category": intent_category, "prompt": enhanced_prompt})
+
+        # Images and copy tokens are funnelled through one queue in arrival order
+        events: asyncio.Queue = asyncio.Queue()
+        sent_images: List[str] = []
+
+        async def run_images():
+            token = _image_listener.set(lambda url: events.put_nowait(("image", url)))
+            try:
+                return await asyncio.wait_for(
+                    generate_images(enhanced_prompt, num_images, near=not request.refinement),
+                    timeout=PIPELINE_IMAGES_DEADLINE or None,
+                )
+            except asyncio.TimeoutError:
+                metrics.fallback("stage", "images")
+                return (
+                    _generate_placeholder_images(num_images, seed_prompt=enhanced_prompt),
+                    "Placeholder (image stage deadline)",
+                )
+            finally:
+                _image_listener.reset(token)
+                events.put_nowait(("images_done", None))
+
+        async def run_copy():
+            parts = []
+            try:
+                async for delta in stream_copy(request.message, intent_category):
+                    parts.append(delta)
+                    events.put_nowait(("copy_token", delta))
+            finally:
+                events.put_nowait(("copy_done", None))
+            return "".join(parts).strip() or DEFAULT_COPY
+
+        images_task = asyncio.create_task(run_images())
+        copy_task = asyncio.create_task(run_copy())
+        try:
+            pending = 2
+            while pending:
+                kind, value = await events.get()
+                if kind == "image":
+                    sent_images.append(value)
+                    yield _sse("image", {"index": len(sent_images) - 1, "url": value})
+                elif kind == "copy_token":
+                    yield _sse("copy_token", {"text": value})
+                else:
+                    pending -= 1
+            images, image_model_used = images_task.result()
+            copy_text = copy_task.result()
+        finally:
+            for task in (images_task, copy_task):
+                task.cancel()
+
+        # Providers that return a whole batch (cache hits, Replicate, OpenRouter) report here
+        for index, url in enumerate(images):
+            if url in sent_images:
+                sent_images.remove(url)
+            else:
+                yield _sse("image", {"index": index, "url": url})
+
+    new_messages = await _record_turn(
+        session_id, request.message, copy_text, images, intent_category,
+        enhanced_prompt, image_model_used, refinement=bool(request.refinement),
+    )
+    metrics.images_served(len(images), placeholder="Placeholder" in image_model_used)
+    yield _sse("done", {
+        "session_id": session_id,
+        "message": copy_text,
+        "images": images,
+        "copy": copy_text,
+        "intent_category": intent_category,
+        "conversation_history": [m.model_dump() for m in new_messages],
+        "cursor": new_messages[-1].seq,
+        "llm_model": TEXT_MODEL,
+        "image_model": image_model_used,
+        "elapsed_ms": round((time.perf_counter() - started) * 1000, 1),
+    })
+
+
+@app.post("/chat/stream")
+async def chat_stream(request: ChatRequest):
+    return StreamingResponse(
+        _chat_stream_events(request),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
     )
 
 
+async def _run_job(job) -> dict:
+    """Job handler: the same intent -> images -> copy pipeline as /chat, traced per job."""
+    trace = metrics.start_trace(f"job {job.id}")
+    try:
+        response = await chat(ChatRequest(**job.request))
+    finally:
+        metrics.finish_trace(trace)
+    return response.model_dump()
+
+
+# Background generation jobs (in-process workers, no broker; records shared across workers)
+_shared_state = get_shared_state()
+job_queue = LocalJobQueue(
+    _run_job, records=SharedCache(_shared_state, "jobs", JOB_RESULT_TTL) if _shared_state is not None else None
+)
+
+
+@app.post("/jobs", status_code=202)
+async def create_job(request: JobRequest):
+    if request.priority not in ("high", "normal", "low"):
+        raise HTTPException(status_code=422, detail="priority must be one of: high, normal, low")
+    if request.callback_url and urllib.parse.urlparse(request.callback_url).scheme not in ("http", "https"):
+        raise HTTPException(status_code=422, detail="callback_url must be an http(s) URL")
+    try:
+        job = await job_queue.submit(
+            request.model_dump(include=set(ChatRequest.model_fields)),
+            priority=request.priority,
+            callback_url=request.callback_url,
+        )
+    except CallbackRejected as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except QueueFull as e:
+        raise HTTPException(status_code=429, detail=str(e), headers={"Retry-After": "5"})
+    except Draining:
+        raise HTTPException(status_code=503, detail="Server is shutting down", headers={"Retry-After": "5"})
+    return {"job_id": job.id, "status": job.status, "queue_depth": job_queue.depth}
+
+
+@app.get("/jobs")
+async def get_jobs_stats():
+    return job_queue.stats()
+
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = await job_queue.lookup(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return job
+
+
+batch_runner = BatchRunner(
+    generate_text,
+    generate_images,
+    llm_available=lambda: bool(OPENROUTER_API_KEY),
+    default_copy=DEFAULT_COPY,
+)
+
+
+@app.post("/batch")
+async def batch(request: BatchRequest):
+    """Generate many prompts at once; streams one NDJSON line per prompt, then a summary line."""
+    if len(request.prompts) > BATCH_MAX_PROMPTS:
+        raise HTTPException(status_code=413, detail=f"At most {BATCH_MAX_PROMPTS} prompts per batch")
+    num_images = max(1, min(request.num_images, 2))
+
+    async def lines():
+        # A whole batch queues as one session so it can't crowd out interactive chats
+        current_session.set(f"batch:{uuid.uuid4().hex}")
+        async for result in batch_runner.run(request.prompts, num_images):
+            yield json.dumps(result) + "\n"
+
+    return StreamingResponse(lines(), media_type="application/x-ndjson")
+
+
 @app.post("/refine", response_model=ChatResponse)
 async def refine(request: ChatRequest):
-    if not request.session_id or request.session_id not in sessions:
+    if not request.session_id or not await sessions.aexists(request.session_id):
         raise HTTPException(status_code=404, detail="Session not found")
-    refined_message = f"{request.message}. {request.refinement or ''}"
-    refined_request = ChatRequest(session_id=request.session_id, message=refined_message, num_images=request.num_images)
+    # Tidied so the stored turn doesn't carry a doubled ". ." when the message already ends in one
+    refined_message = similarity.clean(f"{request.message}. {request.refinement or ''}")
+    refined_request = ChatRequest(
+        session_id=request.session_id, message=refined_message, num_images=request.num_images,
+        refinement=request.refinement,
+    )
     return await chat(refined_request)
 
 
 @app.get("/session/{session_id}")
 async def get_session(session_id: str):
-    if session_id not in sessions:
+    info = await sessions.aget_info(session_id)
+    if info is None:
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {
+        "session_id": session_id,
+        "created_at": info["created_at"],
+        "messages": await sessions.aall_messages(session_id),
+        "taste": info["taste"],
+    }
+
+
+@app.get("/session/{session_id}/messages")
+async def get_session_messages(session_id: str, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT):
+    info = await sessions.aget_info(session_id)
+    if info is None:
         raise HTTPException(status_code=404, detail="Session not found")
-    return {"session_id": session_id, **sessions[session_id]}
+    page = await sessions.apage(session_id, after, limit)
+    next_cursor = page[-1]["seq"] if page else max(0, min(after, info["count"]))
+    return {
+        "session_id": session_id,
+        "messages": page,
+        "next_cursor": next_cursor,
+        "has_more": next_cursor < info["count"],
+        "total": info["count"],
+    }
 
 
-def _generate_placeholder_images(num_images: int, seed_prompt: str) -> List[str]:
+@app.get("/health/providers")
+async def get_provider_health():
+    return {
+        "providers": provider_health.snapshot(),
+        "clients": provider_clients.stats(),
+        "hedging": {"enabled": hedge.IMAGE_HEDGING, **hedge_budget.stats()},
+    }
+
+
+@app.post("/warmup")
+async def warmup(providers: Optional[str] = None):
+    """Build provider clients now instead of on first use (?providers=huggingface,replicate; default all)."""
+    names = [p.strip() for p in providers.split(",") if p.strip()] if providers else None
+    return {"providers": await provider_clients.warm(names)}
+
+
+@app.get("/health/worker")
+async def get_worker_health():
+    """Which worker answered, and where its shared state lives."""
+    return {
+        "pid": os.getpid(),
+        "web_concurrency": WEB_CONCURRENCY,
+        "session_backend": type(sessions).__name__,
+        "shared_state": _shared_state.path if _shared_state is not None else None,
+        "draining": job_queue.draining,
+        "jobs_running": job_queue.running,
+    }
+
+
+@app.get("/health/intent")
+async def get_intent_stats():
+    return intent_stats.stats()
+
+
+@app.get("/health/upstream")
+async def get_upstream_stats():
+    return upstream.pool.stats()
+
+
+@app.get("/health/load")
+async def get_load_stats():
+    return degrader.stats()
+
+
+@app.get("/health/ratelimits")
+async def get_rate_limits():
+    # Shared buckets are read from SQLite
+    return await asyncio.to_thread(rate_limits.stats)
+
+
+# Thumbnails / AVIF-WebP-JPEG re-encodes of stored images, built in a process pool
+image_encoder = image_variants.VariantEncoder(image_blobs)
+
+
+@app.get("/images/{image_id}")
+async def get_image(image_id: str, request: Request, w: Optional[int] = None, format: Optional[str] = None):
     """
-    Generate placeholder images with unique colors based on the seed prompt.
-    Each image is represented as an SVG data URL.
+    Stored image by ID. With ?w=<px> (snapped to IMAGE_THUMBNAIL_SIZES) and/or
+    ?format=auto a metadata-free variant is served instead, encoded as the best
+    of AVIF/WebP/JPEG the client's Accept header allows.
     """
-    import hashlib
-    import random
-
-    # Generate a deterministic hash from the seed prompt
-    hash_val = hashlib.md5(seed_prompt.encode()).hexdigest()
-    random.seed(hash_val)
-
-    demo_images = []
-    for i in range(num_images):
-        hue = (int(hash_val, 16) + i * 120) % 360  # Spread hues evenly
-        saturation = random.randint(60, 100)  # Saturation between 60-100%
-        lightness = random.randint(50, 80)  # Lightness between 50-80%
-        color = f"hsl({hue}, {saturation}%, {lightness}%)"
-
-        # Create SVG with gradient background
-        svg = (
-            f"<svg xmlns='http://www.w3.org/2000/svg' width='512' height='512' viewBox='0 0 512 512'>"
-            f"<rect width='100%' height='100%' fill='{color}'/>"
-            f"<text x='50%' y='50%' font-size='24' fill='white' text-anchor='middle' dominant-baseline='middle'>"
-            f"Placeholder {i+1}</text>"
-            f"</svg>"
-        )
-        data_url = "data:image/svg+xml;charset=utf-8," + urllib.parse.quote(svg)
-        demo_images.append(data_url)
+    negotiated = (w is not None or format == "auto") and not image_id.endswith(".svg")
+    if negotiated:
+        try:
+            variant = await image_encoder.get(image_id, image_variants.snap_width(w), request.headers.get("accept"))
+        except Exception:
+            raise HTTPException(status_code=500, detail="Image processing failed")
+        if variant is None:
+            raise HTTPException(status_code=404, detail="Image not found")
+        image_id, path = variant
+    else:
+        path = image_blobs.path(image_id)
+    if path is None:
+        raise HTTPException(status_code=404, detail="Image not found")
 
-    return demo_images
+    etag = image_store.etag_for(image_id)
+    headers = {
+        "ETag": etag,
+        # Content-addressed: the bytes behind an ID never change
+        "Cache-Control": "public, max-age=31536000, immutable",
+        "Accept-Ranges": "bytes",
+    }
+    if negotiated:
+        headers["Vary"] = "Accept"
+    if etag in request.headers.get("if-none-match", ""):
+        return Response(status_code=304, headers=headers)
+
+    media_type = image_store.CONTENT_TYPES[image_id.rsplit(".", 1)[1]]
+    data = await asyncio.to_thread(_read_file, path)
+    size = len(data)
+    try:
+        byte_range = image_store.parse_range(request.headers.get("range"), size)
+    except ValueError:
+        return Response(status_code=416, headers={**headers, "Content-Range": f"bytes */{size}"})
+    if byte_range is None or (request.headers.get("if-range") not in (None, etag)):
+        return Response(content=data, media_type=media_type, headers=headers)
+
+    start, end = byte_range
+    headers["Content-Range"] = f"bytes {start}-{end}/{size}"
+    return Response(content=data[start:end + 1], status_code=206, media_type=media_type, headers=headers)
+
+
+def _read_file(path: str) -> bytes:
+    with open(path, "rb") as f:
+        return f.read()
+
+
+@app.get("/cache/stats")
+async def get_cache_stats():
+    return {
+        "images": image_cache.stats(),
+        "completions": completion_cache.stats(),
+        "variants": image_encoder.stats(),
+        "placeholders": placeholders.stats(),
+        "prompt_index": prompt_index.stats(),
+        "generation_index": generation_index.stats(),
+    }
+
+
+metrics.registry.gauge("vizzy_sessions", "Sessions currently stored", lambda: sessions.stats()["sessions"])
+metrics.registry.gauge("vizzy_session_bytes", "Approximate bytes held by the session store", lambda: sessions.stats()["bytes"])
+metrics.registry.gauge("vizzy_image_cache_bytes", "Bytes in the in-memory image cache", lambda: image_cache.memory.total_bytes)
+metrics.registry.gauge("vizzy_completion_cache_bytes", "Bytes in the completion cache", lambda: completion_cache.memory.total_bytes)
+metrics.registry.gauge("vizzy_job_queue_depth", "Jobs waiting for a worker", lambda: job_queue.depth)
+metrics.registry.gauge("vizzy_degradation_level", "Image quality tier in use (0 = full)", lambda: degrader.level)
+metrics.registry.gauge("vizzy_load_pressure", "Load pressure seen by the degrader (1 = at capacity)", degrader.pressure)
+
+
+@app.get("/metrics")
+async def get_metrics():
+    """Prometheus text exposition of the metrics above and in metrics.py."""
+    # In a thread: gauges such as the SQLite session count may wait on another worker's lock
+    return Response(await asyncio.to_thread(metrics.render), media_type="text/plain; version=0.0.4; charset=utf-8")
+
+
+def _generate_placeholder_images(num_images: int, seed_prompt: str) -> List[str]:
+    """
+    Placeholder images coloured by the seed prompt (SVG, or PNG with
+    PLACEHOLDER_FORMAT=png), as data URLs. Deterministic and memoized per prompt.
+    """
+    return placeholders.generate(seed_prompt, num_images)
 
 
 if __name__ == "__main__":
     import uvicorn
-    uvicorn.run(app, host="0.0.0.0", port=8000)
+    port = int(os.getenv("PORT", "8000"))
+    if WEB_CONCURRENCY > 1:
+        # Workers are separate processes, so uvicorn needs an import string
+        uvicorn.run("main:app", app_dir=os.path.dirname(os.path.abspath(__file__)), host="0.0.0.0", port=port,
+                    workers=WEB_CONCURRENCY, timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_TIMEOUT))
+    else:
+        uvicorn.run(app, host="0.0.0.0", port=port, timeout_graceful_shutdown=int(SHUTDOWN_DRAIN_TIMEOUT))
@@ -0,0 +1,369 @@
+"""
+In-process metrics and per-request tracing, exported at GET /metrics in the
+Prometheus text format (no client library needed).
+
+    with metrics.span("interpret_intent"):            # timed, traced, histogrammed
+        ...
+    with metrics.span("provider", provider="replicate") as s:
+        ...
+        s.outcome = "placeholder"
+
+Every span feeds the vizzy_span_seconds histogram labelled by span / provider
+/ model / outcome; inside a request started with start_trace() it's also kept
+in that request's trace (logged as one JSON line with METRICS_TRACE_LOG=true).
+Everything is a dict lookup plus a bisect under a lock, cheap enough to leave
+on (see benchmarks/bench_metrics_overhead.py).
+"""
+
+import asyncio
+import bisect
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from typing import Callable, Dict, List, Optional, Tuple
+
+METRICS_ENABLED = os.getenv("METRICS_ENABLED", "true").lower() in ("1", "true", "yes")
+METRICS_TRACE_LOG = os.getenv("METRICS_TRACE_LOG", "false").lower() in ("1", "true", "yes")
+
+# Upstream calls range from tens of ms (cache, local) to minutes (HF cold starts)
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 20, 40, 60, 120)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+class Metric:
+    kind = "untyped"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        self.name = name
+        self.help = help_text
+        self.labels = tuple(labels)
+        self._lock = threading.Lock()
+
+    def _key(self, labels: Dict[str, str]) -> Tuple[str, ...]:
+        return tuple(str(labels.get(n, "")) for n in self.labels)
+
+    def samples(self) -> List[str]:
+        raise NotImplementedError
+
+    def render(self) -> str:
+        lines = [f"# HELP {self.name} {self.help}", f"# TYPE {self.name} {self.kind}"]
+        return "\n".join(lines + self.samples())
+
+
+class Counter(Metric):
+    kind = "counter"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = ()):
+        super().__init__(name, help_text, labels)
+        self.values: Dict[Tuple[str, ...], float] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = self._key(labels)
+        with self._lock:
+            self.values[key] = self.values.get(key, 0) + amount
+
+    def get(self, **labels) -> float:
+        return self.values.get(self._key(labels), 0)
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted(self.values.items())
+        return [f"{self.name}{_format_labels(self.labels, k)} {v}" for k, v in items]
+
+
+class Gauge(Metric):
+    """Value read from a callback at scrape time."""
+
+    kind = "gauge"
+
+    def __init__(self, name: str, help_text: str, read: Callable[[], float]):
+        super().__init__(name, help_text)
+        self.read = read
+
+    def samples(self) -> List[str]:
+        try:
+            return [f"{self.name} {float(self.read())}"]
+        except Exception as e:
+            logging.warning(f"Gauge {self.name} failed: {e}")
+            return []
+
+
+class Histogram(Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        super().__init__(name, help_text, labels)
+        self.buckets = tuple(sorted(buckets))
+        # key -> [per-bucket counts..., +Inf count, sum]
+        self.values: Dict[Tuple[str, ...], list] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = self._key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            row = self.values.get(key)
+            if row is None:
+                row = self.values[key] = [0] * (len(self.buckets) + 1) + [0.0]
+            row[index] += 1
+            row[-1] += value
+
+    def samples(self) -> List[str]:
+        with self._lock:
+            items = sorted((k, list(v)) for k, v in self.values.items())
+        lines = []
+        for key, row in items:
+            cumulative = 0
+            for bound, count in zip(self.buckets, row):
+                cumulative += count
+                le = 'le="%s"' % bound
+                lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            cumulative += row[len(self.buckets)]
+            le = 'le="+Inf"'
+            lines.append(f"{self.name}_bucket{_format_labels(self.labels, key, le)} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(self.labels, key)} {row[-1]}")
+            lines.append(f"{self.name}_count{_format_labels(self.labels, key)} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self.metrics: Dict[str, Metric] = {}
+
+    def register(self, metric: Metric) -> Metric:
+        self.metrics[metric.name] = metric
+        return metric
+
+    def counter(self, name: str, help_text: str, labels: Tuple[str, ...] = ()) -> Counter:
+        return self.register(Counter(name, help_text, labels))
+
+    def histogram(self, name: str, help_text: str, labels: Tuple[str, ...] = (), buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        return self.register(Histogram(name, help_text, labels, buckets))
+
+    def gauge(self, name: str, help_text: str, read: Callable[[], float]) -> Gauge:
+        return self.register(Gauge(name, help_text, read))
+
+    def render(self) -> str:
+        return "\n".join(m.render() for m in self.metrics.values()) + "\n"
+
+
+registry = Registry()
+
+SPAN_SECONDS = registry.histogram(
+    "vizzy_span_seconds", "Duration of traced pipeline spans", ("span", "provider", "model", "outcome")
+)
+REQUEST_SECONDS = registry.histogram(
+    "vizzy_http_request_seconds", "Time to response headers per endpoint", ("method", "handler", "status")
+)
+FALLBACKS = registry.counter(
+    "vizzy_fallbacks_total", "Times a stage, provider or model fell back to the next option", ("kind", "source")
+)
+IMAGES_SERVED = registry.counter(
+    "vizzy_images_served_total", "Images returned to clients, by whether they were placeholders", ("placeholder",)
+)
+INTENT_RESOLUTIONS = registry.counter(
+    "vizzy_intent_resolutions_total", "How interpret_intent was answered: fast (local rules), llm_early, llm_full, default", ("path",)
+)
+INTENT_SECONDS_SAVED = registry.counter(
+    "vizzy_intent_seconds_saved_total", "Estimated LLM time avoided by the local fast path / early stream stop", ("path",)
+)
+
+UPSTREAM_REQUESTS = registry.counter(
+    "vizzy_upstream_requests_total", "HTTP requests sent to each upstream host", ("host",)
+)
+UPSTREAM_CONNECTIONS = registry.counter(
+    "vizzy_upstream_connections_total", "New upstream connections opened (the rest reused a pooled one)", ("host",)
+)
+
+
+def rss_bytes() -> int:
+    """Current resident set size (peak RSS where /proc isn't available)."""
+    try:
+        with open("/proc/self/statm") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError, AttributeError):
+        pass
+    try:
+        import resource  # Unix only
+    except ImportError:
+        return 0
+    # ru_maxrss is KiB on Linux, bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+registry.gauge("vizzy_process_resident_memory_bytes", "Resident memory of this worker", rss_bytes)
+
+
+# --- tracing ---
+
+class Trace:
+    __slots__ = ("id", "name", "start", "spans")
+
+    def __init__(self, name: str):
+        self.id = uuid.uuid4().hex[:16]
+        self.name = name
+        self.start = time.perf_counter()
+        self.spans: List[dict] = []
+
+    def to_dict(self) -> dict:
+        return {
+            "trace_id": self.id,
+            "name": self.name,
+            "duration_ms": round((time.perf_counter() - self.start) * 1000, 2),
+            "spans": list(self.spans),
+        }
+
+
+_trace: contextvars.ContextVar[Optional[Trace]] = contextvars.ContextVar("trace", default=None)
+
+
+def start_trace(name: str) -> Optional[Trace]:
+    """Begin a trace for the current request (tasks and to_thread calls inherit it)."""
+    if not METRICS_ENABLED:
+        return None
+    trace = Trace(name)
+    _trace.set(trace)
+    return trace
+
+
+def current_trace() -> Optional[Trace]:
+    return _trace.get()
+
+
+def finish_trace(trace: Optional[Trace]) -> None:
+    if trace is not None and METRICS_TRACE_LOG:
+        logging.info(f"trace {json.dumps(trace.to_dict())}")
+
+
+class Span:
+    __slots__ = ("name", "provider", "model", "outcome")
+
+    def __init__(self, name: str, provider: str, model: str):
+        self.name = name
+        self.provider = provider
+        self.model = model
+        self.outcome = "ok"
+
+
+@contextlib.contextmanager
+def span(name: str, provider: str = "", model: str = ""):
+    """Time a block; exceptions mark the outcome (error / timeout / cancelled) and propagate."""
+    s = Span(name, provider, model)
+    if not METRICS_ENABLED:
+        yield s
+        return
+    start = time.perf_counter()
+    try:
+        yield s
+    except asyncio.CancelledError:
+        s.outcome = "cancelled"
+        raise
+    except (asyncio.TimeoutError, TimeoutError):
+        s.outcome = "timeout"
+        raise
+    except BaseException:
+        if s.outcome == "ok":
+            s.outcome = "error"
+        raise
+    finally:
+        record_span(name, start, time.perf_counter(), provider, model, s.outcome)
+
+
+def record_span(name: str, start: float, end: float, provider: str = "", model: str = "", outcome: str = "ok") -> None:
+    """Record a span timed elsewhere (perf_counter start/end), e.g. from an httpx trace hook."""
+    if not METRICS_ENABLED:
+        return
+    SPAN_SECONDS.observe(end - start, span=name, provider=provider, model=model, outcome=outcome)
+    trace = _trace.get()
+    if trace is not None:
+        # list.append is atomic, so spans from to_thread workers are safe
+        trace.spans.append({
+            "name": name,
+            "provider": provider or None,
+            "model": model or None,
+            "outcome": outcome,
+            "start_ms": round((start - trace.start) * 1000, 2),
+            "duration_ms": round((end - start) * 1000, 2),
+        })
+
+
+class MetricsMiddleware:
+    """
+    Plain ASGI middleware: starts a trace per HTTP request, times it to the
+    response headers and labels it by endpoint function (bounded cardinality).
+    Adds an X-Trace-Id response header.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not METRICS_ENABLED:
+            await self.app(scope, receive, send)
+            return
+        trace = start_trace(f"{scope['method']} {scope['path']}")
+        start = time.perf_counter()
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                endpoint = scope.get("endpoint")
+                REQUEST_SECONDS.observe(
+                    time.perf_counter() - start,
+                    method=scope["method"],
+                    handler=getattr(endpoint, "__name__", "unmatched"),
+                    status=message["status"],
+                )
+                message = {**message, "headers": [*message.get("headers", ()), (b"x-trace-id", trace.id.encode())]}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            finish_trace(trace)
+
+
+def fallback(kind: str, source: str) -> None:
+    if METRICS_ENABLED:
+        FALLBACKS.inc(kind=kind, source=source)
+
+
+def images_served(count: int, placeholder: bool) -> None:
+    if METRICS_ENABLED and count:
+        IMAGES_SERVED.inc(count, placeholder="true" if placeholder else "false")
+
+
+def intent_resolved(path: str, saved_s: float = 0.0) -> None:
+    if METRICS_ENABLED:
+        INTENT_RESOLUTIONS.inc(path=path)
+        if saved_s > 0:
+            INTENT_SECONDS_SAVED.inc(saved_s, path=path)
+
+
+def upstream_request(host: str) -> None:
+    if METRICS_ENABLED:
+        UPSTREAM_REQUESTS.inc(host=host)
+
+
+def upstream_connection(host: str) -> None:
+    if METRICS_ENABLED:
+        UPSTREAM_CONNECTIONS.inc(host=host)
+
+
+def render() -> str:
+    return registry.render()
@@ -0,0 +1,99 @@
+"""
+Small dependency-aware task graph for the /chat image pipeline.
+Each stage starts as soon as its dependencies finish, runs under its own
+deadline, and falls back to a default value on timeout or error so one slow
+stage can't sink the whole response. Per-stage timings are recorded.
+"""
+
+import asyncio
+import logging
+import time
+from typing import Any, Awaitable, Callable, Dict, Iterable, Optional
+
+
+class Stage:
+    def __init__(
+        self,
+        name: str,
+        func: Callable[[Dict[str, Any]], Awaitable[Any]],
+        deps: Iterable[str] = (),
+        deadline: Optional[float] = None,
+        fallback: Any = None,
+    ):
+        self.name = name
+        self.func = func
+        self.deps = tuple(deps)
+        self.deadline = deadline
+        # Either a value or a callable taking the results dict
+        self.fallback = fallback
+
+
+class TaskGraph:
+    """
+    Usage:
+        graph = TaskGraph()
+        graph.add("intent", lambda r: interpret_intent(msg), deadline=20)
+        graph.add("images", lambda r: generate_images(r["intent"][1]), deps=["intent"])
+        results, timings = await graph.run()
+    """
+
+    def __init__(self):
+        self.stages: Dict[str, Stage] = {}
+
+    def add(self, name: str, func, deps: Iterable[str] = (), deadline: Optional[float] = None, fallback: Any = None) -> "TaskGraph":
+        if name in self.stages:
+            raise ValueError(f"Duplicate stage: {name}")
+        for dep in deps:
+            if dep not in self.stages:
+                raise ValueError(f"Stage {name} depends on unknown stage {dep} (add dependencies first)")
+        self.stages[name] = Stage(name, func, deps, deadline, fallback)
+        return self
+
+    async def run(self) -> tuple[Dict[str, Any], Dict[str, dict]]:
+        results: Dict[str, Any] = {}
+        timings: Dict[str, dict] = {}
+        tasks: Dict[str, asyncio.Task] = {}
+        t_start = time.perf_counter()
+
+        async def run_stage(stage: Stage):
+            if stage.deps:
+                await asyncio.gather(*(tasks[d] for d in stage.deps))
+            started = time.perf_counter()
+            status = "ok"
+            try:
+                if stage.deadline:
+                    value = await asyncio.wait_for(stage.func(results), timeout=stage.deadline)
+                else:
+                    value = await stage.func(results)
+            except asyncio.TimeoutError:
+                status = "timeout"
+                logging.warning(f"Pipeline stage '{stage.name}' exceeded {stage.deadline}s deadline, using fallback")
+                value = stage.fallback(results) if callable(stage.fallback) else stage.fallback
+            except Exception as e:
+                status = "error"
+                logging.error(f"Pipeline stage '{stage.name}' failed: {e}")
+                value = stage.fallback(results) if callable(stage.fallback) else stage.fallback
+            finished = time.perf_counter()
+            results[stage.name] = value
+            timings[stage.name] = {
+                "start_ms": round((started - t_start) * 1000, 1),
+                "duration_ms": round((finished - started) * 1000, 1),
+                "status": status,
+            }
+
+        # Stages are added in dependency order, so every dep's task exists already
+        for stage in self.stages.values():
+            tasks[stage.name] = asyncio.create_task(run_stage(stage))
+        try:
+            await asyncio.gather(*tasks.values())
+        finally:
+            for task in tasks.values():
+                if not task.done():
+                    task.cancel()
+
+        timings["total"] = {
+            "start_ms": 0.0,
+            "duration_ms": round((time.perf_counter() - t_start) * 1000, 1),
+            "status": "ok",
+        }
+        return results, timings
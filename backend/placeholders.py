@@ -0,0 +1,113 @@
+"""
+Placeholder images, served when every image provider has failed (i.e. under
+the most load). Output is a pure function of the prompt: colours come from a
+local random.Random seeded with the prompt hash (never the shared global RNG),
+and finished data URLs are memoized per (prompt hash, count, format, size), so
+repeated prompts cost a dict lookup. Images are a two-stop gradient in a
+prompt-derived palette, as an SVG data URL or, with PLACEHOLDER_FORMAT=png, a
+small PNG rendered by Pillow.
+"""
+
+import base64
+import colorsys
+import functools
+import hashlib
+import os
+import random
+import urllib.parse
+from io import BytesIO
+from typing import Dict, Iterable, List, Tuple
+
+PLACEHOLDER_FORMAT = os.getenv("PLACEHOLDER_FORMAT", "svg").lower()  # svg | png
+PLACEHOLDER_SIZE = int(os.getenv("PLACEHOLDER_SIZE", "512"))
+# Raster placeholders are upscaled by the browser; keep them tiny
+PLACEHOLDER_PNG_SIZE = int(os.getenv("PLACEHOLDER_PNG_SIZE", "128"))
+PLACEHOLDER_CACHE_ENTRIES = int(os.getenv("PLACEHOLDER_CACHE_ENTRIES", "1024"))
+
+Color = Tuple[int, int, int]  # hue degrees, saturation %, lightness %
+
+_SVG_TEMPLATE = (
+    "<svg xmlns='http://www.w3.org/2000/svg' width='{size}' height='{size}' viewBox='0 0 {size} {size}'>"
+    "<defs><linearGradient id='g' x1='0' y1='0' x2='1' y2='1'>"
+    "<stop offset='0' stop-color='hsl({0[0]}, {0[1]}%, {0[2]}%)'/>"
+    "<stop offset='1' stop-color='hsl({1[0]}, {1[1]}%, {1[2]}%)'/>"
+    "</linearGradient></defs>"
+    "<rect width='100%' height='100%' fill='url(#g)'/>"
+    "<text x='50%' y='50%' font-size='24' fill='white' text-anchor='middle' dominant-baseline='middle'>"
+    "Placeholder {index}</text>"
+    "</svg>"
+)
+# Quoted once up front; the substituted values are plain digits, which need no quoting
+_SVG_URL_TEMPLATE = "data:image/svg+xml;charset=utf-8," + urllib.parse.quote(_SVG_TEMPLATE, safe="/{}[]")
+
+
+def prompt_hash(prompt: str) -> str:
+    return hashlib.md5(prompt.encode()).hexdigest()
+
+
+@functools.lru_cache(maxsize=PLACEHOLDER_CACHE_ENTRIES)
+def palette(digest: str, count: int) -> Tuple[Tuple[Color, Color], ...]:
+    """
+    `count` (start, end) gradient colour pairs for a prompt hash. Base hues are
+    spread 120 degrees apart as before; the end stop is a darker neighbouring hue.
+    """
+    rng = random.Random(digest)
+    base_hue = int(digest, 16)
+    pairs = []
+    for i in range(count):
+        hue = (base_hue + i * 120) % 360
+        start = (hue, rng.randint(60, 100), rng.randint(50, 80))
+        end = ((hue + rng.randint(25, 60)) % 360, start[1], max(25, start[2] - rng.randint(15, 30)))
+        pairs.append((start, end))
+    return tuple(pairs)
+
+
+def _rgb(color: Color) -> Tuple[int, int, int]:
+    r, g, b = colorsys.hls_to_rgb(color[0] / 360, color[2] / 100, color[1] / 100)
+    return round(r * 255), round(g * 255), round(b * 255)
+
+
+def _svg(stops: Tuple[Color, Color], index: int, size: int) -> str:
+    return _SVG_URL_TEMPLATE.format(*stops, size=size, index=index)
+
+
+@functools.lru_cache(maxsize=4)
+def _ramp(size: int):
+    """Diagonal greyscale ramp: mean of the vertical gradient and its transpose."""
+    from PIL import Image
+
+    vertical = Image.linear_gradient("L")
+    return Image.blend(vertical, vertical.transpose(Image.Transpose.TRANSPOSE), 0.5).resize((size, size), Image.BILINEAR)
+
+
+def _png(stops: Tuple[Color, Color], size: int) -> str:
+    from PIL import ImageOps
+
+    # colorize maps the shared ramp onto the two stops in C
+    image = ImageOps.colorize(_ramp(size), black=_rgb(stops[0]), white=_rgb(stops[1]))
+    out = BytesIO()
+    image.save(out, format="PNG")
+    return "data:image/png;base64," + base64.b64encode(out.getvalue()).decode()
+
+
+@functools.lru_cache(maxsize=PLACEHOLDER_CACHE_ENTRIES)
+def _render(digest: str, num_images: int, fmt: str, size: int) -> Tuple[str, ...]:
+    if fmt == "png":
+        return tuple(_png(stops, size) for stops in palette(digest, num_images))
+    return tuple(_svg(stops, i + 1, size) for i, stops in enumerate(palette(digest, num_images)))
+
+
+def generate(prompt: str, num_images: int, fmt: str = PLACEHOLDER_FORMAT) -> List[str]:
+    """Placeholder data URLs for a prompt; identical prompts give identical images."""
+    size = PLACEHOLDER_PNG_SIZE if fmt == "png" else PLACEHOLDER_SIZE
+    return list(_render(prompt_hash(prompt), num_images, fmt, size))
+
+
+def generate_many(prompts: Iterable[str], num_images: int, fmt: str = PLACEHOLDER_FORMAT) -> Dict[str, List[str]]:
+    """Bulk variant for batches: each distinct prompt is rendered once."""
+    return {prompt: generate(prompt, num_images, fmt) for prompt in dict.fromkeys(prompts)}
+
+
+def stats() -> dict:
+    info = _render.cache_info()
+    return {"format": PLACEHOLDER_FORMAT, "hits": info.hits, "misses": info.misses, "entries": info.currsize}
@@ -0,0 +1,97 @@
+"""
+Lazily built provider clients (HuggingFace InferenceClient, the replicate module).
+Nothing heavy is imported until a provider is first used, so serverless cold
+starts that only serve chat never pay for huggingface_hub or replicate.
+WARMUP_PROVIDERS (or POST /warmup) builds selected providers ahead of time.
+"""
+
+import asyncio
+import importlib.util
+import logging
+import os
+import threading
+import time
+from typing import Any, Callable, Dict, Iterable, Optional
+
+# Comma-separated providers to build in the background at startup ("" = none)
+WARMUP_PROVIDERS = [p.strip() for p in os.getenv("WARMUP_PROVIDERS", "").split(",") if p.strip()]
+
+
+def module_available(name: str) -> bool:
+    """True if `name` is importable, without importing it."""
+    return importlib.util.find_spec(name) is not None
+
+
+class ProviderRegistry:
+    def __init__(self):
+        self._factories: Dict[str, Callable[[], Any]] = {}
+        self._configured: Dict[str, Callable[[], bool]] = {}
+        self._clients: Dict[str, Any] = {}
+        self._errors: Dict[str, str] = {}
+        self._init_ms: Dict[str, float] = {}
+        self._lock = threading.Lock()
+
+    def register(self, name: str, factory: Callable[[], Any], configured: Callable[[], bool]) -> None:
+        """`configured` must be cheap (keys present, module findable); `factory` does the real work."""
+        self._factories[name] = factory
+        self._configured[name] = configured
+
+    def configured(self, name: str) -> bool:
+        return name in self._factories and self._configured[name]() and name not in self._errors
+
+    def set(self, name: str, client: Any) -> None:
+        """Install a ready-made client (benchmarks inject fakes this way)."""
+        with self._lock:
+            self._clients[name] = client
+            self._errors.pop(name, None)
+
+    def get(self, name: str) -> Optional[Any]:
+        """Return the client, building it on first use; None if unconfigured or it failed to build."""
+        client = self._clients.get(name)
+        if client is not None or not self.configured(name):
+            return client
+        with self._lock:
+            if name in self._clients or name in self._errors:
+                return self._clients.get(name)
+            started = time.perf_counter()
+            try:
+                client = self._factories[name]()
+            except Exception as e:
+                logging.warning(f"Failed to initialize provider {name}: {e}")
+                self._errors[name] = str(e)[:200]
+                return None
+            self._init_ms[name] = round((time.perf_counter() - started) * 1000, 1)
+            self._clients[name] = client
+            logging.info(f"Provider {name} initialized in {self._init_ms[name]} ms")
+            return client
+
+    async def aget(self, name: str) -> Optional[Any]:
+        """Like get(), but builds off the event loop (imports can take hundreds of ms)."""
+        client = self._clients.get(name)
+        if client is not None:
+            return client
+        return await asyncio.to_thread(self.get, name)
+
+    async def warm(self, names: Optional[Iterable[str]] = None) -> Dict[str, dict]:
+        names = list(names) if names is not None else list(self._factories)
+        result = {}
+        for name in names:
+            if name not in self._factories:
+                result[name] = {"status": "unknown"}
+            elif not self._configured[name]():
+                result[name] = {"status": "not_configured"}
+            else:
+                client = await self.aget(name)
+                result[name] = {"status": "ready" if client is not None else "failed", "init_ms": self._init_ms.get(name)}
+        return result
+
+    def stats(self) -> Dict[str, dict]:
+        return {
+            name: {
+                "configured": self._configured[name](),
+                "initialized": name in self._clients,
+                "init_ms": self._init_ms.get(name),
+                "error": self._errors.get(name),
+            }
+            for name in self._factories
+        }
@@ -0,0 +1,473 @@
+"""
+Per-provider / per-model admission control in front of upstream calls.
+Provider keys ("huggingface", "replicate", "openrouter") are charged once per
+call into that provider; model keys ("openrouter:<model>", "huggingface:<model>",
+"replicate:<model>") once per upstream request. Each configured key gets a token
+bucket (requests/sec + burst), a concurrency cap and a daily quota. Async waiters queue round-robin by session so one busy
+session can't starve the rest; when the predicted wait exceeds the caller's
+budget the call is refused with RateLimited *before* it reaches the upstream,
+letting callers shed load or downgrade to a cheaper model.
+
+Configure with RATE_LIMITS, e.g.
+    RATE_LIMITS="openrouter=rps:2,burst:4,concurrency:8,daily:5000;huggingface:black-forest-labs/FLUX.1-schnell=rps:0.5,concurrency:2"
+Keys without a configured limit are unlimited. The clock is injectable so the
+limiter can be driven by a fake clock.
+
+With a SharedState (multi-worker mode) the token bucket, daily quota and 429
+back-off of every key live in the shared SQLite file, so all workers on the
+node draw from one budget; the concurrency cap and fair queue stay per worker.
+A shared bucket is only touched from worker threads (SQLite may wait on another
+process's lock): async waiters are admitted by a dispatcher task that asks the
+bucket via asyncio.to_thread, and predicted waits use its last answer.
+"""
+
+import asyncio
+import contextlib
+import contextvars
+import logging
+import math
+import os
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Callable, Dict, Optional, Tuple
+
+RATE_LIMITS = os.getenv("RATE_LIMITS", "")
+# How long a call may queue for admission before it's shed / downgraded (seconds)
+RATE_LIMIT_MAX_WAIT = float(os.getenv("RATE_LIMIT_MAX_WAIT", "2"))
+
+# Session the current request belongs to, used for fair queueing
+current_session: contextvars.ContextVar[str] = contextvars.ContextVar("rate_limit_session", default="anonymous")
+
+
+class RateLimited(Exception):
+    def __init__(self, key: str, retry_after: float):
+        super().__init__(f"Rate limit for '{key}' would need {retry_after:.1f}s wait")
+        self.key = key
+        self.retry_after = retry_after
+
+
+class Lease:
+    __slots__ = ("limiter", "released")
+
+    def __init__(self, limiter: "Limiter"):
+        self.limiter = limiter
+        self.released = False
+
+    def release(self) -> None:
+        if not self.released:
+            self.released = True
+            self.limiter._release()
+
+
+class Limiter:
+    def __init__(
+        self,
+        key: str,
+        rps: float = 0,
+        burst: float = 0,
+        concurrency: int = 0,
+        daily: int = 0,
+        clock: Callable[[], float] = time.time,
+        shared=None,
+    ):
+        self.key = key
+        self.rps = rps
+        self.burst = burst or max(1.0, rps)
+        self.concurrency = concurrency
+        self.daily = daily
+        self.clock = clock
+        self.shared = shared
+
+        self.tokens = self.burst
+        self.last_refill = clock()
+        self.inflight = 0
+        self.day = self._day(self.last_refill)
+        self.used_today = 0
+        self.blocked_until = 0.0
+
+        self.granted = 0
+        self.shed = 0
+        self.penalties = 0
+
+        self._lock = threading.RLock()
+        # session -> deque of (future, loop); OrderedDict order is the round-robin order
+        self._waiters: "OrderedDict[str, deque]" = OrderedDict()
+        self._timer: Optional[asyncio.TimerHandle] = None
+        # Shared mode: when the shared bucket last said a token would be free, and
+        # whether a dispatcher task is already admitting async waiters
+        self._shared_until = 0.0
+        self._dispatching = False
+
+    @staticmethod
+    def _day(now: float) -> int:
+        return int(now // 86400)
+
+    # --- accounting (call with the lock held) ---
+
+    def _refill(self, now: float) -> None:
+        if self.rps:
+            self.tokens = min(self.burst, self.tokens + (now - self.last_refill) * self.rps)
+        self.last_refill = now
+        day = self._day(now)
+        if day != self.day:
+            self.day, self.used_today = day, 0
+
+    def _wait_time(self, now: float) -> float:
+        """Seconds until one more call could be admitted; inf if only a release can help."""
+        if self.shared is not None:
+            if self.concurrency and self.inflight >= self.concurrency:
+                return math.inf
+            return max(0.0, self._shared_until - now)
+        self._refill(now)
+        if self.daily and self.used_today >= self.daily:
+            return (self.day + 1) * 86400 - now
+        if self.concurrency and self.inflight >= self.concurrency:
+            return math.inf
+        if now < self.blocked_until:
+            return self.blocked_until - now
+        if self.rps and self.tokens < 1:
+            return (1 - self.tokens) / self.rps
+        return 0.0
+
+    def _admit(self, now: float) -> Tuple[float, Optional[Lease]]:
+        """(0, lease) if a call can go now, else (wait, None). Local buckets only."""
+        wait = self._wait_time(now)
+        return (0.0, self._grant()) if wait == 0 else (wait, None)
+
+    def _take_shared(self, notify: bool = True) -> Tuple[float, Optional[Lease]]:
+        """
+        _admit() against the shared bucket. Blocks on SQLite, so call it without
+        the lock and never on the event loop; the concurrency slot is held
+        while the bucket is asked. With `notify`, async waiters that saw that
+        slot taken are woken when it is handed back (the dispatcher itself
+        passes False so it doesn't wake itself in a loop).
+        """
+        with self._lock:
+            if self.concurrency and self.inflight >= self.concurrency:
+                return math.inf, None
+            self.inflight += 1
+        try:
+            # Atomic across workers: another process may have taken the last token
+            wait = self.shared.take(self.key, self.rps, self.burst, self.daily)
+        except BaseException:
+            self._hand_back(notify)
+            raise
+        with self._lock:
+            self._shared_until = self.clock() + wait
+            if wait == 0:
+                self.inflight -= 1
+                return 0.0, self._grant()
+        self._hand_back(notify)
+        return wait, None
+
+    def _hand_back(self, notify: bool) -> None:
+        """Return the slot _take_shared() held without admitting anyone."""
+        with self._lock:
+            self.inflight -= 1
+            waiter = self._next_waiter() if notify else None
+        if waiter is not None:
+            waiter[1].call_soon_threadsafe(self._dispatch)
+
+    def _grant(self) -> Lease:
+        if self.rps and self.shared is None:
+            self.tokens -= 1
+        self.inflight += 1
+        self.used_today += 1
+        self.granted += 1
+        return Lease(self)
+
+    def _has_waiters(self) -> bool:
+        return any(self._waiters.values())
+
+    def predicted_wait(self) -> float:
+        with self._lock:
+            wait = self._wait_time(self.clock())
+            if wait == 0 and self._has_waiters():
+                # Queue ahead of us; assume one token interval per waiter
+                queued = sum(len(q) for q in self._waiters.values())
+                wait = queued / self.rps if self.rps else math.inf
+            return wait
+
+    # --- sync path ---
+
+    def try_acquire(self) -> Optional[Lease]:
+        with self._lock:
+            if self._has_waiters():
+                return None
+            if self.shared is None:
+                return self._admit(self.clock())[1]
+        return self._take_shared()[1]
+
+    def acquire_sync(self, max_wait: float = RATE_LIMIT_MAX_WAIT, sleep: Callable[[float], None] = time.sleep) -> Lease:
+        """Blocking acquire for threaded callers (not fair-queued)."""
+        deadline = self.clock() + max_wait
+        while True:
+            with self._lock:
+                if self._has_waiters():
+                    wait, lease = self._wait_time(self.clock()), None
+                elif self.shared is None:
+                    wait, lease = self._admit(self.clock())
+                else:
+                    wait, lease = None, None
+            if wait is None:
+                wait, lease = self._take_shared()
+            if lease is not None:
+                return lease
+            with self._lock:
+                remaining = deadline - self.clock()
+                if (wait != math.inf and wait > remaining) or remaining <= 0:
+                    self.shed += 1
+                    raise RateLimited(self.key, wait if wait != math.inf else max_wait)
+            sleep(min(remaining, wait if wait != math.inf else 0.05, 0.25))
+
+    # --- async path ---
+
+    async def acquire(self, session: str = "anonymous", max_wait: float = RATE_LIMIT_MAX_WAIT) -> Lease:
+        loop = asyncio.get_running_loop()
+        with self._lock:
+            now = self.clock()
+            # A shared bucket is never asked on the loop: queue and let the dispatcher task admit
+            if self.shared is not None or self._has_waiters():
+                wait = self._wait_time(now)
+            else:
+                wait, lease = self._admit(now)
+                if lease is not None:
+                    return lease
+            if wait != math.inf and wait > max_wait:
+                # Don't even queue: it can't be admitted in time
+                self.shed += 1
+                raise RateLimited(self.key, wait)
+            future = loop.create_future()
+            self._waiters.setdefault(session, deque()).append((future, loop))
+            self._schedule(loop, wait)
+        try:
+            return await asyncio.wait_for(future, timeout=max_wait)
+        except asyncio.TimeoutError:
+            with self._lock:
+                self.shed += 1
+                self._forget(session, future)
+            raise RateLimited(self.key, max_wait)
+
+    def _forget(self, session: str, future: asyncio.Future) -> None:
+        queue = self._waiters.get(session)
+        if queue is None:
+            return
+        for item in list(queue):
+            if item[0] is future:
+                queue.remove(item)
+        if not queue:
+            del self._waiters[session]
+
+    def _schedule(self, loop: asyncio.AbstractEventLoop, wait: float) -> None:
+        if wait == 0:
+            loop.call_soon_threadsafe(self._dispatch)
+        elif wait != math.inf and self._timer is None:
+            self._timer = loop.call_later(wait, self._on_timer)
+
+    def _on_timer(self) -> None:
+        self._timer = None
+        self._dispatch()
+
+    def _dispatch(self) -> None:
+        """Hand free capacity to waiters, one session at a time (round-robin)."""
+        if self.shared is not None:
+            if not self._dispatching:
+                self._dispatching = True
+                asyncio.get_running_loop().create_task(self._dispatch_shared())
+            return
+        with self._lock:
+            while self._waiters:
+                session, queue = next(iter(self._waiters.items()))
+                if not queue[0][0].done():
+                    wait, lease = self._admit(self.clock())
+                    if lease is None:
+                        self._schedule(queue[0][1], wait)
+                        return
+                else:
+                    lease = None  # timed out / cancelled: skip it
+                self._waiters.popitem(last=False)
+                future, loop = queue.popleft()
+                if queue:
+                    self._waiters[session] = queue  # back of the line
+                if lease is not None:
+                    loop.call_soon_threadsafe(self._deliver, future, lease)
+
+    def _next_waiter(self) -> Optional[Tuple[asyncio.Future, asyncio.AbstractEventLoop]]:
+        """Head of the round-robin (dropping timed-out / cancelled waiters), or None."""
+        while self._waiters:
+            session, queue = next(iter(self._waiters.items()))
+            if not queue:
+                del self._waiters[session]
+            elif not queue[0][0].done():
+                return queue[0]
+            else:
+                self._pop_waiter()
+        return None
+
+    def _pop_waiter(self) -> Tuple[asyncio.Future, asyncio.AbstractEventLoop]:
+        session, queue = self._waiters.popitem(last=False)
+        waiter = queue.popleft()
+        if queue:
+            self._waiters[session] = queue  # back of the line
+        return waiter
+
+    async def _dispatch_shared(self) -> None:
+        """_dispatch() for a shared bucket: the SQLite round trip runs in a thread."""
+        try:
+            while True:
+                with self._lock:
+                    if self._next_waiter() is None:
+                        return
+                try:
+                    wait, lease = await asyncio.to_thread(self._take_shared, False)
+                except Exception as e:
+                    # Waiters time out into RateLimited rather than run unmetered
+                    logging.warning(f"Shared rate limit for '{self.key}' unavailable: {e}")
+                    return
+                with self._lock:
+                    waiter = self._next_waiter()
+                    if lease is None:
+                        if waiter is not None:
+                            self._schedule(waiter[1], wait)
+                        return
+                    if waiter is not None:
+                        self._pop_waiter()
+                if waiter is None:
+                    lease.release()  # everyone gave up while the bucket was asked
+                    return
+                waiter[1].call_soon_threadsafe(self._deliver, waiter[0], lease)
+        finally:
+            self._dispatching = False
+
+    @staticmethod
+    def _deliver(future: asyncio.Future, lease: Lease) -> None:
+        if future.done():
+            lease.release()
+        else:
+            future.set_result(lease)
+
+    def _release(self) -> None:
+        with self._lock:
+            self.inflight = max(0, self.inflight - 1)
+            waiter = next((q[0] for q in self._waiters.values() if q), None)
+        if waiter is not None:
+            waiter[1].call_soon_threadsafe(self._dispatch)
+
+    def penalize(self, retry_after: float) -> None:
+        """Upstream said 429: stop admitting until retry_after has passed."""
+        with self._lock:
+            now = self.clock()
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.tokens = 0
+            self.penalties += 1
+        if self.shared is not None:
+            _off_loop(self.shared.block, self.key, time.time() + retry_after)
+
+    def stats(self) -> dict:
+        with self._lock:
+            now = self.clock()
+            wait = self._wait_time(now)
+            return {
+                "rps": self.rps,
+                "burst": self.burst,
+                "concurrency": self.concurrency,
+                "daily": self.daily,
+                "tokens": round(self.tokens, 2),
+                "inflight": self.inflight,
+                "used_today": self.used_today,
+                "waiting": sum(len(q) for q in self._waiters.values()),
+                "waiting_sessions": len(self._waiters),
+                "next_admission_s": None if wait == math.inf else round(wait, 3),
+                "granted": self.granted,
+                "shed": self.shed,
+                "penalties": self.penalties,
+                "shared": self.shared.bucket_stats(self.key) if self.shared is not None else None,
+            }
+
+
+def _off_loop(fn: Callable, *args) -> None:
+    """Run a shared-state write in a thread when called on an event loop, else inline."""
+    try:
+        loop = asyncio.get_running_loop()
+    except RuntimeError:
+        fn(*args)
+        return
+    future = loop.run_in_executor(None, fn, *args)
+    future.add_done_callback(lambda f: f.exception() and logging.warning(f"Shared rate-limit write failed: {f.exception()}"))
+
+
+def parse_limits(spec: str) -> Dict[str, dict]:
+    """"key=rps:2,burst:4;other=concurrency:2" -> {"key": {"rps": 2.0, "burst": 4.0}, ...}"""
+    limits = {}
+    for item in spec.split(";"):
+        key, _, fields = item.strip().partition("=")
+        if not key or not fields:
+            continue
+        parsed = {}
+        for field in fields.split(","):
+            name, _, value = field.partition(":")
+            name = name.strip()
+            if name in ("rps", "burst"):
+                parsed[name] = float(value)
+            elif name in ("concurrency", "daily"):
+                parsed[name] = int(value)
+            elif name:
+                logging.warning(f"Ignoring unknown rate limit field '{name}' for {key}")
+        limits[key.strip()] = parsed
+    return limits
+
+
+class RateLimitRegistry:
+    def __init__(self, spec: str = RATE_LIMITS, clock: Callable[[], float] = time.time, shared=None):
+        self.clock = clock
+        self.shared = shared
+        self.limiters: Dict[str, Limiter] = {}
+        for key, fields in parse_limits(spec).items():
+            self.configure(key, **fields)
+
+    def configure(self, key: str, **fields) -> Limiter:
+        limiter = self.limiters[key] = Limiter(key, clock=self.clock, shared=self.shared, **fields)
+        return limiter
+
+    def get(self, key: str) -> Optional[Limiter]:
+        return self.limiters.get(key)
+
+    def predicted_wait(self, *keys: str) -> float:
+        return max((self.limiters[k].predicted_wait() for k in keys if k in self.limiters), default=0.0)
+
+    def penalize(self, key: str, retry_after: float) -> None:
+        limiter = self.limiters.get(key)
+        if limiter is not None:
+            limiter.penalize(retry_after)
+
+    @contextlib.asynccontextmanager
+    async def limit(self, *keys: str, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        """Admit one call against every configured key (in order); unknown keys are free."""
+        session = current_session.get()
+        leases = []
+        try:
+            for key in keys:
+                limiter = self.limiters.get(key)
+                if limiter is not None:
+                    leases.append(await limiter.acquire(session, max_wait))
+            yield
+        finally:
+            for lease in leases:
+                lease.release()
+
+    @contextlib.contextmanager
+    def limit_sync(self, *keys: str, max_wait: float = RATE_LIMIT_MAX_WAIT):
+        leases = []
+        try:
+            for key in keys:
+                limiter = self.limiters.get(key)
+                if limiter is not None:
+                    leases.append(limiter.acquire_sync(max_wait))
+            yield
+        finally:
+            for lease in leases:
+                lease.release()
+
+    def stats(self) -> dict:
+        return {key: limiter.stats() for key, limiter in sorted(self.limiters.items())}
@@ -0,0 +1,458 @@
+"""
+Session storage behind a small SessionStore interface.
+- MemorySessionStore: in-process LRU with idle TTL and byte accounting
+  (defaults are unbounded, matching the original module-level dict)
+- SQLiteSessionStore: WAL-mode SQLite file shared by every worker/process on
+  a host, so /refine and /session keep working across uvicorn workers
+Select with SESSION_BACKEND=memory|sqlite. Async code uses the a*() methods,
+which run a blocking backend's calls in a worker thread so a busy SQLite
+writer in another process can't stall the event loop.
+"""
+
+import abc
+import asyncio
+import json
+import logging
+import os
+import sqlite3
+import sys
+import threading
+import time
+from collections import OrderedDict
+from datetime import datetime
+from typing import Callable, Iterable, List, Optional
+
+from history import Entry, MessageLog, HISTORY_PAGE_DEFAULT, HISTORY_PAGE_MAX
+
+SESSION_BACKEND = os.getenv("SESSION_BACKEND", "memory").lower()
+SESSION_DB_PATH = os.getenv("SESSION_DB_PATH", os.path.join(os.path.dirname(__file__), "sessions.db"))
+# 0 disables the corresponding limit
+SESSION_MAX_SESSIONS = int(os.getenv("SESSION_MAX_SESSIONS", "0"))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", "0"))
+SESSION_TTL = float(os.getenv("SESSION_TTL", "0"))  # idle seconds
+
+
+def empty_taste() -> dict:
+    return {"styles": {}, "colors": {}, "moods": {}, "themes": {}}
+
+
+def entry_bytes(entry: Entry) -> int:
+    """Approximate memory held by one log entry."""
+    role, content, images = entry
+    size = sys.getsizeof(entry) + sys.getsizeof(role) + sys.getsizeof(content)
+    if images is not None:
+        size += sys.getsizeof(images) + sum(sys.getsizeof(i) for i in images)
+    return size
+
+
+class SessionStore(abc.ABC):
+    """Interface shared by the session backends. Session IDs are opaque strings."""
+
+    # Calls may wait on IO or another process's lock; the a*() methods then run them in a thread
+    blocking = False
+
+    @abc.abstractmethod
+    def exists(self, session_id: str) -> bool:
+        ...
+
+    @abc.abstractmethod
+    def create(self, session_id: str) -> None:
+        ...
+
+    @abc.abstractmethod
+    def get_info(self, session_id: str) -> Optional[dict]:
+        """{"created_at", "taste", "count"} or None if unknown/expired."""
+
+    @abc.abstractmethod
+    def append(self, session_id: str, entries: Iterable[Entry]) -> List[int]:
+        """
+        Append messages, returning their sequence numbers. A session that was
+        evicted while its request was in flight is recreated.
+        """
+
+    @abc.abstractmethod
+    def page(self, session_id: str, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    def all_messages(self, session_id: str) -> List[dict]:
+        ...
+
+    @abc.abstractmethod
+    def set_taste(self, session_id: str, taste: dict) -> None:
+        ...
+
+    @abc.abstractmethod
+    def stats(self) -> dict:
+        ...
+
+    async def _call(self, fn: Callable, *args):
+        if self.blocking:
+            return await asyncio.to_thread(fn, *args)
+        return fn(*args)
+
+    async def aexists(self, session_id: str) -> bool:
+        return await self._call(self.exists, session_id)
+
+    async def acreate(self, session_id: str) -> None:
+        await self._call(self.create, session_id)
+
+    async def aget_info(self, session_id: str) -> Optional[dict]:
+        return await self._call(self.get_info, session_id)
+
+    async def aappend(self, session_id: str, entries: Iterable[Entry]) -> List[int]:
+        return await self._call(self.append, session_id, list(entries))
+
+    async def apage(self, session_id: str, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT) -> List[dict]:
+        return await self._call(self.page, session_id, after, limit)
+
+    async def aall_messages(self, session_id: str) -> List[dict]:
+        return await self._call(self.all_messages, session_id)
+
+    async def aset_taste(self, session_id: str, taste: dict) -> None:
+        await self._call(self.set_taste, session_id, taste)
+
+    async def astats(self) -> dict:
+        return await self._call(self.stats)
+
+
+class _MemorySession:
+    __slots__ = ("created_at", "messages", "taste", "bytes", "last_access")
+
+    def __init__(self, now: float):
+        self.created_at = datetime.now().isoformat()
+        self.messages = MessageLog()
+        self.taste = empty_taste()
+        self.bytes = 256
+        self.last_access = now
+
+
+class MemorySessionStore(SessionStore):
+    def __init__(
+        self,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_bytes: int = SESSION_MAX_BYTES,
+        ttl: float = SESSION_TTL,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.total_bytes = 0
+        self.evictions = 0
+        self.expirations = 0
+        self._sessions: "OrderedDict[str, _MemorySession]" = OrderedDict()
+        self._lock = threading.RLock()
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def _touch(self, session_id: str) -> Optional[_MemorySession]:
+        session = self._sessions.get(session_id)
+        if session is None:
+            return None
+        now = self.clock()
+        if self.ttl and now - session.last_access > self.ttl:
+            self._drop(session_id)
+            self.expirations += 1
+            return None
+        session.last_access = now
+        self._sessions.move_to_end(session_id)
+        return session
+
+    def _drop(self, session_id: str) -> None:
+        session = self._sessions.pop(session_id)
+        self.total_bytes -= session.bytes
+
+    def _enforce_limits(self, keep: str) -> None:
+        # Oldest first; the idle-TTL check is cheap because order == access order
+        now = self.clock()
+        while self._sessions:
+            oldest_id, oldest = next(iter(self._sessions.items()))
+            if oldest_id == keep:
+                break
+            if self.ttl and now - oldest.last_access > self.ttl:
+                self.expirations += 1
+            elif (self.max_sessions and len(self._sessions) > self.max_sessions) or (
+                self.max_bytes and self.total_bytes > self.max_bytes
+            ):
+                self.evictions += 1
+            else:
+                break
+            self._drop(oldest_id)
+
+    def exists(self, session_id: str) -> bool:
+        with self._lock:
+            return self._touch(session_id) is not None
+
+    def create(self, session_id: str) -> None:
+        with self._lock:
+            if self._touch(session_id) is None:
+                session = _MemorySession(self.clock())
+                self._sessions[session_id] = session
+                self.total_bytes += session.bytes
+            self._enforce_limits(keep=session_id)
+
+    def get_info(self, session_id: str) -> Optional[dict]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                return None
+            return {"created_at": session.created_at, "taste": session.taste, "count": len(session.messages)}
+
+    def append(self, session_id: str, entries: Iterable[Entry]) -> List[int]:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is None:
+                self.create(session_id)
+                session = self._sessions[session_id]
+            seqs = []
+            for role, content, images in entries:
+                images = tuple(images) if images is not None else None
+                seqs.append(session.messages.append(role, content, images))
+                added = entry_bytes((role, content, images))
+                session.bytes += added
+                self.total_bytes += added
+            self._enforce_limits(keep=session_id)
+            return seqs
+
+    def page(self, session_id: str, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT) -> List[dict]:
+        with self._lock:
+            session = self._touch(session_id)
+            return session.messages.page(after, limit) if session else []
+
+    def all_messages(self, session_id: str) -> List[dict]:
+        with self._lock:
+            session = self._touch(session_id)
+            return session.messages.to_dicts() if session else []
+
+    def set_taste(self, session_id: str, taste: dict) -> None:
+        with self._lock:
+            session = self._touch(session_id)
+            if session is not None:
+                session.taste = taste
+
+    def stats(self) -> dict:
+        return {
+            "backend": "memory",
+            "sessions": len(self._sessions),
+            "bytes": self.total_bytes,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+class SQLiteSessionStore(SessionStore):
+    """
+    WAL-mode SQLite store usable from several processes at once.
+    One connection per thread; writers serialize on SQLite's own lock with a
+    busy timeout. Limits are enforced by periodic sweeps rather than per call.
+    """
+
+    SWEEP_EVERY = 100
+    blocking = True
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS sessions (
+        id TEXT PRIMARY KEY,
+        created_at TEXT NOT NULL,
+        last_access REAL NOT NULL,
+        taste TEXT NOT NULL,
+        count INTEGER NOT NULL DEFAULT 0,
+        bytes INTEGER NOT NULL DEFAULT 0
+    );
+    CREATE INDEX IF NOT EXISTS sessions_last_access ON sessions(last_access);
+    CREATE TABLE IF NOT EXISTS messages (
+        session_id TEXT NOT NULL,
+        seq INTEGER NOT NULL,
+        role TEXT NOT NULL,
+        content TEXT NOT NULL,
+        images TEXT,
+        PRIMARY KEY (session_id, seq)
+    ) WITHOUT ROWID;
+    """
+
+    def __init__(
+        self,
+        path: str = SESSION_DB_PATH,
+        max_sessions: int = SESSION_MAX_SESSIONS,
+        max_bytes: int = SESSION_MAX_BYTES,
+        ttl: float = SESSION_TTL,
+        clock: Callable[[], float] = time.time,
+    ):
+        self.path = path
+        self.max_sessions = max_sessions
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.clock = clock
+        self.evictions = 0
+        self.expirations = 0
+        self._ops = 0
+        self._local = threading.local()
+        with self._conn() as conn:
+            conn.executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    def _live_row(self, conn: sqlite3.Connection, session_id: str):
+        row = conn.execute(
+            "SELECT created_at, last_access, taste, count FROM sessions WHERE id = ?", (session_id,)
+        ).fetchone()
+        if row is None:
+            return None
+        now = self.clock()
+        if self.ttl and now - row[1] > self.ttl:
+            self._delete(conn, [session_id])
+            self.expirations += 1
+            return None
+        conn.execute("UPDATE sessions SET last_access = ? WHERE id = ?", (now, session_id))
+        return row
+
+    @staticmethod
+    def _delete(conn: sqlite3.Connection, ids: List[str]) -> None:
+        for session_id in ids:
+            conn.execute("DELETE FROM messages WHERE session_id = ?", (session_id,))
+            conn.execute("DELETE FROM sessions WHERE id = ?", (session_id,))
+
+    def _maybe_sweep(self, conn: sqlite3.Connection) -> None:
+        self._ops += 1
+        if self._ops % self.SWEEP_EVERY:
+            return
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            if self.ttl:
+                expired = [r[0] for r in conn.execute(
+                    "SELECT id FROM sessions WHERE last_access < ?", (self.clock() - self.ttl,)
+                )]
+                self._delete(conn, expired)
+                self.expirations += len(expired)
+            if self.max_sessions:
+                (count,) = conn.execute("SELECT COUNT(*) FROM sessions").fetchone()
+                if count > self.max_sessions:
+                    victims = [r[0] for r in conn.execute(
+                        "SELECT id FROM sessions ORDER BY last_access LIMIT ?", (count - self.max_sessions,)
+                    )]
+                    self._delete(conn, victims)
+                    self.evictions += len(victims)
+            if self.max_bytes:
+                (total,) = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+                for session_id, size in list(conn.execute("SELECT id, bytes FROM sessions ORDER BY last_access")):
+                    if total <= self.max_bytes:
+                        break
+                    self._delete(conn, [session_id])
+                    self.evictions += 1
+                    total -= size
+            conn.execute("COMMIT")
+        except sqlite3.Error as e:
+            conn.execute("ROLLBACK")
+            logging.warning(f"Session sweep failed: {e}")
+
+    def exists(self, session_id: str) -> bool:
+        return self._live_row(self._conn(), session_id) is not None
+
+    def create(self, session_id: str) -> None:
+        conn = self._conn()
+        if self._live_row(conn, session_id) is None:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, created_at, last_access, taste) VALUES (?, ?, ?, ?)",
+                (session_id, datetime.now().isoformat(), self.clock(), json.dumps(empty_taste())),
+            )
+        self._maybe_sweep(conn)
+
+    def get_info(self, session_id: str) -> Optional[dict]:
+        row = self._live_row(self._conn(), session_id)
+        if row is None:
+            return None
+        return {"created_at": row[0], "taste": json.loads(row[2]), "count": row[3]}
+
+    def append(self, session_id: str, entries: Iterable[Entry]) -> List[int]:
+        conn = self._conn()
+        entries = list(entries)
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            conn.execute(
+                "INSERT OR IGNORE INTO sessions (id, created_at, last_access, taste) VALUES (?, ?, ?, ?)",
+                (session_id, datetime.now().isoformat(), self.clock(), json.dumps(empty_taste())),
+            )
+            (start,) = conn.execute("SELECT count FROM sessions WHERE id = ?", (session_id,)).fetchone()
+            added = 0
+            for i, (role, content, images) in enumerate(entries):
+                images_json = json.dumps(list(images)) if images is not None else None
+                conn.execute(
+                    "INSERT INTO messages (session_id, seq, role, content, images) VALUES (?, ?, ?, ?, ?)",
+                    (session_id, start + i + 1, role, content, images_json),
+                )
+                added += len(content) + len(images_json or "") + 48
+            conn.execute(
+                "UPDATE sessions SET count = count + ?, bytes = bytes + ?, last_access = ? WHERE id = ?",
+                (len(entries), added, self.clock(), session_id),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        self._maybe_sweep(conn)
+        return [start + i + 1 for i in range(len(entries))]
+
+    @staticmethod
+    def _row_to_dict(row) -> dict:
+        seq, role, content, images = row
+        return {"seq": seq, "role": role, "content": content, "images": json.loads(images) if images is not None else None}
+
+    def page(self, session_id: str, after: int = 0, limit: int = HISTORY_PAGE_DEFAULT) -> List[dict]:
+        conn = self._conn()
+        if self._live_row(conn, session_id) is None:
+            return []
+        limit = max(1, min(limit, HISTORY_PAGE_MAX))
+        rows = conn.execute(
+            "SELECT seq, role, content, images FROM messages WHERE session_id = ? AND seq > ? ORDER BY seq LIMIT ?",
+            (session_id, max(0, after), limit),
+        )
+        return [self._row_to_dict(r) for r in rows]
+
+    def all_messages(self, session_id: str) -> List[dict]:
+        conn = self._conn()
+        if self._live_row(conn, session_id) is None:
+            return []
+        rows = conn.execute(
+            "SELECT seq, role, content, images FROM messages WHERE session_id = ? ORDER BY seq", (session_id,)
+        )
+        return [self._row_to_dict(r) for r in rows]
+
+    def set_taste(self, session_id: str, taste: dict) -> None:
+        self._conn().execute("UPDATE sessions SET taste = ? WHERE id = ?", (json.dumps(taste), session_id))
+
+    def stats(self) -> dict:
+        count, total = self._conn().execute("SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM sessions").fetchone()
+        return {
+            "backend": "sqlite",
+            "path": self.path,
+            "sessions": count,
+            "bytes": total,
+            "max_sessions": self.max_sessions,
+            "max_bytes": self.max_bytes,
+            "ttl_s": self.ttl,
+            "evictions": self.evictions,
+            "expirations": self.expirations,
+        }
+
+
+def create_session_store(backend: str = SESSION_BACKEND) -> SessionStore:
+    if backend == "sqlite":
+        logging.info(f"Using SQLite session store at {SESSION_DB_PATH}")
+        return SQLiteSessionStore()
+    if backend != "memory":
+        logging.warning(f"Unknown SESSION_BACKEND '{backend}', using memory")
+    return MemorySessionStore()
@@ -0,0 +1,248 @@
+"""
+Node-local state shared by every worker process (uvicorn --workers N).
+One WAL-mode SQLite file holds:
+- kv: TTL'd JSON values, namespaced; SharedCache puts a byte-bounded cache on
+  top (image / completion cache tier, job records)
+- buckets: token buckets + daily quotas + 429 back-off for rate limiting, so
+  N workers together stay within one provider limit instead of N times it
+
+Enabled by SHARED_STATE_DB (main.py sets a default when WEB_CONCURRENCY > 1).
+Calls block on SQLite; they are short (one indexed statement or one IMMEDIATE
+transaction) but async code on a hot path should still use asyncio.to_thread.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from typing import Any, Callable, Optional
+
+SHARED_STATE_DB = os.getenv("SHARED_STATE_DB", "")  # "" = per-process state only
+SHARED_CACHE_MAX_BYTES = int(os.getenv("SHARED_CACHE_MAX_BYTES", str(256 * 1024 * 1024)))
+
+
+class SharedState:
+    SWEEP_EVERY = 200
+
+    _SCHEMA = """
+    CREATE TABLE IF NOT EXISTS kv (
+        key TEXT PRIMARY KEY,
+        value TEXT NOT NULL,
+        bytes INTEGER NOT NULL,
+        expires REAL NOT NULL,
+        last_access REAL NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS kv_last_access ON kv(last_access);
+    CREATE TABLE IF NOT EXISTS buckets (
+        key TEXT PRIMARY KEY,
+        tokens REAL NOT NULL,
+        updated REAL NOT NULL,
+        blocked_until REAL NOT NULL DEFAULT 0,
+        day INTEGER NOT NULL,
+        used INTEGER NOT NULL DEFAULT 0
+    );
+    """
+
+    def __init__(self, path: str, clock: Callable[[], float] = time.time):
+        self.path = path
+        self.clock = clock
+        self._local = threading.local()
+        self._ops = 0
+        self._conn().executescript(self._SCHEMA)
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None, check_same_thread=False)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            conn.execute("PRAGMA busy_timeout=30000")
+            self._local.conn = conn
+        return conn
+
+    # --- key/value ---
+
+    def get(self, key: str) -> Any:
+        now = self.clock()
+        conn = self._conn()
+        row = conn.execute("SELECT value, expires FROM kv WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        if row[1] <= now:
+            conn.execute("DELETE FROM kv WHERE key = ? AND expires <= ?", (key, now))
+            return None
+        conn.execute("UPDATE kv SET last_access = ? WHERE key = ?", (now, key))
+        return json.loads(row[0])
+
+    def put(self, key: str, value: Any, ttl: float, max_bytes: int = SHARED_CACHE_MAX_BYTES) -> bool:
+        data = json.dumps(value)
+        if len(data) > max_bytes:
+            return False
+        now = self.clock()
+        self._conn().execute(
+            "INSERT OR REPLACE INTO kv (key, value, bytes, expires, last_access) VALUES (?, ?, ?, ?, ?)",
+            (key, data, len(data), now + ttl, now),
+        )
+        self._ops += 1
+        if self._ops % self.SWEEP_EVERY == 0:
+            self.sweep(max_bytes)
+        return True
+
+    def delete(self, key: str) -> None:
+        self._conn().execute("DELETE FROM kv WHERE key = ?", (key,))
+
+    def sweep(self, max_bytes: int = SHARED_CACHE_MAX_BYTES) -> int:
+        """Drop expired entries, then least recently used ones until under max_bytes."""
+        conn = self._conn()
+        removed = conn.execute("DELETE FROM kv WHERE expires <= ?", (self.clock(),)).rowcount
+        total = conn.execute("SELECT COALESCE(SUM(bytes), 0) FROM kv").fetchone()[0]
+        if total > max_bytes:
+            freed = 0
+            victims = []
+            for key, size in conn.execute("SELECT key, bytes FROM kv ORDER BY last_access"):
+                if total - freed <= max_bytes:
+                    break
+                victims.append((key,))
+                freed += size
+            conn.executemany("DELETE FROM kv WHERE key = ?", victims)
+            removed += len(victims)
+        return removed
+
+    def kv_stats(self, prefix: str = "") -> dict:
+        row = self._conn().execute(
+            "SELECT COUNT(*), COALESCE(SUM(bytes), 0) FROM kv WHERE key >= ? AND key < ?", (prefix, prefix + "\uffff")
+        ).fetchone()
+        return {"entries": row[0], "bytes": row[1]}
+
+    # --- token buckets ---
+
+    def _bucket_wait(self, row, rps: float, burst: float, daily: int, now: float):
+        """(wait seconds, tokens, blocked_until, day, used) after refilling a bucket row (None = new bucket)."""
+        day = int(now // 86400)
+        if row is None:
+            tokens, updated, blocked_until, row_day, used = burst, now, 0.0, day, 0
+        else:
+            tokens, updated, blocked_until, row_day, used = row
+        if rps:
+            tokens = min(burst, tokens + max(0.0, now - updated) * rps)
+        if row_day != day:
+            used = 0
+        if daily and used >= daily:
+            wait = (day + 1) * 86400 - now
+        elif now < blocked_until:
+            wait = blocked_until - now
+        elif rps and tokens < 1:
+            wait = (1 - tokens) / rps
+        else:
+            wait = 0.0
+        return wait, tokens, blocked_until, day, used
+
+    def peek(self, key: str, rps: float, burst: float, daily: int = 0) -> float:
+        row = self._conn().execute(
+            "SELECT tokens, updated, blocked_until, day, used FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        return self._bucket_wait(row, rps, burst, daily, self.clock())[0]
+
+    def take(self, key: str, rps: float, burst: float, daily: int = 0) -> float:
+        """Take one token atomically across processes; returns 0 on success, else the wait."""
+        conn = self._conn()
+        now = self.clock()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            row = conn.execute(
+                "SELECT tokens, updated, blocked_until, day, used FROM buckets WHERE key = ?", (key,)
+            ).fetchone()
+            wait, tokens, blocked_until, day, used = self._bucket_wait(row, rps, burst, daily, now)
+            if wait == 0:
+                tokens -= 1 if rps else 0
+                used += 1
+            conn.execute(
+                "INSERT OR REPLACE INTO buckets (key, tokens, updated, blocked_until, day, used) VALUES (?, ?, ?, ?, ?, ?)",
+                (key, tokens, now, blocked_until, day, used),
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        return wait
+
+    def block(self, key: str, until: float) -> None:
+        """Upstream 429: every worker stops admitting `key` until `until`."""
+        now = self.clock()
+        self._conn().execute(
+            "INSERT INTO buckets (key, tokens, updated, blocked_until, day) VALUES (?, 0, ?, ?, ?) "
+            "ON CONFLICT(key) DO UPDATE SET tokens = 0, updated = excluded.updated, "
+            "blocked_until = MAX(blocked_until, excluded.blocked_until)",
+            (key, now, until, int(now // 86400)),
+        )
+
+    def bucket_stats(self, key: str) -> Optional[dict]:
+        row = self._conn().execute(
+            "SELECT tokens, blocked_until, used FROM buckets WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        return {"tokens": round(row[0], 2), "blocked_until": row[1] or None, "used_today": row[2]}
+
+
+class SharedCache:
+    """
+    DiskCache-compatible (get / put / to_dict) view of one namespace of the
+    shared kv table, so it can stand in as a cache's second tier.
+    """
+
+    def __init__(self, state: SharedState, namespace: str, ttl: float, max_bytes: int = SHARED_CACHE_MAX_BYTES):
+        self.state = state
+        self.namespace = namespace
+        self.ttl = ttl
+        self.max_bytes = max_bytes
+        self.hits = 0
+        self.misses = 0
+
+    def _key(self, key: str) -> str:
+        return f"{self.namespace}:{key}"
+
+    def get(self, key: str) -> Any:
+        try:
+            value = self.state.get(self._key(key))
+        except sqlite3.Error as e:
+            logging.warning(f"Shared cache read failed for {key[:12]}: {e}")
+            value = None
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+    def put(self, key: str, value: Any, ttl: Optional[float] = None) -> bool:
+        try:
+            return self.state.put(self._key(key), value, self.ttl if ttl is None else ttl, self.max_bytes)
+        except sqlite3.Error as e:
+            logging.warning(f"Shared cache write failed for {key[:12]}: {e}")
+            return False
+
+    def delete(self, key: str) -> None:
+        self.state.delete(self._key(key))
+
+    def to_dict(self) -> dict:
+        return {"backend": "sqlite", "ttl_s": self.ttl, "hits": self.hits, "misses": self.misses,
+                **self.state.kv_stats(f"{self.namespace}:")}
+
+
+_state: Optional[SharedState] = None
+_state_lock = threading.Lock()
+
+
+def get_shared_state(path: str = SHARED_STATE_DB) -> Optional[SharedState]:
+    """Process-wide SharedState for SHARED_STATE_DB, or None when it isn't configured."""
+    global _state
+    if not path:
+        return None
+    with _state_lock:
+        if _state is None or _state.path != path:
+            logging.info(f"Using shared worker state at {path}")
+            _state = SharedState(path)
+        return _state
+
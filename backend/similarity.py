@@ -0,0 +1,268 @@
+"""
+Prompt canonicalization and a near-duplicate index over recent generations.
+
+- clean(): case-preserving tidy-up of a prompt (whitespace runs, repeated or
+  dangling separators like "a cat. . " / "a cat ,blue"), safe to show an LLM
+- canonicalize(): clean() + NFKC + lowercase + common UK/US spellings; the
+  form used for cache keys and for the index, so refine strings that differ
+  only in whitespace, case or a trailing ". " compare equal
+- SimilarityIndex: global, bounded index of recent generations. By default
+  only an identical canonical form is reused. With a near-match threshold
+  each text is also cut into character shingles hashed to a sorted
+  array('I'); a one-permutation MinHash signature split into LSH bands finds
+  candidates in O(1) dict lookups, and the exact shingle Jaccard against the
+  stored arrays decides. Shingles can't tell a wording change from a content
+  change over a long shared prefix ("...make it red" vs "...make it blue"
+  is 0.91), so near matching is opt-in.
+  Memory is max_entries * (shingle array + band keys), oldest evicted first.
+"""
+
+import os
+import re
+import threading
+import time
+import unicodedata
+import zlib
+from array import array
+from collections import OrderedDict, deque
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+
+# Reuse an earlier generation for a request with the same canonical form
+SIMILARITY_REUSE_ENABLED = os.getenv("SIMILARITY_REUSE_ENABLED", "true").lower() in ("1", "true", "yes")
+# Also reuse one at least this shingle-similar (0 = exact matches only)
+SIMILARITY_REUSE_THRESHOLD = float(os.getenv("SIMILARITY_REUSE_THRESHOLD", "0"))
+SIMILARITY_INDEX_ENTRIES = int(os.getenv("SIMILARITY_INDEX_ENTRIES", "2000"))
+SIMILARITY_SHINGLE_CHARS = int(os.getenv("SIMILARITY_SHINGLE_CHARS", "4"))
+# LSH: BANDS bands of ROWS MinHash values each; a pair with Jaccard J becomes a
+# candidate with probability 1 - (1 - J**ROWS)**BANDS (~0.9998 at J=0.9 for 8x4)
+SIMILARITY_BANDS = int(os.getenv("SIMILARITY_BANDS", "8"))
+SIMILARITY_ROWS = int(os.getenv("SIMILARITY_ROWS", "4"))
+# Exact Jaccard checks per lookup, so a crowded bucket can't make lookups linear
+SIMILARITY_MAX_CANDIDATES = int(os.getenv("SIMILARITY_MAX_CANDIDATES", "32"))
+
+_SPACE_RE = re.compile(r"\s+")
+_SPACE_BEFORE_PUNCT_RE = re.compile(r"\s+([.,;:!?])")
+# ". ." / ",," / ". ," -> keep the first separator
+_SEPARATOR_RUN_RE = re.compile(r"([.,;:!?])(?:\s*[.,;:])+")
+_LIST_SEPARATOR_RE = re.compile(r"([,;])(?=\S)")
+_TRAILING_RE = re.compile(r"[\s.,;:]+$")
+# Spelling variants folded in the comparison form only
+_SPELLINGS = {
+    "colour": "color", "colours": "colors", "coloured": "colored", "colourful": "colorful",
+    "watercolour": "watercolor", "watercolours": "watercolors", "grey": "gray", "greyscale": "grayscale",
+    "centre": "center", "theatre": "theater", "metre": "meter", "harbour": "harbor", "neighbourhood": "neighborhood",
+    "cosy": "cozy", "stylised": "stylized",
+}
+_SPELLING_RE = re.compile(r"\b(" + "|".join(map(re.escape, _SPELLINGS)) + r")\b")
+_LEADING_RE = re.compile(r"^[\s.,;:]+")
+
+
+def clean(text: str) -> str:
+    """Collapse whitespace and stray separators, keeping case and wording."""
+    text = _SPACE_RE.sub(" ", text)
+    text = _SPACE_BEFORE_PUNCT_RE.sub(r"\1", text)
+    text = _SEPARATOR_RUN_RE.sub(r"\1", text)
+    text = _LIST_SEPARATOR_RE.sub(r"\1 ", text)
+    return _LEADING_RE.sub("", _TRAILING_RE.sub("", text))
+
+
+def canonicalize(text: str) -> str:
+    """Comparison form of a prompt: clean(), NFKC-normalized, lowercased, US spelling."""
+    text = clean(unicodedata.normalize("NFKC", text)).lower().rstrip("!")
+    return _SPELLING_RE.sub(lambda m: _SPELLINGS[m.group(1)], text)
+
+
+def shingles(canonical: str, size: int = SIMILARITY_SHINGLE_CHARS) -> array:
+    """Sorted, de-duplicated crc32 hashes of the text's character shingles."""
+    padded = f" {canonical} "
+    if len(padded) <= size:
+        grams = {padded}
+    else:
+        grams = {padded[i:i + size] for i in range(len(padded) - size + 1)}
+    # Multiplying by an odd constant mixes crc32's low bits (used for MinHash bins) without collisions
+    return array("I", sorted({(zlib.crc32(g.encode()) * 0x9E3779B1) & 0xFFFFFFFF for g in grams}))
+
+
+def jaccard(query: frozenset, hashes: array) -> float:
+    """Exact Jaccard of a query's shingle set and a stored (de-duplicated) hash array."""
+    shared = len(query.intersection(hashes))
+    union = len(query) + len(hashes) - shared
+    return shared / union if union else 1.0
+
+
+class MinHasher:
+    """
+    One-permutation MinHash: each shingle hash falls in one of `bands * rows`
+    bins (hash % bins) and every bin keeps its minimum, so a signature costs
+    one pass over the shingles instead of one per hash function. Each band's
+    `rows` bins are folded into one key.
+    """
+
+    EMPTY = 0xFFFFFFFF
+
+    def __init__(self, bands: int = SIMILARITY_BANDS, rows: int = SIMILARITY_ROWS):
+        self.bands = bands
+        self.rows = rows
+
+    def band_keys(self, hashes: array) -> Tuple[int, ...]:
+        if not hashes:
+            return ()
+        bins = self.bands * self.rows
+        signature = [self.EMPTY] * bins
+        for h in hashes:
+            slot = h % bins
+            if h < signature[slot]:
+                signature[slot] = h
+        rows = self.rows
+        return tuple(hash((band, *signature[band * rows:(band + 1) * rows])) for band in range(self.bands))
+
+
+class _Entry:
+    __slots__ = ("id", "canonical", "hashes", "bands", "value")
+
+    def __init__(self, entry_id: int, canonical: str, hashes: array, bands: Tuple[int, ...], value: Any):
+        self.id = entry_id
+        self.canonical = canonical
+        self.hashes = hashes
+        self.bands = bands
+        self.value = value
+
+
+class SimilarityIndex:
+    """
+    Recent texts -> values, looked up by canonical form and, when `threshold`
+    is set, by shingle Jaccard at or above it. One value can be stored under several texts (a request and its enhanced
+    prompt); each text is its own entry and counts against max_entries.
+    """
+
+    def __init__(self, threshold: float = SIMILARITY_REUSE_THRESHOLD, max_entries: int = SIMILARITY_INDEX_ENTRIES,
+                 hasher: Optional[MinHasher] = None, max_candidates: int = SIMILARITY_MAX_CANDIDATES,
+                 enabled: bool = SIMILARITY_REUSE_ENABLED):
+        self.reuse = enabled
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_candidates = max_candidates
+        self.hasher = hasher or MinHasher()
+        self._entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self._exact: Dict[str, int] = {}
+        self._buckets: List[Dict[int, set]] = [{} for _ in range(self.hasher.bands)]
+        self._next_id = 0
+        self._lock = threading.Lock()
+        self.exact_hits = 0
+        self.near_hits = 0
+        self.misses = 0
+        self._lookup_us: deque = deque(maxlen=256)
+        self._candidates: deque = deque(maxlen=256)
+
+    @property
+    def enabled(self) -> bool:
+        return self.reuse and self.max_entries > 0
+
+    @property
+    def near(self) -> bool:
+        return self.threshold > 0
+
+    def add(self, texts: Iterable[str], value: Any, near: bool = True) -> None:
+        """Store `value` under each text; with near=False only an identical canonical text finds it."""
+        if not self.enabled:
+            return
+        prepared = []
+        for text in dict.fromkeys(canonicalize(t) for t in texts if t):
+            if text and near and self.near:
+                hashes = shingles(text)
+                prepared.append((text, hashes, self.hasher.band_keys(hashes)))
+            elif text:
+                prepared.append((text, array("I"), ()))
+        with self._lock:
+            for text, hashes, bands in prepared:
+                old = self._exact.get(text)
+                if old is not None:
+                    self._remove(old)
+                entry = _Entry(self._next_id, text, hashes, bands, value)
+                self._next_id += 1
+                self._entries[entry.id] = entry
+                self._exact[text] = entry.id
+                for bucket, key in zip(self._buckets, bands):
+                    bucket.setdefault(key, set()).add(entry.id)
+            while len(self._entries) > self.max_entries:
+                self._remove(next(iter(self._entries)))
+
+    def _remove(self, entry_id: int) -> None:
+        entry = self._entries.pop(entry_id)
+        if self._exact.get(entry.canonical) == entry_id:
+            del self._exact[entry.canonical]
+        for bucket, key in zip(self._buckets, entry.bands):
+            ids = bucket.get(key)
+            if ids is not None:
+                ids.discard(entry_id)
+                if not ids:
+                    del bucket[key]
+
+    def lookup(self, text: str, near: bool = True) -> Optional[Tuple[Any, float]]:
+        """
+        (value, similarity) of the same or closest recent text at or above the
+        threshold, else None; near=False only accepts the same canonical text.
+        """
+        if not self.enabled or not text:
+            return None
+        started = time.perf_counter()
+        canonical = canonicalize(text)
+        with self._lock:
+            entry_id = self._exact.get(canonical)
+            if entry_id is not None:
+                self.exact_hits += 1
+                self._lookup_us.append((time.perf_counter() - started) * 1e6)
+                return self._entries[entry_id].value, 1.0
+            if not (near and self.near):
+                self.misses += 1
+                self._lookup_us.append((time.perf_counter() - started) * 1e6)
+                return None
+        hashes = shingles(canonical)
+        bands = self.hasher.band_keys(hashes)
+        query = frozenset(hashes)
+        best, best_score, checked = None, 0.0, 0
+        with self._lock:
+            candidates = set()
+            for bucket, key in zip(self._buckets, bands):
+                candidates.update(bucket.get(key, ()))
+            # Newest first, so ties and the candidate cap favour recent generations
+            for entry_id in sorted(candidates, reverse=True)[: self.max_candidates]:
+                score = jaccard(query, self._entries[entry_id].hashes)
+                checked += 1
+                if score > best_score:
+                    best, best_score = self._entries[entry_id], score
+            if best is not None and best_score >= self.threshold:
+                self.near_hits += 1
+                result = best.value, best_score
+            else:
+                self.misses += 1
+                result = None
+        self._candidates.append(checked)
+        self._lookup_us.append((time.perf_counter() - started) * 1e6)
+        return result
+
+    def clear(self) -> None:
+        with self._lock:
+            self._entries.clear()
+            self._exact.clear()
+            for bucket in self._buckets:
+                bucket.clear()
+
+    def stats(self) -> dict:
+        timings = sorted(self._lookup_us)
+        with self._lock:
+            entries = len(self._entries)
+            shingle_bytes = sum(e.hashes.itemsize * len(e.hashes) for e in self._entries.values())
+        return {
+            "enabled": self.enabled,
+            "entries": entries,
+            "max_entries": self.max_entries,
+            "threshold": self.threshold,
+            "shingle_bytes": shingle_bytes,
+            "exact_hits": self.exact_hits,
+            "near_hits": self.near_hits,
+            "misses": self.misses,
+            "avg_candidates": round(sum(self._candidates) / len(self._candidates), 2) if self._candidates else None,
+            "lookup_p50_us": round(timings[len(timings) // 2], 1) if timings else None,
+            "lookup_max_us": round(timings[-1], 1) if timings else None,
+        }
@@ -0,0 +1,296 @@
+"""
+Per-user taste profiles and a per-session index of past generations.
+
+- extract(): styles / colours / moods found in a message by keyword lookup
+  (single words and two-word phrases against a fixed vocabulary, no LLM)
+- update() / hint(): compact {term: count} profile per category, capped at
+  TASTE_MAX_TERMS each; the strongest terms become a one-line hint for
+  interpret_intent
+- PromptIndex: recent generations per session with an inverted index of
+  ordered word pairs, so a near-duplicate request can reuse earlier images
+  (bigram Jaccard; word order counts, "a cat chasing a dog" is not "a dog
+  chasing a cat"). Off unless TASTE_REUSE_THRESHOLD is set
+
+Everything here is plain dict/set work bounded by the caps, so a lookup stays
+in the microseconds however long a session gets.
+"""
+
+import os
+import re
+import threading
+import time
+from collections import Counter, OrderedDict, deque
+from typing import Dict, List, Optional, Tuple
+
+TASTE_MAX_TERMS = int(os.getenv("TASTE_MAX_TERMS", "16"))
+# Terms per category put into the intent prompt, and how often a term must recur first
+TASTE_HINT_TERMS = int(os.getenv("TASTE_HINT_TERMS", "2"))
+TASTE_HINT_MIN_COUNT = int(os.getenv("TASTE_HINT_MIN_COUNT", "2"))
+# Near-duplicate reuse of a session's earlier images by word-bigram Jaccard (0 disables)
+TASTE_REUSE_THRESHOLD = float(os.getenv("TASTE_REUSE_THRESHOLD", "0"))
+TASTE_INDEX_ENTRIES = int(os.getenv("TASTE_INDEX_ENTRIES", "200"))  # per session
+TASTE_INDEX_SESSIONS = int(os.getenv("TASTE_INDEX_SESSIONS", "1000"))
+
+CATEGORIES = ("styles", "colors", "moods")
+
+# canonical term -> aliases (the canonical term matches itself)
+VOCABULARY: Dict[str, Dict[str, Tuple[str, ...]]] = {
+    "styles": {
+        "watercolor": ("watercolour", "aquarelle"),
+        "oil painting": ("oil paint", "oils"),
+        "photorealistic": ("photoreal", "realistic", "photo", "photograph", "photography"),
+        "anime": ("manga",),
+        "pixel art": ("pixel", "8-bit", "8bit"),
+        "3d render": ("3d", "cgi", "render"),
+        "sketch": ("pencil", "drawing", "line art"),
+        "minimalist": ("minimal", "minimalism", "simple"),
+        "surreal": ("surrealism", "surrealist", "dreamlike"),
+        "cyberpunk": ("sci-fi", "scifi", "futuristic"),
+        "impressionist": ("impressionism", "monet"),
+        "art nouveau": ("nouveau", "mucha"),
+        "pop art": ("warhol",),
+        "abstract": ("geometric",),
+        "vintage": ("retro", "old-fashioned"),
+        "fantasy": ("magical", "mythical"),
+        "cartoon": ("comic", "illustrated", "illustration"),
+        "low poly": ("lowpoly",),
+        "studio ghibli": ("ghibli",),
+    },
+    "colors": {
+        "red": ("crimson", "scarlet"),
+        "orange": ("amber",),
+        "yellow": ("golden", "gold"),
+        "green": ("emerald", "forest green"),
+        "teal": ("turquoise", "cyan"),
+        "blue": ("navy", "azure", "cobalt"),
+        "purple": ("violet", "lavender", "magenta"),
+        "pink": ("rose",),
+        "brown": ("earthy", "sepia"),
+        "black": ("noir",),
+        "white": ("ivory",),
+        "pastel": ("pastels", "soft colors", "soft colours"),
+        "neon": ("fluorescent", "glowing"),
+        "monochrome": ("black and white", "grayscale", "greyscale"),
+        "vibrant": ("colorful", "colourful", "saturated", "bright"),
+        "muted": ("desaturated", "washed out"),
+    },
+    "moods": {
+        "calm": ("peaceful", "serene", "tranquil", "relaxing"),
+        "dramatic": ("epic", "intense", "stormy"),
+        "dark": ("moody", "gloomy", "ominous", "sinister"),
+        "cheerful": ("happy", "joyful", "playful", "fun"),
+        "melancholic": ("sad", "melancholy", "lonely", "wistful"),
+        "mysterious": ("mystical", "eerie", "enigmatic"),
+        "cozy": ("cosy", "warm", "homely"),
+        "romantic": ("love", "dreamy"),
+        "nostalgic": ("nostalgia",),
+        "energetic": ("dynamic", "vivid", "lively"),
+    },
+}
+
+# phrase -> (category, canonical term), built once
+_LOOKUP: Dict[str, Tuple[str, str]] = {}
+for _category, _terms in VOCABULARY.items():
+    for _canonical, _aliases in _terms.items():
+        for _phrase in (_canonical, *_aliases):
+            _LOOKUP.setdefault(_phrase, (_category, _canonical))
+_MAX_PHRASE_WORDS = max(len(p.split()) for p in _LOOKUP)
+
+_WORD_RE = re.compile(r"[a-z0-9][a-z0-9'-]*")
+
+# Asking for a fresh take on the same subject must not be answered from the index
+_REGENERATE_RE = re.compile(r"\b(another|again|new|different|more|other|variation|variations|redo|regenerate)\b")
+
+STOPWORDS = frozenset(
+    "a an the of in on at to for with and or by from me my i you your please can could would make create draw "
+    "generate show give paint image picture some this that is are be of it its".split()
+)
+
+
+def words(text: str) -> List[str]:
+    return _WORD_RE.findall(text.lower())
+
+
+def extract(text: str) -> Dict[str, List[str]]:
+    """Canonical styles/colors/moods mentioned in `text`, in order of appearance."""
+    tokens = words(text)
+    found: Dict[str, List[str]] = {c: [] for c in CATEGORIES}
+    i = 0
+    while i < len(tokens):
+        # Longest phrase first, so "oil painting" wins over "oil" and "black and white" over "black"
+        for n in range(min(_MAX_PHRASE_WORDS, len(tokens) - i), 0, -1):
+            match = _LOOKUP.get(" ".join(tokens[i:i + n]))
+            if match:
+                if match[1] not in found[match[0]]:
+                    found[match[0]].append(match[1])
+                i += n
+                break
+        else:
+            i += 1
+    return found
+
+
+def normalize(taste: Optional[dict]) -> dict:
+    """Stored taste -> {category: {term: count}}; older sessions kept plain lists."""
+    taste = taste or {}
+    result = {}
+    for category in (*CATEGORIES, "themes"):
+        value = taste.get(category) or {}
+        result[category] = {term: 1 for term in value} if isinstance(value, list) else dict(value)
+    return result
+
+
+def _bump(counts: Dict[str, int], term: str) -> None:
+    counts[term] = counts.get(term, 0) + 1
+    if len(counts) > TASTE_MAX_TERMS:
+        # Drop the weakest other term (ties: the oldest, since dicts keep insertion order)
+        weakest = min((t for t in counts if t != term), key=counts.__getitem__)
+        del counts[weakest]
+
+
+def update(taste: Optional[dict], message: str, intent_category: str = "") -> dict:
+    """Return the profile with this message's terms (and intent as a theme) counted."""
+    profile = normalize(taste)
+    for category, terms in extract(message).items():
+        for term in terms:
+            _bump(profile[category], term)
+    if intent_category:
+        _bump(profile["themes"], intent_category)
+    return profile
+
+
+def top_terms(counts: Dict[str, int], limit: int, min_count: int = 1) -> List[str]:
+    ranked = sorted(counts.items(), key=lambda kv: -kv[1])
+    return [term for term, count in ranked[:limit] if count >= min_count]
+
+
+def hint(taste: Optional[dict], message: str = "") -> str:
+    """
+    "watercolor, pastel, calm"-style summary of recurring preferences, leaving
+    out categories the message already specifies. Empty if nothing recurs yet.
+    """
+    profile = normalize(taste)
+    explicit = extract(message) if message else {}
+    terms = []
+    for category in CATEGORIES:
+        if explicit.get(category):
+            continue  # the request says what it wants here
+        terms.extend(top_terms(profile[category], TASTE_HINT_TERMS, TASTE_HINT_MIN_COUNT))
+    return ", ".join(terms)
+
+
+def wants_new(message: str) -> bool:
+    return bool(_REGENERATE_RE.search(message.lower()))
+
+
+def key_grams(text: str) -> frozenset:
+    """Adjacent pairs of non-stopwords in order ("cat chasing", "chasing dog"); the word itself if only one."""
+    keys = [w for w in words(text) if w not in STOPWORDS]
+    if len(keys) < 2:
+        return frozenset(keys)
+    return frozenset(f"{a} {b}" for a, b in zip(keys, keys[1:]))
+
+
+class _Entry:
+    __slots__ = ("id", "grams", "intent", "prompt", "images", "image_model", "created_at")
+
+    def __init__(self, entry_id, grams, intent, prompt, images, image_model):
+        self.id = entry_id
+        self.grams = grams
+        self.intent = intent
+        self.prompt = prompt
+        self.images = tuple(images)
+        self.image_model = image_model
+        self.created_at = time.time()
+
+
+class _SessionIndex:
+    __slots__ = ("entries", "postings", "next_id")
+
+    def __init__(self):
+        self.entries: "OrderedDict[int, _Entry]" = OrderedDict()
+        self.postings: Dict[str, set] = {}
+        self.next_id = 0
+
+
+class PromptIndex:
+    """Recent generations per session, looked up by word-bigram Jaccard similarity."""
+
+    def __init__(self, threshold: float = TASTE_REUSE_THRESHOLD, max_entries: int = TASTE_INDEX_ENTRIES,
+                 max_sessions: int = TASTE_INDEX_SESSIONS):
+        self.threshold = threshold
+        self.max_entries = max_entries
+        self.max_sessions = max_sessions
+        self._sessions: "OrderedDict[str, _SessionIndex]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self._lookup_us: deque = deque(maxlen=256)
+
+    def add(self, session_id: str, message: str, intent: str, prompt: str, images: List[str], image_model: str) -> None:
+        grams = key_grams(message)
+        if self.threshold <= 0 or not grams or not images:
+            return
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is None:
+                index = self._sessions[session_id] = _SessionIndex()
+                if len(self._sessions) > self.max_sessions:
+                    self._sessions.popitem(last=False)
+            self._sessions.move_to_end(session_id)
+            entry = _Entry(index.next_id, grams, intent, prompt, images, image_model)
+            index.next_id += 1
+            index.entries[entry.id] = entry
+            for gram in grams:
+                index.postings.setdefault(gram, set()).add(entry.id)
+            if len(index.entries) > self.max_entries:
+                _, old = index.entries.popitem(last=False)
+                for gram in old.grams:
+                    ids = index.postings[gram]
+                    ids.discard(old.id)
+                    if not ids:
+                        del index.postings[gram]
+
+    def lookup(self, session_id: str, message: str) -> Optional[_Entry]:
+        """Most similar earlier generation at or above the threshold, or None."""
+        if self.threshold <= 0:
+            return None
+        started = time.perf_counter()
+        grams = key_grams(message)
+        best, best_score = None, 0.0
+        with self._lock:
+            index = self._sessions.get(session_id)
+            if index is not None and grams:
+                overlap: Counter = Counter()
+                for gram in grams:
+                    overlap.update(index.postings.get(gram, ()))
+                for entry_id, shared in overlap.items():
+                    entry = index.entries[entry_id]
+                    score = shared / (len(grams) + len(entry.grams) - shared)
+                    # Ties go to the newest entry
+                    if score > best_score or (score == best_score and best is not None and entry.id > best.id):
+                        best, best_score = entry, score
+        self._lookup_us.append((time.perf_counter() - started) * 1e6)
+        if best is not None and best_score >= self.threshold:
+            self.hits += 1
+            return best
+        self.misses += 1
+        return None
+
+    def forget(self, session_id: str) -> None:
+        with self._lock:
+            self._sessions.pop(session_id, None)
+
+    def stats(self) -> dict:
+        timings = sorted(self._lookup_us)
+        with self._lock:
+            entries = sum(len(i.entries) for i in self._sessions.values())
+        return {
+            "sessions": len(self._sessions),
+            "entries": entries,
+            "threshold": self.threshold,
+            "hits": self.hits,
+            "misses": self.misses,
+            "lookup_p50_us": round(timings[len(timings) // 2], 1) if timings else None,
+            "lookup_max_us": round(timings[-1], 1) if timings else None,
+        }
@@ -0,0 +1,177 @@
+"""Token-bucket limiter driven by a fake clock: refill, burst, retry_after, per-key isolation."""
+
+import asyncio
+import math
+
+import pytest
+
+from ratelimit import Limiter, RateLimited, RateLimitRegistry, parse_limits
+
+
+class FakeClock:
+    def __init__(self, now: float = 1_000_000.0):
+        self.now = now
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float) -> None:
+        self.now += seconds
+
+
+def drain(limiter: Limiter) -> int:
+    """Admit calls until the bucket refuses one; returns how many got in."""
+    admitted = 0
+    while limiter.try_acquire() is not None:
+        admitted += 1
+    return admitted
+
+
+def test_burst_is_admitted_at_once_then_refused():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=1, burst=3, clock=clock)
+    assert drain(limiter) == 3
+    assert limiter.predicted_wait() == pytest.approx(1.0)
+
+
+def test_tokens_refill_at_rps_and_cap_at_burst():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=2, burst=3, clock=clock)
+    drain(limiter)
+    clock.advance(0.25)
+    assert limiter.try_acquire() is None
+    clock.advance(0.25)
+    assert limiter.try_acquire() is not None
+    clock.advance(60)
+    assert drain(limiter) == 3
+
+
+def test_burst_defaults_to_rps():
+    limiter = Limiter("k", rps=4, clock=FakeClock())
+    assert drain(limiter) == 4
+
+
+def test_acquire_sync_waits_on_the_fake_clock():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=0.5, burst=1, clock=clock)
+    limiter.try_acquire()
+    start = clock()
+    assert limiter.acquire_sync(max_wait=5, sleep=clock.advance) is not None
+    assert clock() - start == pytest.approx(2.0)
+
+
+def test_retry_after_reports_the_bucket_wait():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=0.5, burst=1, clock=clock)
+    limiter.try_acquire()
+    clock.advance(0.5)
+    with pytest.raises(RateLimited) as exc:
+        limiter.acquire_sync(max_wait=1, sleep=clock.advance)
+    assert exc.value.key == "k"
+    assert exc.value.retry_after == pytest.approx(1.5)
+    assert limiter.shed == 1
+
+
+def test_async_acquire_sheds_before_queueing_when_wait_exceeds_budget():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=0.1, burst=1, clock=clock)
+    limiter.try_acquire()
+
+    async def acquire():
+        return await limiter.acquire("session", max_wait=2)
+
+    with pytest.raises(RateLimited) as exc:
+        asyncio.run(acquire())
+    assert exc.value.retry_after == pytest.approx(10.0)
+    assert limiter.stats()["waiting"] == 0
+
+
+def test_penalize_blocks_for_retry_after():
+    clock = FakeClock()
+    limiter = Limiter("k", rps=10, burst=10, clock=clock)
+    limiter.penalize(30)
+    assert limiter.try_acquire() is None
+    assert limiter.predicted_wait() == pytest.approx(30.0)
+    clock.advance(30)
+    assert limiter.try_acquire() is not None
+
+
+def test_daily_quota_resets_at_the_next_day():
+    clock = FakeClock(now=86400 * 100 + 3600)
+    limiter = Limiter("k", daily=2, clock=clock)
+    assert drain(limiter) == 2
+    assert limiter.predicted_wait() == pytest.approx(86400 - 3600)
+    clock.advance(86400 - 3600)
+    assert drain(limiter) == 2
+
+
+def test_concurrency_cap_frees_on_release():
+    limiter = Limiter("k", concurrency=2, clock=FakeClock())
+    leases = [limiter.try_acquire(), limiter.try_acquire()]
+    assert limiter.try_acquire() is None
+    assert limiter.predicted_wait() == math.inf
+    leases[0].release()
+    leases[0].release()  # releasing twice frees one slot only
+    assert limiter.try_acquire() is not None
+    assert limiter.try_acquire() is None
+
+
+def test_async_waiters_are_served_round_robin_by_session():
+    limiter = Limiter("k", concurrency=1, clock=FakeClock())
+    order = []
+
+    async def run():
+        first = await limiter.acquire("a")
+
+        async def wait(session, n):
+            lease = await limiter.acquire(session, max_wait=5)
+            order.append(f"{session}{n}")
+            await asyncio.sleep(0)
+            lease.release()
+
+        tasks = [asyncio.create_task(wait("a", n)) for n in (1, 2, 3)]
+        tasks.append(asyncio.create_task(wait("b", 1)))
+        await asyncio.sleep(0)
+        first.release()
+        await asyncio.gather(*tasks)
+
+    asyncio.run(run())
+    assert order == ["a1", "b1", "a2", "a3"]
+
+
+def test_registry_keys_are_isolated():
+    clock = FakeClock()
+    registry = RateLimitRegistry("openrouter=rps:1,burst:1;openrouter:model-a=rps:1,burst:2", clock=clock)
+    provider = registry.limiters["openrouter"]
+    model = registry.limiters["openrouter:model-a"]
+    assert drain(provider) == 1
+    assert drain(model) == 2
+    clock.advance(1)
+    assert provider.try_acquire() is not None
+    assert model.try_acquire() is not None
+    assert registry.predicted_wait("openrouter") == pytest.approx(1.0)
+    assert registry.predicted_wait("unconfigured") == 0.0
+
+
+def test_registry_limit_charges_every_key_and_skips_unknown_ones():
+    clock = FakeClock()
+    registry = RateLimitRegistry("p=rps:1,burst:1;p:m=rps:1,burst:5", clock=clock)
+
+    async def call():
+        async with registry.limit("p", "p:m", "p:unknown", max_wait=0.5):
+            pass
+
+    asyncio.run(call())
+    assert registry.limiters["p"].granted == 1
+    assert registry.limiters["p:m"].granted == 1
+    with pytest.raises(RateLimited):
+        asyncio.run(call())
+    # The refused call didn't spend a model token
+    assert registry.limiters["p:m"].granted == 1
+
+
+def test_parse_limits():
+    assert parse_limits("a=rps:2,burst:4;b=concurrency:3,daily:100;;bad") == {
+        "a": {"rps": 2.0, "burst": 4.0},
+        "b": {"concurrency": 3, "daily": 100},
+    }
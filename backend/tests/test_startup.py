@@ -0,0 +1,29 @@
+"""Cold-start budget from benchmarks/bench_startup.py, enforced as a test."""
+
+import os
+import statistics
+import sys
+
+import pytest
+
+sys.path.insert(0, os.path.join(os.path.dirname(__file__), "..", "benchmarks"))
+
+from bench_startup import run_once
+
+# Median import-to-first-response of a chat-only cold start; raise it on slow CI machines
+STARTUP_BUDGET_MS = float(os.getenv("STARTUP_BUDGET_MS", "2000"))
+STARTUP_RUNS = int(os.getenv("STARTUP_RUNS", "3"))
+
+
+@pytest.fixture(scope="module")
+def runs():
+    return [run_once() for _ in range(STARTUP_RUNS)]
+
+
+def test_first_response_within_budget(runs):
+    median = statistics.median(r["first_response_ms"] for r in runs)
+    assert median <= STARTUP_BUDGET_MS, f"median first response {median:.0f} ms > {STARTUP_BUDGET_MS:.0f} ms"
+
+
+def test_chat_only_cold_start_loads_no_provider_sdk(runs):
+    assert sorted({m for r in runs for m in r["loaded"]}) == []
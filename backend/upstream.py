@@ -0,0 +1,295 @@
+"""
+Shared async HTTP layer for upstream providers (OpenRouter, stub servers in benchmarks).
+One pooled httpx.AsyncClient per upstream host (per event loop) with keep-alive, plus
+async retry/backoff so a slow upstream never blocks the uvicorn worker's event loop.
+
+- Per-host clients for provider origins (OPENROUTER_BASE_URL, hosts named in
+  UPSTREAM_HOST_LIMITS, UPSTREAM_PROVIDER_ORIGINS): each gets its own
+  connection limits (UPSTREAM_HOST_LIMITS="openrouter.ai=32:8" = max
+  connections : keep-alive), so one slow provider can't take every pooled
+  connection. Any other host (e.g. a job's user-chosen callback_url) shares
+  one default client and is reported as "other", so clients, sockets and
+  metric labels stay bounded
+- One SSL context for every client, so the CA bundle is loaded once; warm
+  keep-alive connections skip DNS, TCP and TLS entirely
+- HTTP/2 (UPSTREAM_HTTP2=true) when the optional `h2` package is installed:
+  concurrent requests to one host multiplex over a single connection
+- Connection phases are timed through httpcore's trace hook: TCP connect
+  (including DNS), TLS handshake and wait for response headers show up as
+  upstream_* spans per host, next to new vs reused connection counts
+"""
+
+import asyncio
+import importlib.util
+import json
+import logging
+import os
+import random
+import time
+from collections import deque
+from typing import AsyncIterator, Dict, Iterable, Optional, Tuple
+
+import httpx
+
+import metrics
+
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1").rstrip("/")
+
+UPSTREAM_TIMEOUT = float(os.getenv("UPSTREAM_TIMEOUT", "45"))
+UPSTREAM_CONNECT_TIMEOUT = float(os.getenv("UPSTREAM_CONNECT_TIMEOUT", "10"))
+UPSTREAM_MAX_RETRIES = int(os.getenv("UPSTREAM_MAX_RETRIES", "2"))
+UPSTREAM_BACKOFF = float(os.getenv("UPSTREAM_BACKOFF", "1.0"))
+# Defaults per host; UPSTREAM_HOST_LIMITS overrides them for named hosts
+UPSTREAM_MAX_CONNECTIONS = int(os.getenv("UPSTREAM_MAX_CONNECTIONS", "100"))
+UPSTREAM_MAX_KEEPALIVE = int(os.getenv("UPSTREAM_MAX_KEEPALIVE", "20"))
+UPSTREAM_KEEPALIVE_EXPIRY = float(os.getenv("UPSTREAM_KEEPALIVE_EXPIRY", "30"))
+UPSTREAM_HTTP2 = os.getenv("UPSTREAM_HTTP2", "false").lower() in ("1", "true", "yes")
+
+HAS_H2 = importlib.util.find_spec("h2") is not None
+
+# Status codes worth retrying: rate limiting and transient gateway errors
+RETRY_STATUS_CODES = {429, 502, 503, 504}
+
+# httpcore trace event -> span recorded for it
+_TRACED_PHASES = {
+    "connection.connect_tcp": "upstream_connect",
+    "connection.start_tls": "upstream_tls",
+    "http11.receive_response_headers": "upstream_headers",
+    "http2.receive_response_headers": "upstream_headers",
+}
+
+
+def _parse_host_limits(spec: str) -> Dict[str, Tuple[int, int]]:
+    """Parse "host=32:8,other=4" into {"host": (32, 8), "other": (4, 4)}."""
+    limits = {}
+    for item in spec.split(","):
+        host, _, value = item.partition("=")
+        conns, _, keepalive = value.partition(":")
+        if host.strip() and conns.strip().isdigit():
+            max_conns = int(conns)
+            limits[host.strip()] = (max_conns, int(keepalive) if keepalive.strip().isdigit() else min(max_conns, UPSTREAM_MAX_KEEPALIVE))
+    return limits
+
+
+UPSTREAM_HOST_LIMITS = _parse_host_limits(os.getenv("UPSTREAM_HOST_LIMITS", ""))
+# Extra origins that get their own client and stats, e.g. "https://api.example.com"
+UPSTREAM_PROVIDER_ORIGINS = [o.strip() for o in os.getenv("UPSTREAM_PROVIDER_ORIGINS", "").split(",") if o.strip()]
+
+# Pool / stats key for every host that isn't a provider origin
+OTHER = "other"
+
+
+class HostStats:
+    __slots__ = ("requests", "new_connections", "http_versions", "phase_ms")
+
+    def __init__(self):
+        self.requests = 0
+        self.new_connections = 0
+        self.http_versions: Dict[str, int] = {}
+        self.phase_ms: Dict[str, deque] = {}
+
+    def observe(self, phase: str, seconds: float) -> None:
+        self.phase_ms.setdefault(phase, deque(maxlen=256)).append(seconds * 1000)
+
+    def to_dict(self) -> dict:
+        phases = {}
+        for phase, samples in self.phase_ms.items():
+            ordered = sorted(samples)
+            phases[phase] = {"p50_ms": round(ordered[len(ordered) // 2], 2), "max_ms": round(ordered[-1], 2)}
+        return {
+            "requests": self.requests,
+            "new_connections": self.new_connections,
+            "reuse_ratio": round(1 - self.new_connections / self.requests, 3) if self.requests else None,
+            "http_versions": dict(self.http_versions),
+            "phases": phases,
+        }
+
+
+class ClientPool:
+    """
+    AsyncClients keyed by provider origin, plus one shared OTHER client for
+    everything else. Connections are bound to the loop that opened them, so
+    the pool starts over when called from a different event loop (e.g.
+    TestClient portals).
+    """
+
+    def __init__(self, origins: Iterable[str] = ()):
+        self.origins = {self.origin(o) for o in origins}
+        self._clients: Dict[str, httpx.AsyncClient] = {}
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._ssl = None
+        self.http2 = UPSTREAM_HTTP2 and HAS_H2
+        if UPSTREAM_HTTP2 and not HAS_H2:
+            logging.warning("UPSTREAM_HTTP2 is set but the h2 package isn't installed; using HTTP/1.1")
+        self.hosts: Dict[str, HostStats] = {}
+
+    @staticmethod
+    def origin(url: str) -> str:
+        u = httpx.URL(url)
+        return f"{u.scheme}://{u.netloc.decode()}"
+
+    def add_origin(self, url: str) -> None:
+        """Give `url`'s origin its own client and stats."""
+        self.origins.add(self.origin(url))
+
+    def is_provider(self, url: str) -> bool:
+        return self.origin(url) in self.origins or httpx.URL(url).host in UPSTREAM_HOST_LIMITS
+
+    def label(self, url: str) -> str:
+        """Stats / metrics label: host[:port] for providers, OTHER for the rest."""
+        return httpx.URL(url).netloc.decode() if self.is_provider(url) else OTHER
+
+    def _limits(self, host: str) -> httpx.Limits:
+        max_conns, keepalive = UPSTREAM_HOST_LIMITS.get(host, (UPSTREAM_MAX_CONNECTIONS, UPSTREAM_MAX_KEEPALIVE))
+        return httpx.Limits(max_connections=max_conns, max_keepalive_connections=keepalive,
+                            keepalive_expiry=UPSTREAM_KEEPALIVE_EXPIRY)
+
+    def get(self, url: str) -> httpx.AsyncClient:
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._clients = {}
+            self._loop = loop
+        key = self.origin(url) if self.is_provider(url) else OTHER
+        client = self._clients.get(key)
+        if client is None or client.is_closed:
+            if self._ssl is None:
+                self._ssl = httpx.create_ssl_context(http2=self.http2)
+            host = httpx.URL(url).host if key != OTHER else OTHER
+            client = self._clients[key] = httpx.AsyncClient(
+                timeout=httpx.Timeout(UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT),
+                limits=self._limits(host),
+                http2=self.http2,
+                verify=self._ssl,
+            )
+        return client
+
+    def tracer(self, url: str):
+        """
+        httpx `trace` extension for one request: times connect / TLS / header
+        wait into spans and counts whether the request opened a connection.
+        """
+        host = self.label(url)
+        stats = self.hosts.get(host)
+        if stats is None:
+            stats = self.hosts[host] = HostStats()
+        stats.requests += 1
+        metrics.upstream_request(host)
+        started: Dict[str, float] = {}
+
+        async def trace(event: str, info: dict) -> None:
+            name, _, stage = event.rpartition(".")
+            span = _TRACED_PHASES.get(name)
+            if span is None:
+                return
+            now = time.perf_counter()
+            if stage == "started":
+                started[name] = now
+                if span == "upstream_connect":
+                    stats.new_connections += 1
+                    metrics.upstream_connection(host)
+            elif name in started:
+                begin = started.pop(name)
+                stats.observe(span, now - begin)
+                metrics.record_span(span, begin, now, provider=host,
+                                    outcome="ok" if stage == "complete" else "error")
+
+        return trace
+
+    def record_version(self, url: str, response: httpx.Response) -> None:
+        stats = self.hosts.get(self.label(url))
+        if stats is not None:
+            stats.http_versions[response.http_version] = stats.http_versions.get(response.http_version, 0) + 1
+
+    async def close(self) -> None:
+        clients, self._clients, self._loop = self._clients, {}, None
+        for client in clients.values():
+            if not client.is_closed:
+                await client.aclose()
+
+    def stats(self) -> dict:
+        return {
+            "http2": self.http2,
+            "open_clients": sorted(self._clients),
+            "hosts": {host: s.to_dict() for host, s in self.hosts.items()},
+        }
+
+
+pool = ClientPool([OPENROUTER_BASE_URL, *UPSTREAM_PROVIDER_ORIGINS])
+
+
+def get_client(url: str = OPENROUTER_BASE_URL) -> httpx.AsyncClient:
+    """Return the pooled AsyncClient for `url`'s origin (or the shared OTHER one), creating it on first use."""
+    return pool.get(url)
+
+
+async def close_client() -> None:
+    """Close every pooled client (called on app shutdown)."""
+    await pool.close()
+
+
+async def post_json(
+    url: str,
+    payload: dict,
+    headers: Optional[dict] = None,
+    timeout: Optional[float] = None,
+    max_retries: Optional[int] = None,
+    backoff: Optional[float] = None,
+) -> httpx.Response:
+    """
+    POST a JSON payload through the shared client.
+    Retries timeouts, connection errors and RETRY_STATUS_CODES with exponential
+    backoff + jitter. The last response (or exception) is returned/raised as-is.
+    """
+    client = get_client(url)
+    retries = UPSTREAM_MAX_RETRIES if max_retries is None else max_retries
+    base_delay = UPSTREAM_BACKOFF if backoff is None else backoff
+    request_timeout = httpx.Timeout(timeout or UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+
+    for attempt in range(retries):
+        last_attempt = attempt == retries - 1
+        try:
+            response = await client.post(url, json=payload, headers=headers, timeout=request_timeout,
+                                         extensions={"trace": pool.tracer(url)})
+        except (httpx.TimeoutException, httpx.TransportError) as e:
+            if last_attempt:
+                raise
+            logging.warning(f"Upstream {type(e).__name__} on {url}, retry {attempt + 1}/{retries}")
+        else:
+            pool.record_version(url, response)
+            if response.status_code not in RETRY_STATUS_CODES or last_attempt:
+                return response
+            logging.warning(f"Upstream status {response.status_code} on {url}, retry {attempt + 1}/{retries}")
+        await asyncio.sleep(base_delay * (2 ** attempt) + random.uniform(0, base_delay / 2))
+
+    raise RuntimeError("post_json called with max_retries < 1")
+
+
+async def stream_sse(
+    url: str,
+    payload: dict,
+    headers: Optional[dict] = None,
+    timeout: Optional[float] = None,
+) -> AsyncIterator[dict]:
+    """
+    POST a JSON payload and yield each `data:` event of the SSE response as a dict,
+    stopping at `[DONE]`. Comment lines (OpenRouter keep-alives) are skipped.
+    Streams aren't retried: a partially consumed stream can't be replayed.
+    """
+    client = get_client(url)
+    request_timeout = httpx.Timeout(timeout or UPSTREAM_TIMEOUT, connect=UPSTREAM_CONNECT_TIMEOUT)
+    async with client.stream("POST", url, json=payload, headers=headers, timeout=request_timeout,
+                             extensions={"trace": pool.tracer(url)}) as response:
+        pool.record_version(url, response)
+        if response.status_code != 200:
+            body = await response.aread()
+            raise RuntimeError(f"Upstream stream returned status {response.status_code}: {body[:200]!r}")
+        async for line in response.aiter_lines():
+            if not line.startswith("data:"):
+                continue
+            data = line[5:].strip()
+            if data == "[DONE]":
+                break
+            try:
+                yield json.loads(data)
+            except ValueError:
+                logging.warning(f"Skipping malformed SSE chunk from {url}: {data[:80]}")
@@ -1,6 +1,6 @@
 import React, { useState, useRef, useEffect } from 'react'
 import axios from 'axios'
-import { API_BASE_URL } from './config'
+import { API_BASE_URL, resolveImageUrl } from './config'
 import './App.css'
 import ChatMessage from './components/ChatMessage'
 import ImageGallery from './components/ImageGallery'
@@ -43,7 +43,8 @@ function App() {
         num_images: mode === 'image' ? 2 : 0,  // Generate 2 images in image mode, 0 in chat mode
       })
 
-      const { images, copy, intent_category, llm_model, image_model } = response.data
+      const { copy, intent_category, llm_model, image_model } = response.data
+      const images = (response.data.images || []).map(resolveImageUrl)
 
       // Update model info display
       setModelInfo({
@@ -91,7 +92,8 @@ function App() {
         num_images: 3,
       })
 
-      const { images, copy, intent_category, llm_model, image_model } = response.data
+      const { copy, intent_category, llm_model, image_model } = response.data
+      const images = (response.data.images || []).map(resolveImageUrl)
 
       // Update model info
       setModelInfo({
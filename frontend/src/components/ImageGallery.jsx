@@ -1,5 +1,6 @@
 import React, { useState } from 'react'
 import './ImageGallery.css'
+import { thumbnailUrl } from '../config'
 
 export default function ImageGallery({ images, onDownload, onRefine }) {
   const [refineText, setRefineText] = useState('')
@@ -22,7 +23,7 @@ export default function ImageGallery({ images, onDownload, onRefine }) {
       <div className="gallery-grid">
         {images.map((img, idx) => (
           <div key={idx} className="gallery-item">
-            <img src={img} alt={`Variation ${idx + 1}`} />
+            <img src={thumbnailUrl(img, 512)} loading="lazy" alt={`Variation ${idx + 1}`} />
             <div className="gallery-controls">
               <button
                 className="gallery-btn download"
@@ -9,12 +9,23 @@ export const API_BASE_URL = isDevelopment
   ? 'http://localhost:8000'
   : import.meta.env.VITE_API_BASE_URL || 'https://web-production-d4489.up.railway.app';
 
+// Generated images come back as backend paths like /images/<id>
+export const resolveImageUrl = (url) =>
+  url && url.startsWith('/') ? `${API_BASE_URL}${url}` : url
+
+// Backend-stored images can be fetched as a resized AVIF/WebP/JPEG thumbnail
+export const thumbnailUrl = (url, width) =>
+  url && url.includes('/images/') && !url.startsWith('data:') ? `${url}?w=${width}` : url
+
 export const API_ENDPOINTS = {
   chat: `${API_BASE_URL}/chat`,
+  chatStream: `${API_BASE_URL}/chat/stream`,
   session: `${API_BASE_URL}/session`,
 };
 
 export default {
   API_BASE_URL,
   API_ENDPOINTS,
+  resolveImageUrl,
+  thumbnailUrl,
 };